@@ -3,6 +3,7 @@ import sys
 from flask import current_app
 from collections import Iterable
 import math
+from itertools import chain, repeat
 
 EPSILON = sys.float_info.epsilon  # smallest possible number
 
@@ -17,7 +18,7 @@ class Distribution(object):
     def make_distribution(self, numbers):
         # Normalize a non-negative discrete distribution onto the
         # range [0-1], ensuring no zero value.
-        arr = np.array(list(numbers))
+        arr = np.array(numbers if isinstance(numbers, np.ndarray) else list(numbers))
         minimum = np.amin(arr)
         if minimum < 0:
             # shift to zero:
@@ -66,9 +67,7 @@ def kl_distance(p, q):
 
 def js_divergence(p, q):
     p, q = ensure_distributions(p, q)
-    M = ensure_distributions([(p.dist[i] + q.dist[i]) / 2 for i in range(len(p.dist))])[
-        0
-    ]
+    M = ensure_distribution((p.dist + q.dist) / 2)
     return kl_divergence(p, M) / 2 + kl_divergence(q, M) / 2
 
 
@@ -90,11 +89,37 @@ def cross_entropy(p, q):
 # DICTIONARY COMPARISON METHODS
 
 
+class AlignedVectors(object):
+    """
+    Dicts aligned on the same keys, without modifying them:
+    keys, and the values of each dict as a numpy array in the order of keys.
+    Metrics are computed on the arrays, dicts are made only for results (to_dict).
+    """
+
+    def __init__(self, dicts, keys=None, default_value=0.0):
+        """
+        keys: by default the union of keys of dicts, in order of appearance
+        default_value: value of keys missing from a dict, None: missing keys raise KeyError
+        """
+        if keys is None:
+            keys = list(dict.fromkeys(chain.from_iterable(dicts)))
+        self.keys = keys
+        self.vectors = [self.vector(d, keys, default_value) for d in dicts]
+
+    @staticmethod
+    def vector(data, keys, default_value):
+        if default_value is None:
+            return np.array(list(map(data.__getitem__, keys)))
+        return np.array(list(map(data.get, keys, repeat(default_value))))
+
+    def to_dict(self, values):
+        # python numbers, as computed with dicts
+        return dict(zip(self.keys, values.tolist()))
+
+
 def dicts_to_comparable_dist(dict1, dict2):
     # assume dicts are aligned
-    p = [dict1[k] for k in dict1]
-    q = [dict2[k] for k in dict1]  # ensure order
-    return p, q
+    return AlignedVectors([dict1, dict2], keys=list(dict1), default_value=None).vectors
 
 
 def dict_normalized_kl_divergence(dict1, dict2):
@@ -114,8 +139,8 @@ def dict_js_divergence(dict1, dict2):
 
 def align_dicts_from_to(from_dict, to_dict, default_value=0.0):
     # insert missed values, so that all keys from_dict have values in to_dict
-    for k in from_dict.keys():
-        if k not in to_dict.keys():
+    for k in from_dict:
+        if k not in to_dict:
             to_dict[k] = default_value
 
 
@@ -124,28 +149,46 @@ def align_dicts(dict1, dict2, default_value=0.0):
     align_dicts_from_to(dict2, dict1, default_value)
 
 
+def vector_abs_diff(p, q):
+    return np.abs(p - q)
+
+
+def vector_frequency_ratio(p, q):
+    if np.any(q == 0):
+        raise ZeroDivisionError("float division by zero")
+    return p.astype(np.float64) / q
+
+
 def abs_diff(dict1, dict2):
-    return {k: abs(dict1[k] - dict2[k]) for k in dict1.keys()}
+    aligned = AlignedVectors([dict1, dict2], keys=list(dict1), default_value=None)
+    return aligned.to_dict(vector_abs_diff(*aligned.vectors))
 
 
 def frequency_ratio(dict1, dict2):
     # align_dicts(dict1, dict2, EPSILON)  # seems that alignment is always done outside this function with some special precaution
-    return {k: float(dict1[k]) / dict2[k] for k in dict1.keys()}
+    aligned = AlignedVectors([dict1, dict2], keys=list(dict1), default_value=None)
+    return aligned.to_dict(vector_frequency_ratio(*aligned.vectors))
 
 
 def weighted_frequency_ratio(dict1, dict2, weights=None, weight_func=np.log10):
-    # TODO: slowish, check what's going on
-    # maybe switch to np arrays, pandas, whatever
     # frequency ratio where more weight given to some cases
     # default weight is a log10 of denominator, the bigger denominator (e.g. corpus frequency) the more reliable considered result
     # maybe better to replace all hacks with statistical significance
     if not weights:
         weights = dict2
-    fr = frequency_ratio(dict1, dict2)
+    aligned = AlignedVectors(
+        [dict1, dict2, weights], keys=list(dict1), default_value=None
+    )
+    p, q, w = aligned.vectors
+    fr = vector_frequency_ratio(p, q)
+    if isinstance(weight_func, np.ufunc):
+        weight = weight_func(w)
+    else:
+        weight = np.array([weight_func(x) for x in w.tolist()])
     # wfr = (fr - 1) * weight + 1
     # fr = 1 is a neutral value, thus (fr - 1) for that cases would be zero
     # and not magnified by weighting
-    return {k: ((fr[k] - 1) * weight_func(weights[k]) + 1) for k in dict1.keys()}
+    return aligned.to_dict((fr - 1) * weight + 1)
 
 
 def find_large_numbers(data, coefficient=2):
@@ -167,6 +210,14 @@ def find_large_numbers_from_lists(lists, coefficient=2):
 
 
 # INTERESTINGNESS
+NUMBER_TYPES = {float, int}
+
+
+def numeric(values):
+    """all values are python floats or ints (not bool or numpy numbers)"""
+    return set(map(type, values)) <= NUMBER_TYPES
+
+
 def recoursive_max(data):
     if not data:
         return 0.0
@@ -175,6 +226,10 @@ def recoursive_max(data):
     elif isinstance(data, float):
         return data
     elif type(data) in [list, tuple, set]:
+        if set(map(type, data)) == {float}:
+            # same as the recursion: zeros count as 0.0
+            maximum = max(data)
+            return 0.0 if maximum == 0 else maximum
         return max([recoursive_max(i) for i in data])
     elif isinstance(data, dict):
         return recoursive_max([recoursive_max(i) for i in data.values()])
@@ -188,11 +243,25 @@ def max_interestingness(interestingness):
     return recoursive_max(interestingness)
 
 
-def recoursive_distribution(data):
+class PendingDistribution:
+    """numerical list (or dict values) waiting for its distribution, see recoursive_distribution"""
+
+    def __init__(self, index, keys=None):
+        self.index = index
+        self.keys = keys
+
+    def resolve(self, distributions):
+        dist = distributions[self.index]
+        if self.keys is None:
+            return dist
+        return {k: v for (k, v) in zip(self.keys, dist)}
+
+
+def collect_distributions(data, segments, pending):
     """
-    Loop through data, converts numerical lists into distributions
+    Copy of data where numerical lists are replaced by PendingDistribution:
+    their numbers are added to segments, and (container, key, pending) to pending
     """
-
     if not data:
         return 0.0
     if isinstance(data, str):
@@ -200,15 +269,62 @@ def recoursive_distribution(data):
     if type(data) in [float, int]:
         return 0 if data == 0 else 1
     if isinstance(data, dict):
-        if all([type(i) in [float, int] for i in data.values()]):
-            return {
-                k: v
-                for (k, v) in zip(
-                    data.keys(), recoursive_distribution(list(data.values()))
-                )
-            }
-        return {k: recoursive_distribution(v) for k, v in data.items()}
+        values = list(data.values())
+        if numeric(values):
+            segments.append(values)
+            return PendingDistribution(len(segments) - 1, list(data.keys()))
+        result = {}
+        for k, v in data.items():
+            result[k] = collect_distributions(v, segments, pending)
+            if isinstance(result[k], PendingDistribution):
+                pending.append((result, k, result[k]))
+        return result
     if type(data) in [list, tuple, set]:
-        if all([type(i) in [float, int] for i in data]):
-            return Distribution(data).dist
-        return [recoursive_distribution(i) for i in data]
+        if numeric(data):
+            segments.append(list(data))
+            return PendingDistribution(len(segments) - 1)
+        result = []
+        for i in data:
+            result.append(collect_distributions(i, segments, pending))
+            if isinstance(result[-1], PendingDistribution):
+                pending.append((result, len(result) - 1, result[-1]))
+        return result
+
+
+def batch_distributions(segments):
+    """
+    Distribution(segment).dist of all segments (non-empty lists of numbers),
+    computed together on one array.
+    Sums are segment-wise (np.add.reduceat) instead of np.sum of each list: the order of
+    the additions differs, values agree with Distribution within a relative 1e-12.
+    """
+    if not segments:
+        return []
+    lengths = np.array([len(segment) for segment in segments])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    flat = np.array(
+        [number for segment in segments for number in segment], dtype=np.float64
+    )
+
+    minimum = np.minimum.reduceat(flat, starts)
+    # shift to zero
+    shifted = flat - np.repeat(np.where(minimum < 0, minimum, 0.0), lengths)
+    sums = np.add.reduceat(shifted, starts)
+    dist = (shifted + EPSILON) / np.repeat(sums + lengths * EPSILON, lengths)
+    return np.split(dist, starts[1:])
+
+
+def recoursive_distribution(data):
+    """
+    Loop through data, converts numerical lists into distributions.
+    Numbers of all lists are collected first and normalized together, see batch_distributions
+    """
+    segments = []
+    pending = []
+    result = collect_distributions(data, segments, pending)
+    distributions = batch_distributions(segments)
+    for container, key, distribution in pending:
+        container[key] = distribution.resolve(distributions)
+    if isinstance(result, PendingDistribution):
+        return result.resolve(distributions)
+    return result
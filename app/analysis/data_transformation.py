@@ -314,12 +314,11 @@ class Comparison(AnalysisUtility):
 
     @staticmethod
     def compare_dicts(dicts):
-        assessment.align_dicts(dicts[0], dicts[1], default_value=assessment.EPSILON)
+        aligned = assessment.AlignedVectors(dicts, default_value=assessment.EPSILON)
+        p, q = aligned.vectors
         return {
-            "jensen_shannon_divergence": assessment.dict_js_divergence(
-                dicts[0], dicts[1]
-            ),
-            "abs_diff": assessment.abs_diff(dicts[0], dicts[1]),
+            "jensen_shannon_divergence": assessment.js_divergence(p, q),
+            "abs_diff": aligned.to_dict(assessment.vector_abs_diff(p, q)),
         }
 
     @staticmethod
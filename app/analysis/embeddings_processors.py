@@ -3,8 +3,8 @@ from app.analysis.processors import AnalysisUtility
 from app.analysis import assessment
 from flask import current_app
 import asyncio
-import requests
 from config import Config
+from app.utils.topic_model_utils import EmbeddingsClient
 from collections import Counter
 from werkzeug.exceptions import NotFound
 from string import punctuation
@@ -39,16 +39,6 @@ class ExpandQuery(AnalysisUtility):
             ],
         }  # not sure how many this API could handle...
 
-    async def query_similar_words(self, query):
-        uri = Config.TOPIC_MODEL_URI + "/word-embeddings/query"
-        current_app.logger.debug("embeddings_request: %s" % query)
-        response = requests.post(uri, json=query)
-        current_app.logger.debug("response: %s" % response)
-        if response.status_code == 200:
-            return response.json()["similar_words"]
-        else:
-            return []
-
     @staticmethod
     def word_makes_sense(word):
         return len(word) > 2 and not any(
@@ -72,9 +62,8 @@ class ExpandQuery(AnalysisUtility):
             for l in langs
         ]
 
-        results = await asyncio.gather(
-            *[self.query_similar_words(query) for query in queries]
-        )
+        async with EmbeddingsClient() as client:
+            results = await client.similar_words(queries)
 
         res = []
         for r in results:
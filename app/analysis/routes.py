@@ -70,6 +70,12 @@ class AnalysisTaskList(Resource):
         location="json",
         help="Set to true to redo the analysis even if an older result exists",
     )
+    post_parser.add_argument(
+        "deadline",
+        type=int,
+        location="json",
+        help="Maximal execution time in seconds, after which the task is stopped",
+    )
 
     @login_required
     @ns.expect(post_parser)
@@ -124,6 +130,29 @@ class AnalysisTask(Resource):
             )
         return task.dict(style="result")
 
+    @login_required
+    @ns.expect(AuthParser())
+    @ns.response(202, "Cancellation has been requested, the task is stopping.")
+    @ns.response(409, "The task is used by other running tasks or runs.")
+    def delete(self, task_uuid):
+        """
+        Cancel a running analysis task
+        """
+        try:
+            task_uuid = UUID(task_uuid)
+        except ValueError:
+            raise NotFound
+        # only tasks of the user can be cancelled
+        task = Task.query.filter_by(uuid=task_uuid, user_id=current_user.id).first()
+        if task is None:
+            raise NotFound(
+                "Task {} not found for user {}".format(task_uuid, current_user.username)
+            )
+        task = controller.cancel_task(task)
+        if task.task_status in ["running", "created"]:
+            return task.dict(), 202
+        return task.dict()
+
 
 @ns.route("/processors/")
 class UtilityList(Resource):
@@ -5,7 +5,6 @@
 # version = 0.0.1
 from flask import current_app
 import spacy, os
-from sklearn.metrics.pairwise import cosine_similarity
 import fasttext
 import os.path
 
@@ -13,6 +12,7 @@ import os.path
 import gzip, shutil
 import urllib.request
 import numpy as np
+from config import Config
 
 
 def load_document(path):
@@ -45,50 +45,87 @@ def download_decompress(filename, language):
     os.remove(filename + ".gz")
 
 
+# components not needed to split texts into sentences
+SENTENCE_DISABLED = ["tagger", "ner"]
+
+
+def sentence_pipeline(nlp, language):
+    """
+    Adds the sentencizer to models without a parser. Models shared between threads
+    (ModelRegistry) get it when they are loaded, they are not changed here afterwards.
+    """
+    if language != "en" and language != "fr" and "sentencizer" not in nlp.pipe_names:
+        nlp.add_pipe(nlp.create_pipe("sentencizer"))
+    return nlp
+
+
+def pipe(nlp, texts, disable=SENTENCE_DISABLED):
+    """nlp.pipe with batching (Config.SUMMARIZATION_SPACY_BATCH_SIZE)"""
+    return nlp.pipe(
+        texts, batch_size=Config.SUMMARIZATION_SPACY_BATCH_SIZE, disable=disable
+    )
+
+
+def tokenize(nlp, texts):
+    """
+    Only the tokenizer: stop words, punctuation, numbers and lowercase forms
+    are lexical attributes, they do not need the pipeline
+    """
+    return nlp.tokenizer.pipe(texts, batch_size=Config.SUMMARIZATION_SPACY_BATCH_SIZE)
+
+
 def tokenizer_sentences(text, nlp, language):
-    if language != "en" and language != "fr":
-        try:
-            nlp.add_pipe(
-                nlp.create_pipe("sentencizer")
-            )  # 'sentencizer' already exists in pipeline
-        except ValueError:
-            pass
-    doc = nlp(text)
-    doc = [s.text for s in doc.sents]
-    return doc
+    return process_document([text], nlp, language)[0]
 
 
 def process_document(document, nlp, language):
-    texts = []
-    for text in document:
-        text = tokenizer_sentences(text, nlp, language)
-        text = [s.strip() for s in text]
-        texts.append(text)
-    return texts
+    nlp = sentence_pipeline(nlp, language)
+    return [[s.text.strip() for s in doc.sents] for doc in pipe(nlp, document)]
+
+
+def clean_tokens(doc):
+    # Remove: stopwords, punctuations, numbers
+    return [
+        token.lower_
+        for token in doc
+        if (not token.is_stop) and (not token.is_punct) and (not token.like_num)
+    ]
 
 
 def clean_document(document, nlp):
-    clean_document = []
-    for sentence in document:
-        clean_sentence = []
-        for token in nlp(sentence):
-            # Remove: stopwords, punctuations, numbers
-            if (not token.is_stop) and (not token.is_punct) and (not token.like_num):
-                clean_sentence.append(token.lower_)
-        clean_document.append(" ".join(clean_sentence))
-    return clean_document
-
-
-def embeddings_representation(document, type_embeddings, nlp, language):
-    if type_embeddings == "fasttext":
-        if not os.path.exists("./data/cc." + language + ".300.bin"):
-            download_decompress("./data/cc." + language + ".300.bin", language)
-        model = fasttext.load_model("./data/cc." + language + ".300.bin")
+    return [" ".join(clean_tokens(doc)) for doc in tokenize(nlp, document)]
+
+
+def tokenized_sentences(texts, nlp, language):
+    """
+    Sentences of each text in a single streaming pass, tokens separated by spaces.
+    Same results as process_document followed by tokenization of each sentence.
+    """
+    nlp = sentence_pipeline(nlp, language)
+    return [
+        [
+            " ".join([w.text for w in sentence])
+            for sentence in tokenize(nlp, [s.text.strip() for s in doc.sents])
+        ]
+        for doc in pipe(nlp, texts)
+    ]
+
+
+def fasttext_path(language):
+    return "./data/cc." + language + ".300.bin"
+
+
+def embeddings_representation(document, type_embeddings, nlp, language, model=None):
+    # model: word vectors from model_registry, loaded here if not given
+    if model is None and type_embeddings == "fasttext":
+        if not os.path.exists(fasttext_path(language)):
+            download_decompress(fasttext_path(language), language)
+        model = fasttext.load_model(fasttext_path(language))
     # TODO: newseye
     document_embeddings = []
-    for sentence in document:
+    for doc in tokenize(nlp, document):
         sentence_embedding = []
-        for token in nlp(sentence):
+        for token in doc:
             token = token.text
             if token in model:
                 sentence_embedding.append(model[token])
@@ -96,6 +133,22 @@ def embeddings_representation(document, type_embeddings, nlp, language):
     return document_embeddings
 
 
+def article_embeddings(texts, nlp, language, model, type_representation):
+    """
+    Sentences of each text and their embeddings (representation of the word vectors
+    of their clean words), language is the spaCy model name, model the word vectors
+    """
+    sentences = tokenized_sentences(texts, nlp, language)
+    document = [s for text in sentences for s in text]
+    embeddings = embeddings_representation(
+        clean_document(document, nlp), "fasttext", nlp=nlp, language=None, model=model
+    )
+    embeddings = iter(
+        [sentence_representation(e, type=type_representation) for e in embeddings]
+    )
+    return [(text, [next(embeddings) for _ in text]) for text in sentences]
+
+
 def sentence_representation(sentence, type):
     if type == "mean":
         return sum(sentence) / (len(sentence) + 0.001)
@@ -103,15 +156,22 @@ def sentence_representation(sentence, type):
         return sum(sentence)
 
 
-def similar_to_summary(sentences, candidate, summary, similarity_threshold):
-    for s in summary:
-        similarity = cosine_similarity(
-            sentences[candidate].reshape(1, len(sentences[candidate])),
-            sentences[s].reshape(1, len(sentences[s])),
-        )[0, 0]
-        if similarity > similarity_threshold:
-            return True
-    return False
+def normalized_embeddings(sentences):
+    """
+    Unit-length sentence embeddings, one per row (zero vectors stay zero, as in sklearn
+    cosine_similarity), and the row of each sentence, None if it has no embedding vector
+    """
+    rows = [None] * len(sentences)
+    valid = [i for i, s in enumerate(sentences) if isinstance(s, np.ndarray)]
+    for row, i in enumerate(valid):
+        rows[i] = row
+    if not valid:
+        return np.zeros([0, 0]), rows
+    vectors = np.array([sentences[i] for i in valid], dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors, rows
 
 
 def summary_generation(
@@ -124,20 +184,28 @@ def summary_generation(
 ):
     summary = []
     scores = []
+    lengths = [len(s.split()) for s in document]
+    if type_summary == "ai":
+        vectors, rows = normalized_embeddings(sentences)
+        # embeddings of the summary sentences are the first len(summary) rows
+        summary_vectors = np.empty_like(vectors)
     for score, indice in ranked_sentences:
         if type_summary == "ai":
-            if isinstance(sentences[indice], np.ndarray) and summary_length >= len(
-                document[indice].split()
-            ):
-                if not similar_to_summary(
-                    sentences, indice, summary, similarity_threshold
+            if rows[indice] is not None and summary_length >= lengths[indice]:
+                vector = vectors[rows[indice]]
+                # cosine similarities to all summary sentences at once
+                if not (
+                    summary
+                    and summary_vectors[: len(summary)].dot(vector).max()
+                    > similarity_threshold
                 ):
+                    summary_vectors[len(summary)] = vector
                     summary.append(indice)
                     scores.append(score)
-                    summary_length -= len(document[indice].split())
+                    summary_length -= lengths[indice]
         else:
-            if summary_length >= len(document[indice].split()):
+            if summary_length >= lengths[indice]:
                 summary.append(indice)
                 scores.append(score)
-                summary_length -= len(document[indice].split())
+                summary_length -= lengths[indice]
     return [document[i] for i in summary], scores
@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+import numpy as np
+from config import Config
+
+
+class SentenceEmbeddingStore:
+    """
+    Sentences and sentence embeddings of articles, stored in Config.CACHE_DIR
+    and shared between threads and worker processes.
+    Keys are (article id, language, representation type): article texts do not change.
+    Embeddings are float32 matrices in .npy files (one row per sentence), memory-mapped when read;
+    the SQLite index keeps sentences, which of them have an embedding and file sizes.
+    Least recently used articles are evicted when files take more than max_size bytes.
+    """
+
+    def __init__(self, max_size, name="sentence_embeddings"):
+        self.directory = os.path.join(Config.CACHE_DIR, name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, "index.sqlite")
+        self.max_size = max_size
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, file TEXT, sentences TEXT, size INTEGER, used REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)"
+            )
+
+    def connect(self):
+        # a connection per call: sqlite3 connections cannot be shared between threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(key):
+        return json.dumps(key)
+
+    def get_many(self, keys):
+        """
+        returns key -> (sentences, embeddings) for keys found in the store,
+        embeddings are numpy vectors, or 0.0 for sentences without embedding
+        """
+        found = {}
+        if not keys:
+            return found
+        db_keys = {self.make_key(key): key for key in keys}
+        db_key_list = list(db_keys)
+        rows = []
+        with self.connect() as connection:
+            # SQLite limits the number of variables in a query
+            for i in range(0, len(db_key_list), 500):
+                chunk = db_key_list[i : i + 500]
+                rows.extend(
+                    connection.execute(
+                        "SELECT key, file, sentences FROM embeddings WHERE key IN (%s)"
+                        % ",".join("?" * len(chunk)),
+                        chunk,
+                    ).fetchall()
+                )
+            connection.executemany(
+                "UPDATE embeddings SET used = ? WHERE key = ?",
+                [(time.time(), db_key) for db_key, _, _ in rows],
+            )
+
+        for db_key, filename, sentences in rows:
+            try:
+                matrix = np.load(os.path.join(self.directory, filename), mmap_mode="r")
+            except (OSError, ValueError):
+                # evicted by another process in the meantime
+                continue
+            # [sentence, has an embedding] pairs
+            sentences = json.loads(sentences)
+            found[db_keys[db_key]] = (
+                [sentence for sentence, _ in sentences],
+                [
+                    np.array(vector) if valid else 0.0
+                    for vector, (_, valid) in zip(matrix, sentences)
+                ],
+            )
+        return found
+
+    def set_many(self, items):
+        """items: list of (key, (sentences, embeddings)) pairs"""
+        if not items:
+            return
+        records = []
+        for key, (sentences, embeddings) in items:
+            valid = [isinstance(e, np.ndarray) for e in embeddings]
+            dimension = max([e.shape[0] for e, v in zip(embeddings, valid) if v] or [0])
+            matrix = np.zeros([len(embeddings), dimension], dtype=np.float32)
+            for i, e in enumerate(embeddings):
+                if valid[i]:
+                    matrix[i] = e
+            filename = uuid.uuid4().hex + ".npy"
+            np.save(os.path.join(self.directory, filename), matrix)
+            records.append(
+                (
+                    self.make_key(key),
+                    filename,
+                    json.dumps(list(zip(sentences, valid))),
+                    matrix.nbytes,
+                    time.time(),
+                )
+            )
+
+        with self.connect() as connection:
+            # files of replaced entries
+            replaced = []
+            for i in range(0, len(records), 500):
+                chunk = [r[0] for r in records[i : i + 500]]
+                replaced.extend(
+                    f
+                    for (f,) in connection.execute(
+                        "SELECT file FROM embeddings WHERE key IN (%s)"
+                        % ",".join("?" * len(chunk)),
+                        chunk,
+                    ).fetchall()
+                )
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, file, sentences, size, used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                records,
+            )
+            replaced += self.evict(connection)
+        self.remove(replaced)
+
+    def evict(self, connection):
+        """deletes least recently used entries above max_size, returns their files"""
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+        evicted = []
+        if total <= self.max_size:
+            return evicted
+        for key, filename, size in connection.execute(
+            "SELECT key, file, size FROM embeddings ORDER BY used"
+        ).fetchall():
+            if total <= self.max_size:
+                break
+            connection.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            evicted.append(filename)
+            total -= size
+        return evicted
+
+    def remove(self, filenames):
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+# created on first use, so the cache directory is not created on import
+sentence_embedding_store = None
+
+
+def get_sentence_embedding_store():
+    global sentence_embedding_store
+    if sentence_embedding_store is None:
+        sentence_embedding_store = SentenceEmbeddingStore(
+            Config.SUMMARIZATION_EMBEDDING_CACHE_SIZE
+        )
+    return sentence_embedding_store
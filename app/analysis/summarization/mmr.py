@@ -1,68 +1,88 @@
 import app.analysis.summarization.data_util as data_util
 from math import *
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from flask import current_app
 
 
-def mmr(sentences_emb, summary_indices, document_indices, lambd):
-    weights = 0.0
-    for d in document_indices:
-        for s in summary_indices:
-            if not np.array_equal(sentences_emb[d], sentences_emb[s]):
-                weights += cosine_similarity(
-                    sentences_emb[d].reshape(1, len(sentences_emb[d])),
-                    sentences_emb[s].reshape(1, len(sentences_emb[s])),
-                )[0, 0]
+def similarity_matrix(sentences_emb):
+    """
+    Cosine similarities used by MMR: 0 for identical embeddings (including the diagonal)
+    and for sentences without an embedding vector
+    """
+    n = len(sentences_emb)
+    similarities = np.zeros([n, n])
+    valid = [i for i, e in enumerate(sentences_emb) if isinstance(e, np.ndarray)]
+    if not valid:
+        return similarities
+    vectors = np.array([sentences_emb[i] for i in valid], dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    sub = (vectors / norms).dot((vectors / norms).T)
 
-    penalty = 0.0
-    for s1 in summary_indices:
-        for s2 in summary_indices:
-            if not np.array_equal(sentences_emb[s1], sentences_emb[s2]):
-                penalty += cosine_similarity(
-                    sentences_emb[s1].reshape(1, len(sentences_emb[s1])),
-                    sentences_emb[s2].reshape(1, len(sentences_emb[s2])),
-                )[0, 0]
+    # identical embeddings, grouped by their bytes
+    groups = {}
+    for k, i in enumerate(valid):
+        groups.setdefault(sentences_emb[i].tobytes(), []).append(k)
+    for group in groups.values():
+        sub[np.ix_(group, group)] = 0.0
 
+    similarities[np.ix_(valid, valid)] = sub
+    return similarities
+
+
+def mmr(similarities, summary_indices, lambd):
+    """
+    MMR score of a summary:
+    lambd * (similarity of the summary to the whole document) - (1 - lambd) * (redundancy inside the summary)
+    """
+    summary_indices = list(summary_indices)
+    weights = similarities[:, summary_indices].sum()
+    penalty = similarities[np.ix_(summary_indices, summary_indices)].sum()
     return lambd * weights - (1 - lambd) * penalty
 
 
 def maximal_marginal_relevance(sentences, sentences_emb, lambd=2, r=0.6, budget=400):
+    """
+    Greedy MMR (Lin and Bilmes): similarities are computed once,
+    marginal gains mmr(G + [l]) - mmr(G) are updated when a sentence is added to the summary:
+    gain(l) = lambd * relevance(l) - (1 - lambd) * 2 * similarity(l, G)
+    """
     current_app.logger.info("Maximal Marginal Relevance ...")
+    similarities = similarity_matrix(sentences_emb)
+    lengths = np.array([len(s.split()) for s in sentences])
     # All sentences together
     document = [i for i in range(len(sentences))]
+
+    relevance = similarities.sum(axis=0)
+    # similarity of each sentence to the current summary
+    redundancy = np.zeros(len(sentences))
+    length_penalty = lengths.astype(float) ** r
+
     G = []
-    U = document[:]
+    summary_length = 0
+    U = np.ones(len(sentences), dtype=bool)
     # Best summary
-    while len(U) > 0:
-        sentence, value, valuer = "", -1000000.0, -1000000.0
-        for l in U:
-            v = mmr(sentences_emb, G + [l], document, lambd) - mmr(
-                sentences_emb, G, document, lambd
-            )
-            vr = v / (len(sentences[l].split()) ** r)
-            if vr > valuer:
-                value = v
-                valuer = vr
-                sentence = l
-        if (
-            sum([len(sentences[i].split()) for i in G])
-            + len(sentences[sentence].split())
-            <= budget
-            and value > 0
-        ):
-            G = G + [sentence]
-        U.remove(sentence)
+    while U.any():
+        gains = lambd * relevance - (1 - lambd) * 2 * redundancy
+        ratios = np.where(U, gains / length_penalty, -np.inf)
+        # first index with the highest ratio, as in a sequential scan
+        sentence = int(np.argmax(ratios))
+        if summary_length + lengths[sentence] <= budget and gains[sentence] > 0:
+            G.append(sentence)
+            summary_length += lengths[sentence]
+            redundancy += similarities[:, sentence]
+        U[sentence] = False
+
     # Best singleton
     singleton, values = 0, -9999999999
     for s in document:
-        if len(sentences[s].split()) <= budget:
-            v = mmr(sentences_emb, [s], document, lambd)
+        if lengths[s] <= budget:
+            v = lambd * relevance[s]
             if v > values:
                 values = v
                 singleton = s
 
-    if mmr(sentences_emb, G, document, lambd) > values:
+    if mmr(similarities, G, lambd) > values:
         return [(1.0 / (pos + 1), indice) for pos, indice in enumerate(G)] + [
             (1.0 / (10 * len(G)), indice)
             for pos, indice in enumerate(document)
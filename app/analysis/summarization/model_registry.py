@@ -0,0 +1,177 @@
+import json
+import os
+from collections import OrderedDict
+from threading import Lock, Thread
+import numpy as np
+import spacy
+import fasttext
+from flask import current_app
+from app.analysis.summarization.data_util import (
+    download_decompress,
+    fasttext_path,
+    sentence_pipeline,
+)
+from config import Config
+
+
+class WordVectors:
+    """
+    Word -> vector lookup with a fast `in`
+    (FastText.__contains__ scans the whole word list)
+    """
+
+    def __init__(self, vocabulary, vectors):
+        # word -> row in vectors
+        self.vocabulary = vocabulary
+        self.vectors = vectors
+
+    def __contains__(self, word):
+        return word in self.vocabulary
+
+    def __getitem__(self, word):
+        # copy: rows of a memory-mapped matrix should not outlive the file
+        return np.array(self.vectors[self.vocabulary[word]])
+
+
+class FastTextVectors(WordVectors):
+    """in-vocabulary words of a fastText model, vectors are computed by the model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.vocabulary = set(model.words)
+
+    def __getitem__(self, word):
+        return self.model.get_word_vector(word)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of models used by Summarization: spaCy pipelines and word embeddings.
+    Models are loaded on first use and kept between tasks. When the estimated memory of
+    loaded models exceeds the budget, the least recently used models are dropped.
+    Word embeddings exported with export_embeddings are memory-mapped instead of loaded.
+    """
+
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.lock = Lock()
+        # (kind, language) -> (model, estimated size in bytes), least recently used first
+        self.models = OrderedDict()
+        # (kind, language) -> lock, so the same model is not loaded twice in parallel
+        self.loading = {}
+
+    def get(self, kind, language, loader):
+        key = (kind, language)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            key_lock = self.loading.setdefault(key, Lock())
+
+        with key_lock:
+            with self.lock:
+                if key in self.models:
+                    self.models.move_to_end(key)
+                    return self.models[key][0]
+
+            current_app.logger.info("LOADING %s MODEL FOR %s" % (kind, language))
+            model, size = loader(language)
+
+            with self.lock:
+                self.models[key] = (model, size)
+                self.evict()
+            return model
+
+    def evict(self):
+        total = sum(size for _, size in self.models.values())
+        # the model just added is never evicted
+        while total > self.memory_budget and len(self.models) > 1:
+            key, (_, size) = self.models.popitem(last=False)
+            total -= size
+            current_app.logger.info("UNLOADING %s MODEL FOR %s" % key)
+
+    def spacy(self, language):
+        return self.get("spacy", language, load_spacy)
+
+    def embeddings(self, language):
+        return self.get("embeddings", language, load_embeddings)
+
+    def warm_up(self, languages):
+        for language in languages:
+            self.embeddings(language)
+            self.spacy(language if language in ["en", "fr"] else "xx_ent_wiki_sm")
+
+
+def load_spacy(language):
+    # before the model is shared: the pipeline is not changed while threads use it
+    nlp = sentence_pipeline(spacy.load(language), language)
+    # size on disk is a rough estimate of the size in memory
+    size = sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(str(nlp.path))
+        for f in files
+    )
+    return nlp, size
+
+
+def embeddings_path(language):
+    return os.path.join(Config.CACHE_DIR, "embeddings", language)
+
+
+def load_embeddings(language):
+    path = embeddings_path(language)
+    if os.path.exists(os.path.join(path, "vectors.npy")):
+        with open(os.path.join(path, "vocabulary.json")) as f:
+            words = json.load(f)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        # vectors are in the page cache, shared between processes; only the vocabulary is ours
+        size = os.path.getsize(os.path.join(path, "vocabulary.json")) * 4
+        return WordVectors({w: i for i, w in enumerate(words)}, vectors), size
+
+    filename = fasttext_path(language)
+    if not os.path.exists(filename):
+        download_decompress(filename, language)
+    model = fasttext.load_model(filename)
+    return FastTextVectors(model), os.path.getsize(filename)
+
+
+def export_embeddings(language):
+    """
+    Writes vectors of all in-vocabulary words of the fastText model into a .npy matrix,
+    which is memory-mapped by load_embeddings afterwards
+    """
+    model = fasttext.load_model(fasttext_path(language))
+    words = model.words
+    path = embeddings_path(language)
+    os.makedirs(path, exist_ok=True)
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, "vectors.tmp.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(len(words), model.get_dimension()),
+    )
+    for i, word in enumerate(words):
+        vectors[i] = model.get_word_vector(word)
+    vectors.flush()
+    del vectors
+    with open(os.path.join(path, "vocabulary.json"), "w") as f:
+        json.dump(words, f)
+    # the matrix appears only when it is complete
+    os.replace(
+        os.path.join(path, "vectors.tmp.npy"), os.path.join(path, "vectors.npy")
+    )
+    return len(words)
+
+
+model_registry = ModelRegistry(Config.SUMMARIZATION_MODEL_MEMORY)
+
+
+def warm_up_models(app):
+    """loads models for Config.SUMMARIZATION_WARM_UP languages in the background"""
+
+    def warm_up():
+        with app.app_context():
+            model_registry.warm_up(Config.SUMMARIZATION_WARM_UP)
+
+    if Config.SUMMARIZATION_WARM_UP:
+        Thread(target=warm_up, daemon=True).start()
@@ -1,32 +1,97 @@
 import numpy as np
-import networkx as nx
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 from flask import current_app
 
 
-def textrank(sentences):
+def similarity_matrix(sentences):
+    """
+    Cosine similarities between all sentence embeddings, 0 on the diagonal.
+    Sentences without an embedding (not a vector, e.g. no known words) are similar to nothing.
+    """
+    n = len(sentences)
+    sim_mat = np.zeros([n, n])
+    valid = [i for i, s in enumerate(sentences) if isinstance(s, np.ndarray)]
+    if len(valid) < n:
+        current_app.logger.debug(
+            "Unexpected sentence embeddings: %s" % (n - len(valid))
+        )
+    if valid:
+        vectors = np.array([sentences[i] for i in valid], dtype=np.float64)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # zero vectors stay zero, as in sklearn cosine_similarity
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        sim_mat[np.ix_(valid, valid)] = vectors.dot(vectors.T)
+        np.fill_diagonal(sim_mat, 0.0)
+    return sim_mat
+
+
+def top_k_graph(sim_mat, k):
+    """
+    Sparse graph keeping for each sentence only its k most similar sentences
+    (an edge is kept if it is in the top k of either end, so the graph stays undirected)
+    """
+    n = sim_mat.shape[0]
+    if k >= n - 1:
+        return sparse.csr_matrix(sim_mat)
+    columns = np.argpartition(-sim_mat, k - 1, axis=1)[:, :k]
+    rows = np.repeat(np.arange(n), k)
+    mask = sparse.csr_matrix(
+        (np.ones(n * k, dtype=bool), (rows, columns.ravel())), shape=(n, n)
+    )
+    mask = mask + mask.T
+    return sparse.csr_matrix(mask.multiply(sim_mat))
+
+
+def pagerank(weights, alpha=0.85, max_iter=100, tol=1.0e-6):
+    """
+    PageRank by power iteration over a weighted adjacency matrix (numpy or scipy.sparse),
+    computes the same as networkx.pagerank with default parameters:
+    rows are normalized by their sums, nodes whose rows sum to 0 are dangling
+    and their score is distributed uniformly.
+    """
+    n = weights.shape[0]
+    if n == 0:
+        return np.zeros(0)
+
+    out_weights = np.asarray(weights.sum(axis=1)).ravel()
+    dangling = out_weights == 0
+    scale = np.zeros(n)
+    scale[~dangling] = 1.0 / out_weights[~dangling]
+    if sparse.issparse(weights):
+        transition = sparse.diags(scale).dot(weights).T.tocsr()
+    else:
+        transition = (weights * scale[:, np.newaxis]).T
+
+    uniform = np.full(n, 1.0 / n)
+    x = uniform
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (transition.dot(x_last) + x_last[dangling].sum() * uniform) + (
+            1.0 - alpha
+        ) * uniform
+        if np.abs(x - x_last).sum() < n * tol:
+            return x
+    raise ValueError("PageRank did not converge in %d iterations" % max_iter)
+
+
+def textrank(sentences, top_k=None):
+    """
+    top_k: if set, only the top_k most similar sentences of each sentence are connected,
+    otherwise the graph is complete (exact TextRank)
+    """
     current_app.logger.info("TextRank method ...")
     current_app.logger.debug("Sentences: %s" % sentences)
     # Similarity matrix
-    sim_mat = np.zeros([len(sentences), len(sentences)])
-    for i in range(len(sentences)):
-        for j in range(len(sentences)):
-            if i != j:
-                try:
-                    sim_mat[i][j] = cosine_similarity(
-                        sentences[i].reshape(1, len(sentences[i])),
-                        sentences[j].reshape(1, len(sentences[j])),
-                    )[0, 0]
-                except AttributeError as e:
-                    current_app.logger.debug("Unexpected sentence embedding: %s" % e)
-                    sim_mat[i][j] = 0.0
+    sim_mat = similarity_matrix(sentences)
+    if top_k:
+        sim_mat = top_k_graph(sim_mat, top_k)
 
     # Pagerank algorithm
-    nx_graph = nx.from_numpy_array(sim_mat)
-    scores = nx.pagerank(nx_graph)
+    scores = pagerank(sim_mat)
     # Sort sentences
     ranked_sentences = sorted(
-        ((scores[i], i) for i, s in enumerate(sentences)), reverse=True
+        ((float(scores[i]), i) for i, s in enumerate(sentences)), reverse=True
     )
     scores_ = [s for (s, i) in ranked_sentences]
     ranked_sentences = [(s / max(scores_), i) for (s, i) in ranked_sentences]
@@ -2,12 +2,13 @@ from app.analysis.processors import AnalysisUtility
 from app.models import Processor
 from flask import current_app
 from collections import defaultdict
+from config import Config
 
 from app.analysis.summarization.textrank import *
 from app.analysis.summarization.mmr import *
 import app.analysis.summarization.data_util as data_util
-
-import spacy
+from app.analysis.summarization.model_registry import model_registry
+from app.analysis.summarization.embedding_store import get_sentence_embedding_store
 
 
 class Summarization(AnalysisUtility):
@@ -83,7 +84,7 @@ class Summarization(AnalysisUtility):
                 .replace("-\n", "")
                 .replace("\n", " ")
             )
-            texts[lang].append(text)
+            texts[lang].append((article["id"], text))
 
         # summarization done only for documents in the same language
         lang = sorted(texts, key=lambda x: len(texts[x]), reverse=True)[0]
@@ -98,41 +99,47 @@ class Summarization(AnalysisUtility):
 
         # current_app.logger.debug("LANGUAGE: %s" %language)
 
-        nlp = spacy.load(language)
-
-        # -------- Preprocessing texts -------- #
-        document = data_util.process_document(
-            document=texts, nlp=nlp, language=language
-        )
-        document = [" ".join([w.text for w in nlp(s)]) for d in document for s in d]
-        document = [
-            s
-            for s in document
-            if len(s.split()) >= self.task.parameters["minimal_sentence_length"]
-        ]  # remove short sentences
-
-        # current_app.logger.debug("DOCUMENT: %s" %document)
-
-        # -------- Clean sentences -------- #
-        clean_document = data_util.clean_document(document, nlp)
-
-        # current_app.logger.debug("CLEAN DOCUMENT %s" %clean_document)
-
-        # -------- Replace text by word embeddings -------- #
-        # embddings type could be a parameter (instead of just fast text)
-        document_embeddings = data_util.embeddings_representation(
-            clean_document, "fasttext", nlp=nlp, language=lang
+        # -------- Sentence embeddings -------- #
+        # stored by article, computed only for articles seen for the first time
+        representation = self.task.parameters["type_sentence_representation"]
+        store = get_sentence_embedding_store()
+        keys = [(article_id, lang, representation) for article_id, _ in texts]
+        articles = store.get_many(keys)
+        missing = [
+            (key, text) for key, (_, text) in zip(keys, texts) if key not in articles
+        ]
+        current_app.logger.debug(
+            "SENTENCE EMBEDDINGS: %d articles, %d stored"
+            % (len(keys), len(keys) - len(missing))
         )
 
-        # current_app.logger.debug("DOCUMENT_EMBEDDINGS I: %s" %document_embeddings)
-
-        # -------- Sentence embeddings -------- #
-        document_embeddings = [
-            data_util.sentence_representation(
-                sentence, type=self.task.parameters["type_sentence_representation"]
+        if missing:
+            # models are loaded once per process
+            # embddings type could be a parameter (instead of just fast text)
+            new = data_util.article_embeddings(
+                [text for _, text in missing],
+                nlp=model_registry.spacy(language),
+                language=language,
+                model=model_registry.embeddings(lang),
+                type_representation=representation,
             )
-            for sentence in document_embeddings
-        ]
+            new = list(zip([key for key, _ in missing], new))
+            store.set_many(new)
+            articles.update(new)
+
+        document = []
+        document_embeddings = []
+        for key in keys:
+            for sentence, embedding in zip(*articles[key]):
+                # remove short sentences
+                if (
+                    len(sentence.split())
+                    >= self.task.parameters["minimal_sentence_length"]
+                ):
+                    document.append(sentence)
+                    document_embeddings.append(embedding)
+
+        # current_app.logger.debug("DOCUMENT: %s" %document)
 
         # current_app.logger.debug("DOCUMENT_EMBEDDINGS II: %s" %document_embeddings)
 
@@ -162,7 +169,7 @@ class Summarization(AnalysisUtility):
         elif self.task.parameters["ts_approach"] == "textrank":
             # -------- TextRank -------- #
             textrank_sentences = textrank(
-                document_embeddings
+                document_embeddings, top_k=Config.SUMMARIZATION_TEXTRANK_TOP_K
             )  # output: [(pagerank_value, sentence_index)]
 
             # current_app.logger.debug("TEXTRANK_SENTENCES: %s" %textrank_sentences)
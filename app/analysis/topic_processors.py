@@ -1,5 +1,4 @@
 import asyncio
-import requests
 import json
 from config import Config
 from app.models import Processor, Task
@@ -8,13 +7,133 @@ from app.analysis import assessment
 from werkzeug.exceptions import BadRequest, RequestTimeout
 from flask import current_app
 import random
-from app.utils.dataset_utils import get_dataset
+from app.utils.dataset_utils import async_get_dataset
+from app.utils.topic_model_utils import TopicModelClient
 import numpy as np
 from scipy.stats import entropy
-import itertools
+from scipy.special import xlogy
+import math
 from app import db
 
 
+class DocumentTopics:
+    """
+    Doc x topic matrix prepared for JSD of document pairs, computed on blocks of rows
+    with the same definition as TopicModelDocsetComparison.compute_jsd (scipy entropy):
+    vectors and their mean are normalized, natural logarithm.
+    """
+
+    def __init__(self, vecs):
+        self.weights = np.array(vecs, dtype=np.float64)
+        if not len(self.weights):
+            self.weights = np.zeros([0, 0])
+        self.sums = self.weights.sum(axis=1)
+        self.dist = self.weights / self.sums[:, None]
+        # sum of p log p of each document
+        self.plogp = xlogy(self.dist, self.dist).sum(axis=1)
+
+    def __len__(self):
+        return self.weights.shape[0]
+
+    def block_rows(self):
+        """rows per block, so that temporary arrays of a block take TOPIC_JSD_BLOCK_BYTES"""
+        pair_bytes = 3 * 8 * max(self.weights.shape[1], 1)
+        return max(1, int(math.sqrt(Config.TOPIC_JSD_BLOCK_BYTES / pair_bytes)))
+
+    def cross(self, rows, other, other_rows):
+        """JSD of all pairs of self[rows] and other[other_rows], as a matrix"""
+        mean = (self.weights[rows, None, :] + other.weights[None, other_rows, :]) / (
+            self.sums[rows, None, None] + other.sums[None, other_rows, None]
+        )
+        cross_entropy = xlogy(
+            self.dist[rows, None, :] + other.dist[None, other_rows, :], mean
+        ).sum(axis=2)
+        return (
+            self.plogp[rows, None] + other.plogp[None, other_rows] - cross_entropy
+        ) / 2
+
+    def paired(self, rows, other, other_rows):
+        """JSD of pairs self[rows[i]], other[other_rows[i]]"""
+        mean = (self.weights[rows] + other.weights[other_rows]) / (
+            self.sums[rows] + other.sums[other_rows]
+        )[:, None]
+        cross_entropy = xlogy(self.dist[rows] + other.dist[other_rows], mean).sum(
+            axis=1
+        )
+        return (self.plogp[rows] + other.plogp[other_rows] - cross_entropy) / 2
+
+
+def sample_size():
+    """
+    Pairs needed for a mean within TOPIC_JSD_SAMPLE_ERROR with TOPIC_JSD_SAMPLE_CONFIDENCE:
+    JSD is between 0 and log(2), Hoeffding's inequality
+    """
+    return int(
+        math.ceil(
+            math.log(2 / (1 - Config.TOPIC_JSD_SAMPLE_CONFIDENCE))
+            * math.log(2) ** 2
+            / (2 * Config.TOPIC_JSD_SAMPLE_ERROR ** 2)
+        )
+    )
+
+
+def sample_error(samples):
+    """error bound of the mean of samples pairs, with TOPIC_JSD_SAMPLE_CONFIDENCE"""
+    return math.log(2) * math.sqrt(
+        math.log(2 / (1 - Config.TOPIC_JSD_SAMPLE_CONFIDENCE)) / (2 * samples)
+    )
+
+
+def mean_pairwise_jsd(docs1, docs2=None):
+    """
+    Mean JSD of all pairs of documents of docs1 (internal), or of docs1 and docs2 (cross).
+    Returns the mean and its error bound: 0.0 when all pairs are computed,
+    above TOPIC_JSD_MAX_PAIRS pairs the mean of a random sample of pairs.
+    nan without pairs, as np.mean of an empty list.
+    """
+    internal = docs2 is None
+    if internal:
+        docs2 = docs1
+        pairs = len(docs1) * (len(docs1) - 1) // 2
+    else:
+        pairs = len(docs1) * len(docs2)
+    if not pairs:
+        return np.nan, 0.0
+
+    samples = sample_size()
+    if pairs > Config.TOPIC_JSD_MAX_PAIRS and samples < pairs:
+        # fixed seed: the same collections give the same result
+        generator = np.random.RandomState(0)
+        rows1 = generator.randint(len(docs1), size=samples)
+        if internal:
+            # uniform over pairs of different documents, JSD is symmetric
+            rows2 = (rows1 + generator.randint(1, len(docs1), size=samples)) % len(
+                docs1
+            )
+        else:
+            rows2 = generator.randint(len(docs2), size=samples)
+        step = docs1.block_rows() ** 2
+        total = 0.0
+        for start in range(0, samples, step):
+            total += docs1.paired(
+                rows1[start : start + step], docs2, rows2[start : start + step]
+            ).sum()
+        return total / samples, sample_error(samples)
+
+    step = docs1.block_rows()
+    total = 0.0
+    for start1 in range(0, len(docs1), step):
+        rows1 = np.arange(start1, min(start1 + step, len(docs1)))
+        # internal: blocks on and above the diagonal
+        for start2 in range(start1 if internal else 0, len(docs2), step):
+            rows2 = np.arange(start2, min(start2 + step, len(docs2)))
+            block = docs1.cross(rows1, docs2, rows2)
+            if internal and start1 == start2:
+                block = block[np.triu_indices(len(rows1), 1)]
+            total += block.sum()
+    return total / pairs, 0.0
+
+
 class TopicProcessor(AnalysisUtility):
     async def get_input_data(self):
         self.language = self.task.parameters.get("language")
@@ -97,53 +216,24 @@ class TopicModelDocumentLinking(TopicProcessor):
             "topics_distrib": self.input_data["topic_weights"],
         }
         response = await self.request_result_from_tm(
-            payload,
-            "{}/doc-linking-by-distribution".format(Config.TOPIC_MODEL_URI),
-            "{}/doc-linking-results".format(Config.TOPIC_MODEL_URI),
+            payload, "doc-linking-by-distribution", "doc-linking-results",
         )
         return response
 
     async def request_result_from_tm(
-        self, payload, request_uri, result_uri, parameters={}, max_delay=False
+        self, payload, request_endpoint, result_endpoint, parameters=None, max_wait=None
     ):
-        response = requests.post(request_uri, json=payload)
-        uuid = response.json().get("task_uuid")
-        if not uuid:
-            raise ValueError(
-                "Invalid response from the Topic Model API: {}".format(response)
+        async with TopicModelClient.shared() as client:
+            response = await client.request(
+                request_endpoint,
+                result_endpoint,
+                payload,
+                parameters=parameters,
+                max_wait=max_wait,
             )
-
-        response = await self.request_result_with_retry(
-            result_uri, uuid, max_delay=max_delay, parameters=parameters
-        )
         response["documents"] = response.pop("similar_docs")
         return response
 
-    @staticmethod
-    async def request_result_with_retry(
-        uri, task_uuid, delay=4, max_delay=False, parameters={}
-    ):
-        delay = 4
-        total_delay = 0
-        while True:
-            await asyncio.sleep(delay)
-            total_delay += delay
-            delay *= 1.2
-            parameters["task_uuid"] = task_uuid
-            response = requests.post(uri, json=parameters)
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code != 202:
-                return response
-            current_app.logger.debug(
-                "TM_TASK: %s DELAY: %s STATUS: %s"
-                % (task_uuid, delay, response.status_code)
-            )
-            if max_delay and delay >= max_delay:
-                raise RequestTimeout(
-                    "Task {} cannot finish in {} seconds".format(task_uuid, total_delay)
-                )
-
     async def estimate_interestingness(self):
         return {"documents": [1 - dist for dist in self.result["distance"]]}
 
@@ -263,7 +353,7 @@ class TopicModelDocsetComparison(TopicProcessor):
         # takes input collection and return a list of documents
 
         if "dataset" in collection:
-            dataset = get_dataset(collection["dataset"])
+            dataset = await async_get_dataset(collection["dataset"])
             search_query = dataset.make_query()
         elif "search_query" in collection:
             search_query = collection["search_query"]
@@ -278,6 +368,25 @@ class TopicModelDocsetComparison(TopicProcessor):
         return collection
 
     async def make_result(self):
+        docs1 = DocumentTopics(self.input_data[0]["doc_weights"])
+        docs2 = DocumentTopics(self.input_data[1]["doc_weights"])
+        internal_jsd1, internal_error1 = self.compute_internal_jsd(docs1)
+        internal_jsd2, internal_error2 = self.compute_internal_jsd(docs2)
+        cross_jsd, cross_error = self.compute_cross_jsd(docs1, docs2)
+        # error bounds of means estimated from a sample of document pairs
+        errors = {
+            k: round(v, 4)
+            for k, v in [
+                ("internal_jsd1", internal_error1),
+                ("internal_jsd2", internal_error2),
+                ("cross_jsd", cross_error),
+            ]
+            if v
+        }
+        if errors:
+            errors["confidence"] = Config.TOPIC_JSD_SAMPLE_CONFIDENCE
+            self.updated_parameters["jsd_sample_error"] = errors
+
         result = {
             "mean_jsd": np.round(
                 self.compute_jsd(
@@ -286,18 +395,9 @@ class TopicModelDocsetComparison(TopicProcessor):
                 ),
                 3,
             ),
-            "internal_jsd1": np.round(
-                self.compute_internal_jsd(self.input_data[0]["doc_weights"]), 3
-            ),
-            "internal_jsd2": np.round(
-                self.compute_internal_jsd(self.input_data[1]["doc_weights"]), 3
-            ),
-            "cross_jsd": np.round(
-                self.compute_cross_jsd(
-                    self.input_data[0]["doc_weights"], self.input_data[1]["doc_weights"]
-                ),
-                3,
-            ),
+            "internal_jsd1": np.round(internal_jsd1, 3),
+            "internal_jsd2": np.round(internal_jsd2, 3),
+            "cross_jsd": np.round(cross_jsd, 3),
             "shared_topics": self.get_shared_topics(
                 self.input_data[0]["topic_weights"], self.input_data[1]["topic_weights"]
             ),
@@ -321,17 +421,12 @@ class TopicModelDocsetComparison(TopicProcessor):
         m = (p + q) / 2
         return (entropy(p, m) + entropy(q, m)) / 2
 
-    def compute_internal_jsd(self, vecs):
-        vecs = np.array(vecs)
-        divs = [
-            self.compute_jsd(vecs[topic_pair[0]], vecs[topic_pair[1]])
-            for topic_pair in itertools.combinations(range(vecs.shape[0]), 2)
-        ]
-        return np.mean(divs)
+    def compute_internal_jsd(self, docs):
+        # mean JSD of document pairs and its error bound, see mean_pairwise_jsd
+        return mean_pairwise_jsd(docs)
 
-    def compute_cross_jsd(self, vecs1, vecs2):
-        divs = [self.compute_jsd(v1, v2) for v1 in vecs1 for v2 in vecs2]
-        return np.mean(divs)
+    def compute_cross_jsd(self, docs1, docs2):
+        return mean_pairwise_jsd(docs1, docs2)
 
     def get_shared_topics(self, vec1, vec2):
         mult_vec = np.multiply(np.array(vec1), np.array(vec2))
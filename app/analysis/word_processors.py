@@ -4,7 +4,160 @@ from app.analysis import assessment
 from math import log, exp
 from collections import defaultdict
 from flask import current_app
+from config import Config
 import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from app.utils.term_vector_utils import (
+    TermVectors,
+    get_term_vectors,
+    stream_term_vectors,
+)
+from app.utils.df_utils import TfIdf, make_tfidf
+
+
+class WordCounts:
+    """
+    Term and document frequencies of words, updated page by page as term vectors arrive
+    from the database (see DatabaseSearch.query_solr on_page): pages are not kept,
+    memory depends on the vocabulary size only.
+    Words get integer ids, frequencies are numpy arrays indexed by id.
+    tf is also counted by the field of the documents, for language-specific df (see TfIdf).
+    """
+
+    def __init__(self):
+        # word -> id, and id -> word
+        self.ids = {}
+        self.words = []
+        self.tf = np.zeros(1024, dtype=np.int64)
+        self.df = np.zeros(1024, dtype=np.int64)
+        # field -> tf of documents with that field
+        self.field_tf = {}
+        self.total = 0.0
+        # the same document may be returned in two pages
+        self.documents = set()
+
+    @classmethod
+    def from_term_vectors(cls, term_vectors):
+        counts = cls()
+        counts.words = list(term_vectors.words)
+        counts.ids = {word: i for i, word in enumerate(counts.words)}
+        counts.tf = np.bincount(
+            term_vectors.entry_word,
+            weights=term_vectors.entry_tf,
+            minlength=len(counts.words),
+        ).astype(np.int64)
+        for field, entries in term_vectors.entry_fields().items():
+            counts.field_tf[field] = np.bincount(
+                term_vectors.entry_word[entries],
+                weights=term_vectors.entry_tf[entries],
+                minlength=len(counts.words),
+            ).astype(np.int64)
+        counts.df = np.array(term_vectors.df, dtype=np.int64)
+        counts.total = float(term_vectors.entry_tf.sum(dtype=np.int64))
+        counts.documents = set(term_vectors.doc_ids)
+        return counts
+
+    def add_page(self, page, fields=None):
+        """fields: docid -> field of its term vectors"""
+        word_dicts = {}
+        for article_id, word_dict in page.items():
+            if article_id in self.documents:
+                continue
+            self.documents.add(article_id)
+            word_dicts.setdefault((fields or {}).get(article_id), []).append(word_dict)
+        for field, field_dicts in word_dicts.items():
+            self.add(*field_dicts, field=field)
+
+    def add(self, *word_dicts, field=None):
+        ids = []
+        tf = []
+        df = []
+        for word_dict in word_dicts:
+            for word, info in word_dict.items():
+                term_id = self.ids.get(word)
+                if term_id is None:
+                    term_id = self.ids[word] = len(self.words)
+                    self.words.append(word)
+                ids.append(term_id)
+                tf.append(info["tf"])
+                df.append(info["df"])
+        if field and field not in self.field_tf:
+            self.field_tf[field] = np.zeros(len(self.tf), dtype=np.int64)
+        if len(self.words) > len(self.tf):
+            size = max(len(self.words), 2 * len(self.tf))
+            self.tf = self.grow(self.tf, size)
+            self.df = self.grow(self.df, size)
+            for name in self.field_tf:
+                self.field_tf[name] = self.grow(self.field_tf[name], size)
+        ids = np.array(ids, dtype=np.intp)
+        np.add.at(self.tf, ids, tf)
+        if field:
+            np.add.at(self.field_tf[field], ids, tf)
+        # df comes from SOLR, it is the same for the word in all documents
+        self.df[ids] = df
+        self.total += sum(tf)
+
+    @staticmethod
+    def grow(array, size):
+        return np.concatenate([array, np.zeros(size - len(array), np.int64)])
+
+    def __len__(self):
+        return len(self.documents)
+
+    async def tfidf(self):
+        n = len(self.words)
+        return await make_tfidf(
+            self.words, self.df[:n], {field: a[:n] for field, a in self.field_tf.items()}
+        )
+
+    def vocabulary(self, max_number=None, tfidf=None):
+        """
+        word -> (tf, relative tf, tf-idf) of the max_number words with the highest
+        (tf-idf, tf, word), all words if max_number is 0 or None.
+        Candidates are selected with numpy, their values are computed with math.log as before,
+        so results do not depend on numpy rounding.
+        tfidf: from self.tfidf(), language-specific df are looked up if not given
+        """
+        if not max_number or max_number < 0:
+            max_number = None
+        n = len(self.words)
+        tf = self.tf[:n]
+        df = self.df[:n]
+        # same errors as math.log(df) and tf / log(df)
+        if (df <= 0).any():
+            raise ValueError("math domain error")
+        if (df == 1).any():
+            raise ZeroDivisionError("float division by zero")
+        if tfidf is None:
+            tfidf = TfIdf(
+                self.words, df, {field: a[:n] for field, a in self.field_tf.items()}
+            )
+
+        if max_number and max_number < n:
+            values = tfidf.values(tf)
+            kth = np.partition(values, n - max_number)[n - max_number]
+            # ties and last-bit differences from math.log are kept
+            candidates = np.flatnonzero(values >= kth - abs(kth) * 1e-9)
+        else:
+            candidates = range(n)
+
+        result = {}
+        for i in candidates:
+            word = self.words[i]
+            word_tf = int(tf[i])
+            # abs      rel                     tf-idf
+            result[word] = (word_tf, word_tf / self.total, tfidf.value(i, word_tf))
+
+        vocabulary = {}
+        # sort by tf-idf:
+        for k in sorted(
+            result, key=lambda x: (result[x][2], result[x][0], x), reverse=True
+        )[:max_number]:
+            vocabulary[k] = result[k]
+        return vocabulary
 
 
 class WordProcessor(AnalysisUtility):
@@ -34,6 +187,14 @@ class WordProcessor(AnalysisUtility):
         )
 
     async def get_input_data(self):
+        if Config.TERM_VECTOR_CACHE_SIZE:
+            # retrieved once for all processors using the same query and unit
+            return await get_term_vectors(
+                self.search_database,
+                self.task.search_query,
+                self.task.parameters["unit"],
+                force_refresh=self.task.force_refresh,
+            )
         return await self.search_database(
             self.task.search_query, retrieve=self.task.parameters["unit"]
         )
@@ -49,6 +210,30 @@ class ExtractWords(WordProcessor):
         processor.output_type = "word_list"
         return processor
 
+    async def get_input_data(self):
+        if not Config.EXTRACT_WORDS_STREAMING:
+            return await super().get_input_data()
+        counts = WordCounts()
+        if Config.TERM_VECTOR_CACHE_SIZE:
+            # cached term vectors, or counted while retrieved (and cached if they fit)
+            term_vectors = await stream_term_vectors(
+                self.search_database,
+                self.task.search_query,
+                self.task.parameters["unit"],
+                counts.add_page,
+                force_refresh=self.task.force_refresh,
+            )
+            return counts if term_vectors is None else term_vectors
+        result = await self.search_database(
+            self.task.search_query,
+            retrieve=self.task.parameters["unit"],
+            on_page=counts.add_page,
+        )
+        # search errors are returned, not raised, outside debug mode
+        if isinstance(result, Exception):
+            raise result
+        return counts
+
     async def make_result(self):
         """
         Builds word dictionary for the dataset
@@ -56,40 +241,25 @@ class ExtractWords(WordProcessor):
         """
         # TODO: might need to save an initial dictionary for reuse
 
-        df = {}
-        tf = defaultdict(int)
-        total = 0.0
         # Note: df that came from SOLR are computing using the whole
         # (multilingual) collection. Might need to do it language-wise
         # (slower?)
-
-        
-        for word_dict in list(self.input_data.values()):
-            for word, info in word_dict.items():                
-                df[word] = info["df"]
-                tf[word] += info["tf"]
-                total += info["tf"]
-                # abs      rel                     tf-idf
-        result = {
-            word: (tf[word], tf[word] / total, tf[word] / log(df[word]) )
-            for word in tf
-        }
+        if isinstance(self.input_data, WordCounts):
+            # counted while the data was retrieved
+            counts = self.input_data
+        elif isinstance(self.input_data, TermVectors):
+            counts = WordCounts.from_term_vectors(self.input_data)
+        else:
+            counts = WordCounts()
+            counts.add(*self.input_data.values())
 
         # for word in sorted(result, key=lambda x: (result[x][2], x), reverse=True):
         #     current_app.logger.debug("%s df %s tf %s tfidf %s" %(word, df[word], tf[word], result[word][2]))
-            
-        
-        max_number = self.task.parameters.get("max_number")
-        count = 0
-        vocabulary = {}
-        # sort by tf-idf:
-        for k in sorted(result, key=lambda x: (result[x][2], result[x][0], x), reverse=True):
-            vocabulary[k] = result[k]
-            count += 1
-            if max_number and count == max_number:
-                break
 
-        return {"total": int(total), "vocabulary": vocabulary}
+        vocabulary = counts.vocabulary(
+            self.task.parameters.get("max_number"), await counts.tfidf()
+        )
+        return {"total": int(counts.total), "vocabulary": vocabulary}
 
     async def estimate_interestingness(self):
         vocab = self.result["vocabulary"]
@@ -99,10 +269,90 @@ class ExtractWords(WordProcessor):
         )  # interestingness based on tf-idf, the biggest numbers highlighted, frequency taken into account
 
 
+def count_bigrams(term_vectors, max_number=None):
+    """
+    Word counts (by word id of term_vectors, in total and by field),
+    bigram codes (id1 << 32 | id2) and their counts.
+    If max_number is given, bigrams that cannot be among the max_number most frequent
+    are dropped before counting: a bigram is not more frequent than its words, and the
+    max_number-th count in a sample is a lower bound of the max_number-th count.
+    """
+    sequence, documents = term_vectors.sequences()
+    word_count = np.bincount(sequence, minlength=len(term_vectors.words))
+    # word counts by field of the documents, for language-specific df
+    doc_fields = np.array(term_vectors.fields, dtype=object)[documents]
+    field_count = {
+        field: np.bincount(sequence[doc_fields == field], minlength=len(word_count))
+        for field in set(term_vectors.fields)
+        if field
+    }
+    # no bigrams across documents
+    codes = ((sequence[:-1] << 32) | sequence[1:])[documents[:-1] == documents[1:]]
+
+    if max_number and len(codes) > Config.BIGRAM_PRUNE_SAMPLE:
+        _, sample_counts = np.unique(
+            codes[: Config.BIGRAM_PRUNE_SAMPLE], return_counts=True
+        )
+        if len(sample_counts) >= max_number:
+            threshold = np.partition(sample_counts, len(sample_counts) - max_number)[
+                len(sample_counts) - max_number
+            ]
+            codes = codes[
+                np.minimum(word_count[codes >> 32], word_count[codes & 0xFFFFFFFF])
+                >= threshold
+            ]
+
+    pairs, counts = np.unique(codes, return_counts=True)
+    return word_count, field_count, pairs, counts
+
+
+# worker processes of ExtractBigrams, see start_bigram_workers
+bigram_workers = None
+bigram_workers_lock = threading.Lock()
+
+
+def start_bigram_workers():
+    """
+    Long-lived worker processes for bigrams of large collections (Config.BIGRAM_PROCESSES).
+    Workers are forked by a fork server, not from this multithreaded process,
+    and read term vectors memory-mapped from the TermVectorStore: only paths are sent to them.
+    """
+    global bigram_workers
+    with bigram_workers_lock:
+        if bigram_workers is None and Config.BIGRAM_PROCESSES > 1:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["__main__", __name__])
+            bigram_workers = ProcessPoolExecutor(
+                Config.BIGRAM_PROCESSES, mp_context=context
+            )
+    return bigram_workers
+
+
+def count_stored_bigrams(path, start, end):
+    return count_bigrams(TermVectors.load(path).documents(start, end))
+
+
+def merge_bigram_counts(parts):
+    if len(parts) == 1:
+        return parts[0]
+    word_count = sum(part[0] for part in parts)
+    field_count = {}
+    for _, part_field_count, _, _ in parts:
+        for field, counts in part_field_count.items():
+            field_count[field] = field_count.get(field, 0) + counts
+    pairs, inverse = np.unique(
+        np.concatenate([part[2] for part in parts]), return_inverse=True
+    )
+    counts = np.bincount(
+        inverse.ravel(),
+        weights=np.concatenate([part[3] for part in parts]),
+        minlength=len(pairs),
+    ).astype(np.int64)
+    return word_count, field_count, pairs, counts
+
+
 class ExtractBigrams(WordProcessor):
-    # could be more efficient
-    # could use frequency thresholds for bigrams based on word counts computed in the ExtractWord processors
-    # lets make it working first and them decide if optimization is needed
+    # uses frequency thresholds for bigrams based on word counts, see count_bigrams
     @classmethod
     def _make_processor(cls):
         processor = super()._make_processor()
@@ -113,84 +363,84 @@ class ExtractBigrams(WordProcessor):
         return processor
 
     async def make_result(self):
-        word_count = defaultdict(int)
-        bigram_count = defaultdict(int)
-        df = {}
-        total = 0.0
-        for doc_processing in asyncio.as_completed(
-            [
-                self.collect_document_counts(doc_dict)
-                for doc_dict in self.input_data.values()
-            ]
-        ):
-            doc_word_count, doc_bigram_count, doc_df = await doc_processing
-            
-            for word in doc_word_count:
-                word_count[word] += doc_word_count[word]
-                total += doc_word_count[word]
-                df[word] = doc_df[word]
-            for bigram in doc_bigram_count:
-                bigram_count[bigram] += doc_bigram_count[bigram]
-            
-            
-
-                
-        dice_score = {
-            b: 2.0 * bigram_count[b] / (word_count[b[0]] + word_count[b[1]])
-            for b in bigram_count
-        }
-
-
-        tfidf = {w:word_count[w]/log(df[w]) for w in df}
-        
-#        for b in sorted(dice_score,
-#                        key=lambda b: (dice_score[b],
-#                                       (word_count[b[0]] + word_count[b[1]])
-#                                       tfidf[b[0]]+tfidf[b[1]]),
-#                        reverse=True):
-#            current_app.logger.debug("%s bc: %s wc1:  %s wc2: %s dice: %s tfidf1: %s tfidf2: %s" %(b, bigram_count[b], word_count[b[0]], word_count[b[1]], dice_score[b], tfidf[b[0]], tfidf[b[1]]))
-        
-        res = {}
-        count = 0
         max_number = self.task.parameters.get("max_number")
-        # sort by dice_score:
-        for b in sorted(dice_score,
-                        key=lambda b: (bigram_count[b],
-                                       dice_score[b],
-                                       tfidf[b[0]]+tfidf[b[1]]),
-
-                        reverse=True):
-            res[" ".join(b)] = (
-                bigram_count[b],
-                bigram_count[b] / total,
-                dice_score[b],
-                tfidf[b[0]]+tfidf[b[1]]
+        if not max_number or max_number < 0:
+            max_number = None
+        term_vectors = self.input_data
+        if not isinstance(term_vectors, TermVectors):
+            term_vectors = TermVectors.from_dicts(term_vectors)
+        words = term_vectors.words
+        df = term_vectors.df
+
+        # large collections stored in the TermVectorStore are split between worker processes
+        parts = None
+        if (
+            term_vectors.path
+            and len(term_vectors) >= Config.BIGRAM_PROCESS_MIN_DOCUMENTS
+            and start_bigram_workers()
+        ):
+            size = -(-len(term_vectors) // Config.BIGRAM_PROCESSES)
+            loop = asyncio.get_event_loop()
+            try:
+                parts = await asyncio.gather(
+                    *[
+                        loop.run_in_executor(
+                            bigram_workers,
+                            count_stored_bigrams,
+                            term_vectors.path,
+                            i,
+                            i + size,
+                        )
+                        for i in range(0, len(term_vectors), size)
+                    ]
+                )
+            except OSError as e:
+                # evicted from the store before a worker opened it
+                current_app.logger.warning("BIGRAM WORKERS FAILED: %r" % e)
+        if parts is None:
+            parts = [count_bigrams(term_vectors, max_number)]
+        word_count, field_count, pairs, bigram_count = merge_bigram_counts(parts)
+
+        total = float(word_count.sum())
+        first = pairs >> 32
+        second = pairs & 0xFFFFFFFF
+        dice_score = 2.0 * bigram_count / (word_count[first] + word_count[second])
+
+        # same values and errors as word_count / math.log(df) for words in the documents,
+        # with language-specific df if available
+        word_tfidf = await make_tfidf(words, df, field_count)
+        tfidf = np.zeros(len(words))
+        for i in np.flatnonzero(word_count):
+            tfidf[i] = word_tfidf.value(i, word_count[i])
+        tfidf_sum = tfidf[first] + tfidf[second]
+
+        # sort by bigram count, dice score, tf-idf; only candidates for the max_number first are sorted
+        candidates = np.arange(len(pairs))
+        if max_number and max_number < len(pairs):
+            kth = np.partition(bigram_count, len(pairs) - max_number)[
+                len(pairs) - max_number
+            ]
+            candidates = np.flatnonzero(bigram_count >= kth)
+        order = candidates[
+            np.lexsort(
+                (
+                    -tfidf_sum[candidates],
+                    -dice_score[candidates],
+                    -bigram_count[candidates],
+                )
             )
-            count += 1
-            if count == max_number:
-                break
+        ][:max_number]
 
+        res = {}
+        for b in order:
+            res[" ".join((words[first[b]], words[second[b]]))] = (
+                int(bigram_count[b]),
+                int(bigram_count[b]) / total,
+                float(dice_score[b]),
+                float(tfidf_sum[b]),
+            )
         return res
 
-    @staticmethod
-    async def collect_document_counts(doc_dict):
-        position_to_word = {}
-        df = {}
-        for word, info in doc_dict.items():
-            for pos in info["positions"]:
-                position_to_word[pos] = word
-            df[word] = info["df"]
-            
-        word_list = [position_to_word[p] for p in sorted(position_to_word)]
-        word_count = defaultdict(int)
-        bigram_count = defaultdict(int)
-        for i in range(len(word_list) - 1):
-            word_count[word_list[i]] += 1
-            bigram_count[(word_list[i], word_list[i + 1])] += 1
-        word_count[word_list[-1]] += 1
-
-        return word_count, bigram_count, df
-
     async def estimate_interestingness(self):
         return assessment.recoursive_distribution(
             #   dice_score  * sum_tfidf
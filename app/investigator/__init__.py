@@ -37,7 +37,7 @@ PROCESSORSETS = {
 
 
 PROCESSOR_PRIORITY = {
-    # heruistics
+    # heruistics, used until the cost model (cost_model.py) has enough measured timings
     # fast query, part of description
     "ExtractFacets": 2,
     # not so fast, requires many queries but they are parts of description
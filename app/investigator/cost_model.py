@@ -0,0 +1,144 @@
+from collections import defaultdict
+from math import exp, log, log1p, log2
+from flask import current_app
+from numpy import mean, polyfit, ptp
+from app import db
+from app.models import TaskTiming
+from config import Config
+
+
+class CostModel:
+    """
+    Learns processor running times from measured task timings.
+
+    For each processor log(duration) is fitted linearly on log(collection size + 1),
+    with an additive offset for each collection language. The offsets are shrunk towards
+    zero for languages with few observations. Processors without enough measurements
+    have no estimate, the investigator falls back to PROCESSOR_PRIORITY for them.
+    """
+
+    def __init__(self):
+        # processor name -> list of (collection size, language, duration)
+        self.observations = defaultdict(list)
+        # processor name -> fitted model, removed when new observations arrive
+        self.models = {}
+
+    def load(self):
+        """reads latest timings from the database"""
+        timings = (
+            TaskTiming.query.order_by(TaskTiming.recorded.desc())
+            .limit(Config.COST_MODEL_MAX_OBSERVATIONS * 20)
+            .all()
+        )
+        for timing in reversed(timings):
+            self.add_observation(
+                timing.processor_name,
+                timing.collection_size,
+                timing.language,
+                timing.duration,
+            )
+        current_app.logger.debug(
+            "COST MODEL: %d timings for %d processors"
+            % (len(timings), len(self.observations))
+        )
+
+    def add_observation(self, processor, size, language, duration):
+        observations = self.observations[processor]
+        observations.append((size, language, duration))
+        if len(observations) > Config.COST_MODEL_MAX_OBSERVATIONS:
+            del observations[0]
+        self.models.pop(processor, None)
+
+    def record(self, task, duration, size=None, language=None):
+        """stores the measured duration (in seconds) of the task"""
+        processor = task.processor.name
+        db.session.add(
+            TaskTiming(
+                task_id=task.id,
+                processor_name=processor,
+                collection_size=size,
+                language=language,
+                duration=duration,
+            )
+        )
+        db.session.commit()
+        self.add_observation(processor, size, language, duration)
+
+    def fit(self, processor):
+        observations = self.observations[processor]
+        if len(observations) < Config.COST_MODEL_MIN_OBSERVATIONS:
+            return None
+
+        # durations are in seconds, very short tasks are all equally cheap
+        y = [log(max(duration, 0.1)) for _, _, duration in observations]
+        sized = [
+            (log1p(size), y_i)
+            for (size, _, _), y_i in zip(observations, y)
+            if size is not None
+        ]
+
+        slope = 0.0
+        intercept = mean(y)
+        mean_x = 0.0
+        if sized:
+            x_sized = [x_i for x_i, _ in sized]
+            mean_x = mean(x_sized)
+            if len(sized) >= Config.COST_MODEL_MIN_OBSERVATIONS and ptp(x_sized) > 0:
+                slope, intercept = polyfit(x_sized, [y_i for _, y_i in sized], 1)
+                # running time does not decrease with the collection size
+                if slope < 0:
+                    slope = 0.0
+                    intercept = mean(y)
+                else:
+                    # unsized observations are treated as collections of average size
+                    intercept = mean(
+                        [
+                            y_i - slope * (log1p(size) if size is not None else mean_x)
+                            for (size, _, _), y_i in zip(observations, y)
+                        ]
+                    )
+
+        residuals = defaultdict(list)
+        for (size, language, _), y_i in zip(observations, y):
+            x_i = log1p(size) if size is not None else mean_x
+            residuals[language].append(y_i - intercept - slope * x_i)
+
+        offsets = {}
+        for language, r in residuals.items():
+            if language is None:
+                continue
+            # few observations: offset is close to 0
+            offsets[language] = sum(r) / (len(r) + Config.COST_MODEL_SHRINKAGE)
+
+        model = {
+            "intercept": float(intercept),
+            "slope": float(slope),
+            "mean_x": float(mean_x),
+            "offsets": offsets,
+        }
+        self.models[processor] = model
+        return model
+
+    def predict(self, processor, size=None, language=None):
+        """
+        Expected running time of the processor in seconds,
+        None if there are not enough measurements
+        """
+        model = self.models.get(processor) or self.fit(processor)
+        if not model:
+            return None
+        x = log1p(size) if size is not None else model["mean_x"]
+        y = (
+            model["intercept"]
+            + model["slope"] * x
+            + model["offsets"].get(language, 0.0)
+        )
+        return exp(y)
+
+    @staticmethod
+    def priority(expected_duration):
+        """
+        Queue priority of a task, on a similar scale as PROCESSOR_PRIORITY:
+        a second gives 1, a minute 6, an hour 12
+        """
+        return log2(1 + expected_duration)
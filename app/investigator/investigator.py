@@ -17,6 +17,8 @@ from app.models import (
 )
 from datetime import datetime
 from app.investigator import PROCESSORSETS, PROCESSOR_PRIORITY
+from app.investigator.cost_model import CostModel
+from config import Config
 from flask import current_app
 import asyncio
 from math import log2
@@ -54,7 +56,9 @@ class Investigator:
         self.action_id = 0
         self.node_id = 0
         self.to_stop = False
-        self.task_queue = TaskQueue(planner)
+        self.task_queue = TaskQueue(planner, self.collections)
+        # durations are recorded by the planner as soon as each task is finished
+        self.planner.on_duration = self.task_queue.record_duration
         self.done_tasks = []
 
         self.strategy = strategy
@@ -89,6 +93,12 @@ class Investigator:
 
         self.update_status("running")
 
+        if self.pipelined:
+            await self.act_pipelined()
+            await self.action(self.stop)
+            await self.action(self.report, final=True)
+            return
+
         while not self.to_stop:
 
             # variables needed to pass information between actions within this step
@@ -108,6 +118,88 @@ class Investigator:
         await self.action(self.stop)
         await self.action(self.report, final=True)
 
+    @property
+    def pipelined(self):
+        user_parameters = self.run.user_parameters or {}
+        if user_parameters.get("describe"):
+            # description is a single step anyway
+            return False
+        return user_parameters.get("pipeline", Config.INVESTIGATOR_PIPELINE)
+
+    async def act_pipelined(self):
+        """
+        Same actions as in act(), but selected tasks run in the background:
+        as soon as a task is finished its results are reported and the paths are updated,
+        so follow-up tasks are started while slower tasks are still running.
+        """
+        finished = asyncio.Queue()
+        # selected tasks that are not finished yet: task.id -> task
+        running = {}
+        batches = set()
+        getter = None
+        try:
+            while not self.to_stop:
+                self.nodes = self.run.nodes
+
+                if (
+                    self.task_queue.taskq
+                    and len(running) < Config.INVESTIGATOR_MAX_RUNNING_TASKS
+                ):
+                    self.start_action = self.action_id
+                    await self.action(self.select)
+                    tasks = [t for t in self.selected_tasks if isinstance(t, Task)]
+                    running.update({t.id: t for t in tasks})
+                    batches.add(asyncio.ensure_future(self.execute_batch(tasks, finished)))
+                    continue
+
+                if not running:
+                    # nothing to wait for: paths could still add tasks
+                    self.start_action = self.action_id
+                    self.executed_tasks = []
+                    await self.action(self.update)
+                    if not self.task_queue.taskq:
+                        self.check_for_stop()
+                    continue
+
+                getter = asyncio.ensure_future(finished.get())
+                done, _ = await asyncio.wait(
+                    batches | {getter}, return_when=asyncio.FIRST_COMPLETED
+                )
+                for batch in done & batches:
+                    batches.discard(batch)
+                    # raises if the batch failed
+                    batch.result()
+                if getter not in done:
+                    getter.cancel()
+                    continue
+
+                tasks = [getter.result()]
+                while not finished.empty():
+                    tasks.append(finished.get_nowait())
+                tasks = [running.pop(t.id) for t in tasks if t.id in running]
+                if not tasks:
+                    continue
+
+                self.start_action = self.action_id
+                await self.action(self.execute, finished_tasks=tasks)
+                await self.action(self.report)
+                await self.action(self.update)
+        finally:
+            if getter:
+                getter.cancel()
+            for batch in batches:
+                batch.cancel()
+            if batches:
+                await asyncio.gather(*batches, return_exceptions=True)
+
+    async def execute_batch(self, tasks, finished):
+        await self.planner.execute_and_store_tasks(
+            tasks, on_finished=finished.put_nowait
+        )
+        # tasks reusing existing results are not executed by the planner
+        for task in tasks:
+            finished.put_nowait(task)
+
     # ACTIONS
     # recorded in DB for Explainer
     async def action(self, action_func, **action_parameters):
@@ -155,23 +247,32 @@ class Investigator:
         task selection from queue
         """
 
+        expected_completion = self.task_queue.expected_completion_times()
         tasks = self.task_queue.pop_tasks_with_lowest_priority()
         self.selected_tasks = tasks
         why = {"priority": "lowest"}
-        action = {"selected_tasks": self.task_list(tasks)}
+        if tasks:
+            # seconds, None if processor costs are not known yet
+            why["expected_duration"] = self.task_queue.expected_batch_duration(tasks)
+        action = {
+            "selected_tasks": self.task_list(tasks),
+            "expected_completion": expected_completion,
+        }
         return why, action
 
-    async def execute(self):
+    async def execute(self, finished_tasks=None):
         """
         task execution
+        finished_tasks: tasks already executed in the pipelined mode
         """
-        tasks = self.selected_tasks
+        tasks = self.selected_tasks if finished_tasks is None else finished_tasks
         if not tasks:
             action = {}
             why = {"selected_tasks": "empty"}
             return why, action
 
-        await self.planner.execute_and_store_tasks(tasks)
+        if finished_tasks is None:
+            await self.planner.execute_and_store_tasks(tasks)
         # current_app.logger.debug("TASKS %s" % tasks)
 
         # append to previously done tasks
@@ -546,16 +647,26 @@ class Investigator:
         else:
             raise NotImplementedError("Unknown path strategy %s" % path.strategy)
 
-    async def stop(self):
+    async def stop(self, status="finished"):
         """
         stop investigations
         """
-        self.update_status("finished")
+        self.update_status(status)
         self.run.run_finished = datetime.utcnow()
         why = self.to_stop
         action = {}
         return why, action
 
+    async def cancel(self, reason):
+        """
+        called when the run is cancelled by user or by deadline
+        running and queued tasks are stopped, the run keeps results obtained so far
+        """
+        self.to_stop = {"cancelled": reason}
+        self.planner.stop_tasks(reason)
+        self.task_queue.stop_tasks(reason)
+        await self.action(self.stop, status="stopped")
+
     # HELPERS
 
     def check_for_stop(self):
@@ -939,25 +1050,73 @@ class Investigator:
 
 
 class TaskQueue:
-    def __init__(self, planner):
+    def __init__(self, planner, collections=None):
         self.taskq = []  # list of entries arranged in a heap
         self.entry_finder = {}  # mapping of tasks to entries
         self.REMOVED = "<removed-task>"  # placeholder for a removed task
         self.counter = itertools.count()  # unique sequence count
         self.processor_count = defaultdict(int)
         self.planner = planner
+        # collection_no -> RunCollection, shared with the investigator
+        self.collections = collections if collections is not None else {}
+        # running times learned from previous runs
+        self.cost_model = CostModel()
+        self.cost_model.load()
+        # task -> expected running time in seconds, None if unknown
+        self.expected_duration = {}
+
+    def find_collection(self, task):
+        for collection in task.collections:
+            if collection.collection_no in self.collections:
+                return self.collections[collection.collection_no]
+
+    def collection_features(self, task):
+        """size and language of the task input, if already known"""
+        collection = self.find_collection(task)
+        if not collection:
+            return None, None
+        language = None
+        if collection.languages:
+            languages = [l for l, count in collection.languages.items() if count]
+            if len(languages) == 1:
+                language = languages[0]
+            elif len(languages) > 1:
+                language = "multilingual"
+        return collection.size, language
+
+    async def record_duration(self, task, duration):
+        """feeds the running time of an executed task into the cost model"""
+        # features of the task's own collection, prerequisites generated by the planner have none
+        collection = self.find_collection(task)
+        if collection:
+            try:
+                await collection.collection_size()
+            except Exception as e:
+                current_app.logger.warning("COLLECTION SIZE UNKNOWN: %r" % e)
+            collection.collection_languages()
+        size, language = self.collection_features(task)
+        self.cost_model.record(task, duration, size, language)
 
     def add_tasks(self, tasks, context_priority=None):
         for task in tasks:
             if self.planner.result_exists(task):
                 # costs (almost) nothing
                 priority = 0
+                self.expected_duration[task] = 0.0
 
             else:
                 processor = task.processor.name
                 self.processor_count[processor] += 1
-                # take pre-defined priority for each processor
-                priority = PROCESSOR_PRIORITY[processor]
+                expected = self.cost_model.predict(
+                    processor, *self.collection_features(task)
+                )
+                self.expected_duration[task] = expected
+                if expected is None:
+                    # not enough measurements yet:
+                    # take pre-defined priority for each processor
+                    priority = PROCESSOR_PRIORITY[processor]
+                else:
+                    priority = self.cost_model.priority(expected)
 
                 if context_priority:
                     # context_priority depends on investigator situation
@@ -1030,6 +1189,52 @@ class TaskQueue:
     def queue_state(self):
         return [t[2].id for t in self.taskq]
 
+    def expected_batch_duration(self, tasks):
+        """tasks of a batch are executed in parallel"""
+        durations = [self.expected_duration.get(task) for task in tasks]
+        if None in durations:
+            return None
+        return max(durations)
+
+    def expected_completion_times(self):
+        """
+        Simulates the queue: tasks are selected in batches (pop_tasks_with_lowest_priority)
+        and each batch takes as long as its slowest task.
+        Returns task uuid -> expected seconds from now until the task is finished,
+        None after the first task with unknown running time.
+        """
+        entries = sorted(entry for entry in self.taskq if entry[-1] is not self.REMOVED)
+        completion = {}
+        elapsed = 0.0
+        i = 0
+        while i < len(entries):
+            lowest_priority = entries[i][0]
+            batch = []
+            while i < len(entries) and entries[i][0] < lowest_priority + 1:
+                batch.append(entries[i][-1])
+                i += 1
+            batch_duration = self.expected_batch_duration(batch)
+            for task in batch:
+                duration = self.expected_duration.get(task)
+                completion[str(task.uuid)] = (
+                    elapsed + duration
+                    if elapsed is not None and duration is not None
+                    else None
+                )
+            if elapsed is not None and batch_duration is not None:
+                elapsed += batch_duration
+            else:
+                elapsed = None
+        return completion
+
+    def stop_tasks(self, reason):
+        for task in self.entry_finder:
+            if task.task_status == "created":
+                task.task_status = "stopped"
+                task.status_message = reason[:255]
+                task.task_finished = datetime.utcnow()
+        db.session.commit()
+
 
 class RunCollection:
     collection_count = 0
@@ -1042,6 +1247,8 @@ class RunCollection:
         self.processors = []
         self.tasks = []
         self.user = user
+        # Dataset of the collection, checked on the dataset platform when the run started
+        self.dataset = None
 
         self.collection_no = copy(RunCollection.collection_count)
 
@@ -1063,12 +1270,13 @@ class RunCollection:
         elif dataset_name:
             self.data_type = "dataset"
             self.data = {"name": dataset_name, "user": "PRA"}
+            self.dataset = get_dataset(self.data)
 
             self.collection = Collection(
                 run_id=run_id,
                 collection_no=self.collection_no,
                 data_type=self.data_type,
-                data_id=get_dataset(self.data).id,
+                data_id=self.dataset.id,
             )
 
         else:
@@ -1104,6 +1312,7 @@ class RunCollection:
                 "name": run.root_dataset.dataset_name,
                 "user": run.root_dataset.user,
             }
+            self.dataset = run.root_dataset
         elif run.root_solr_query_id is not None:
             self.data_type = "search_query"
             self.data = run.root_solr_query.search_query
@@ -1123,13 +1332,17 @@ class RunCollection:
         if source_uuid:
             task_dict["source_uuid"] = source_uuid
 
-        task = generate_task(task_dict, user=self.user, return_task=True,)
+        # called in the event loop: the dataset is not checked on the dataset platform again
+        task = generate_task(
+            task_dict, user=self.user, return_task=True, dataset=self.dataset
+        )
         task.collections.append(self.collection)
         self.tasks.append(task)
         return task
 
     async def collection_size(self):
-        if self.size:
+        # cached, also when the collection is empty
+        if self.size is not None:
             return self.size
 
         if self.data_type == "dataset":
@@ -1143,7 +1356,8 @@ class RunCollection:
             search_result = await database_search.search(
                 {"rows": 0, **self.data}, retrieve="docids"
             )
-            return search_result["numFound"]
+            self.size = search_result["numFound"]
+            return self.size
 
     def collection_languages(self):
         if self.languages:
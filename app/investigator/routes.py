@@ -48,7 +48,7 @@ class Investigator(Resource):
         type=dict,
         default={},
         location="json",
-        help="A JSON object containing some parameters. Currently only one parameter is implemented: 'strategy', which could be either 'elaboration' or 'expansion'. Default 'elaboration'.",
+        help="A JSON object containing some parameters: 'strategy', which could be either 'elaboration' or 'expansion' (default 'elaboration'), 'deadline', maximal run time in seconds, and 'pipeline' (true/false) to start follow-up tasks as soon as a task is finished.",
     )
 
     ## TODO: force_refresh: what should be rerun and to which extend?
@@ -126,3 +126,31 @@ class Run(Resource):
             )
 
         return ret_value.dict(style="result")
+
+
+@ns.route("/<string:run_uuid>")
+@ns.param("run_uuid", "The UUID of the investigator run")
+class RunControl(Resource):
+    @login_required
+    @ns.expect(AuthParser())
+    @ns.response(202, "Cancellation has been requested, the run is stopping.")
+    def delete(self, run_uuid):
+        """
+        Cancel a running investigator run, results obtained so far are kept
+        """
+        try:
+            run_uuid = UUID(run_uuid)
+        except ValueError:
+            raise NotFound
+        # only runs of the user can be cancelled
+        run = InvestigatorRun.query.filter_by(
+            uuid=run_uuid, user_id=current_user.id
+        ).first()
+        if run is None:
+            raise NotFound(
+                "{} not found for user {}".format(run_uuid, current_user.username)
+            )
+        run = controller.cancel_investigator_run(run)
+        if run.run_status in ["running", "initializing", "created"]:
+            return run.dict(), 202
+        return run.dict()
@@ -0,0 +1,129 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+from flask import current_app
+from threading import Lock
+
+
+# uuid of the user task or investigator run executed by the current coroutine
+current_owner = ContextVar("current_owner", default=None)
+
+
+class CancelHandle:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        # reason is set when the execution was cancelled (by user or by deadline)
+        self.reason = None
+
+
+class CancelController:
+    """
+    Keeps track of user tasks and investigator runs executed in this process,
+    and of the tasks (e.g. prerequisites) each of them has started.
+    Every task or run works in its own thread with its own event loop,
+    so cancellation is requested from the Flask thread and delivered
+    into the loop as a normal asyncio cancellation.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        # uuid -> (loop, asyncio task, handle)
+        self.running = {}
+        # uuid of a started task -> uuids of the user tasks and runs executing it
+        self.owners = {}
+
+    @asynccontextmanager
+    async def cancellable(self, uuid, deadline=None):
+        """
+        Registers the current coroutine under uuid.
+        If it is cancelled via cancel() or the deadline (in seconds) passes,
+        CancelledError is swallowed here and handle.reason is set,
+        so the caller could mark everything as stopped.
+        """
+        uuid = str(uuid)
+        loop = asyncio.get_event_loop()
+        task = asyncio.current_task()
+        handle = CancelHandle(uuid)
+
+        with self.lock:
+            self.running[uuid] = (loop, task, handle)
+        token = current_owner.set(uuid)
+
+        timer = None
+        if deadline:
+            timer = loop.call_later(
+                deadline,
+                self._cancel,
+                task,
+                handle,
+                "deadline of {} seconds exceeded".format(deadline),
+            )
+        try:
+            yield handle
+        except asyncio.CancelledError:
+            if handle.reason is None:
+                # not requested by us, e.g. loop shutdown
+                raise
+            current_app.logger.info("%s CANCELLED: %s" % (uuid, handle.reason))
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+        finally:
+            if timer:
+                timer.cancel()
+            current_owner.reset(token)
+            with self.lock:
+                self.running.pop(uuid, None)
+                for task_uuid in [t for t, o in self.owners.items() if uuid in o]:
+                    self.owners[task_uuid].discard(uuid)
+                    if not self.owners[task_uuid]:
+                        del self.owners[task_uuid]
+
+    def add_task(self, task_uuid):
+        """registers a task started by the current user task or run"""
+        owner = current_owner.get()
+        if owner:
+            with self.lock:
+                self.owners.setdefault(str(task_uuid), set()).add(owner)
+
+    def cancel(self, uuid, reason="cancelled by user"):
+        """
+        Can be called from any thread.
+        A task started by another user task or run cancels its owner as a whole,
+        unless other user tasks or runs wait for it too (see is_shared): then nothing is cancelled.
+        Returns False if nothing with this uuid is running in this process.
+        """
+        uuid = str(uuid)
+        with self.lock:
+            entry = self.running.get(uuid)
+            owners = self.owners.get(uuid, set())
+            if entry is None and len(owners) == 1:
+                entry = self.running.get(next(iter(owners)))
+        if not entry:
+            return False
+        loop, task, handle = entry
+        try:
+            loop.call_soon_threadsafe(self._cancel, task, handle, reason)
+        except RuntimeError:
+            # loop is already closed
+            return False
+        return True
+
+    def is_shared(self, uuid):
+        """the task is executed for more than one user task or run"""
+        with self.lock:
+            return len(self.owners.get(str(uuid), ())) > 1
+
+    def is_running(self, uuid):
+        with self.lock:
+            return str(uuid) in self.running or str(uuid) in self.owners
+
+    @staticmethod
+    def _cancel(task, handle, reason):
+        if task.done() or handle.reason:
+            return
+        handle.reason = reason
+        task.cancel()
+
+
+# shared by the controller (cancellation requests) and planners (started tasks)
+cancel_controller = CancelController()
@@ -8,6 +8,11 @@ import threading
 import time
 import asyncio
 from app.main.solr_controller import SolrController
+from app.main.cancel_controller import cancel_controller
+from app import db
+from config import Config
+from datetime import datetime
+from werkzeug.exceptions import Conflict
 
 
 solr_controller = SolrController()
@@ -21,9 +26,10 @@ def execute_task(args):
     """
 
     task_uuid = generate_task(args)
+    deadline = args.get("deadline") or Config.TASK_DEADLINE
 
-    # TODO: allow user to cancel task
     # currently each user query starts  a new thred (why?) and it's impossible to call tasks that are already running
+    # running tasks could be cancelled with cancel_task
     t = threading.Thread(
         target=task_thread,
         args=[
@@ -31,6 +37,7 @@ def execute_task(args):
             current_user.id,
             task_uuid,
             solr_controller,
+            deadline,
         ],
     )
     t.setDaemon(False)
@@ -48,10 +55,46 @@ def execute_task(args):
     return Task.query.filter(Task.uuid == task_uuid).one_or_none()
 
 
-def task_thread(app, user_id, task_uuid, solr_controller):
+def task_thread(app, user_id, task_uuid, solr_controller, deadline=None):
     with app.app_context():
-        planner = TaskPlanner(User.query.get(user_id), solr_controller)
-        asyncio.run(planner.execute_user_task(task_uuid))
+        planner = TaskPlanner(
+            User.query.get(user_id), solr_controller, task_deadline=deadline
+        )
+        asyncio.run(run_user_task(planner, task_uuid, deadline))
+
+
+async def run_user_task(planner, task_uuid, deadline):
+    async with cancel_controller.cancellable(task_uuid, deadline) as handle:
+        # registered before the check: a later cancel_task cancels the execution
+        task = Task.query.filter(Task.uuid == task_uuid).one_or_none()
+        if task is None or task.task_status == "stopped":
+            # cancelled before the thread got here
+            return
+        await planner.execute_user_task(task_uuid)
+    if handle.reason:
+        planner.stop_tasks(handle.reason)
+
+
+def cancel_task(task):
+    """
+    Cancels a running task and all its running prerequisites.
+    A prerequisite started by another user task or investigator run cancels that task or run,
+    a prerequisite of several of them is not cancelled (Conflict).
+    Tasks which are not executed in this process (not started yet, or left after a restart)
+    are simply marked as stopped.
+    """
+    if task.task_status not in ["created", "running"]:
+        return task
+    if cancel_controller.is_shared(task.uuid):
+        raise Conflict(
+            "Task {} is used by other running tasks or runs".format(task.uuid)
+        )
+    if not cancel_controller.cancel(task.uuid):
+        task.task_status = "stopped"
+        task.status_message = "cancelled by user"
+        task.task_finished = datetime.utcnow()
+        db.session.commit()
+    return task
 
 
 def investigator_run(args):
@@ -61,6 +104,7 @@ def investigator_run(args):
     """
 
     run_uuid = generate_investigator_run(args)
+    deadline = args["parameters"].get("deadline") or Config.RUN_DEADLINE
 
     t = threading.Thread(
         target=run_thread,
@@ -70,6 +114,7 @@ def investigator_run(args):
             run_uuid,
             solr_controller,
             args,
+            deadline,
         ],
     )
     t.setDaemon(False)
@@ -86,7 +131,7 @@ def investigator_run(args):
     return InvestigatorRun.query.filter(InvestigatorRun.uuid == run_uuid).one_or_none()
 
 
-def run_thread(app, user_id, run_uuid, solr_controller, user_args):
+def run_thread(app, user_id, run_uuid, solr_controller, user_args, deadline=None):
     with app.app_context():
         planner = TaskPlanner(User.query.get(user_id), solr_controller)
         current_app.logger.debug("USER_ARGS: %s" % user_args)
@@ -112,6 +157,30 @@ def run_thread(app, user_id, run_uuid, solr_controller, user_args):
         else:
             raise NotImplementedError
 
-            
-        asyncio.run(investigator.initialize_run(user_args))
-        asyncio.run(investigator.act())
+
+        asyncio.run(run_investigator(investigator, user_args, deadline))
+
+
+async def run_investigator(investigator, user_args, deadline):
+    # initialization and the main loop share the same event loop,
+    # so the whole run could be cancelled at once
+    async with cancel_controller.cancellable(investigator.run.uuid, deadline) as handle:
+        # registered before the check: a later cancel_investigator_run cancels the run
+        db.session.refresh(investigator.run)
+        if investigator.run.run_status == "stopped":
+            # cancelled before the thread got here
+            return
+        await investigator.initialize_run(user_args)
+        await investigator.act()
+    if handle.reason:
+        await investigator.cancel(handle.reason)
+
+
+def cancel_investigator_run(run):
+    if run.run_status not in ["created", "initializing", "running"]:
+        return run
+    if not cancel_controller.cancel(run.uuid):
+        run.run_status = "stopped"
+        run.run_finished = datetime.utcnow()
+        db.session.commit()
+    return run
@@ -1,9 +1,12 @@
 from app import db, analysis
-from app.utils.db_utils import generate_task, store_results
+from app.utils.db_utils import async_generate_task, find_fingerprint_result
+from app.main.scheduler import TaskScheduler
+from app.main.cancel_controller import cancel_controller
 from app.models import Task, Processor
 from datetime import datetime
 from flask import current_app
 import asyncio
+import time
 from app.investigator.investigator import Investigator
 import warnings
 from config import Config
@@ -11,42 +14,68 @@ import random
 from copy import copy
 
 class TaskPlanner(object):
-    def __init__(self, user, solr_controller):
+    def __init__(self, user, solr_controller, task_deadline=None):
         self.user = user
         self.solr_controller = solr_controller
+        # seconds for a single processor, the user deadline for user tasks
+        self.task_deadline = task_deadline or Config.TASK_DEADLINE
+        # tasks started by this planner, to stop them if execution is cancelled
+        self.started_tasks = []
+        self.processor_classes = {}
+        # coroutine function (task, seconds) awaited when a task is executed successfully,
+        # the investigator uses it to learn processor costs
+        self.on_duration = None
+        # one scheduler for all tasks of this planner, so concurrently executed
+        # batches (pipelined investigator) share prerequisites
+        self.scheduler = TaskScheduler(self)
 
     async def execute_user_task(self, task_uuid=None):
         task = Task.query.filter(Task.uuid == task_uuid).all()
         # .all() returns a list
         await self.execute_and_store_tasks(task)
 
-    async def async_analysis(self, tasks):
-        """ Generate asyncio tasks and run them, returning when all tasks are done"""
-        # generates coroutines out of task objects
-
-        async_tasks = []
-        for task in tasks:
-            # importing processor using its name and import path stored in the database and linked to the task
-            # currently all processors are from this package so it would be possible to import them directly
-            # in the future it is possible that we use another processing package,
-            # which would need to register its processors in the database and then they will be imported
-            # so, planner doesn't need to know import path beforehand and imports it during runtime
-            Processor = getattr(
+    def get_processor(self, task):
+        # importing processor using its name and import path stored in the database and linked to the task
+        # currently all processors are from this package so it would be possible to import them directly
+        # in the future it is possible that we use another processing package,
+        # which would need to register its processors in the database and then they will be imported
+        # so, planner doesn't need to know import path beforehand and imports it during runtime
+        # classes are imported once per planner; instances keep task state, so one per task
+        key = (task.processor.import_path, task.processor.name)
+        if key not in self.processor_classes:
+            self.processor_classes[key] = getattr(
                 __import__(task.processor.import_path, fromlist=[task.processor.name]),
                 task.processor.name,
             )
-            processor = Processor(solr_controller=self.solr_controller)
-
-            async_tasks.append(processor(task))
+        return self.processor_classes[key](solr_controller=self.solr_controller)
+
+    async def run_processor(self, task):
+        """
+        Runs the processor for a single task and returns its result *or* exception if the task fails
+        """
+        processor = self.get_processor(task)
+        try:
+            started = time.monotonic()
+            # a task running longer than its deadline is cancelled,
+            # asyncio.TimeoutError is stored as its result
+            result = await asyncio.wait_for(processor(task), timeout=self.task_deadline)
+            if self.on_duration:
+                await self.on_duration(task, time.monotonic() - started)
+            return result
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError as e:
+            return e
+        except Exception as e:
+            if current_app.debug:
+                raise
+            return e
 
-        # current_app.logger.debug("ASYNC_TASKS: %s" %async_tasks)
+    async def async_analysis(self, tasks):
+        """ Generate asyncio tasks and run them, returning when all tasks are done"""
         # here tasks are actually executed asynchronously
         # returns list of results *or* exceptions if a task fail
-        results = await asyncio.gather(
-            *async_tasks, return_exceptions=(not current_app.debug)
-        )
-
-        #        current_app.logger.debug("RESULTS:%s" %results)
+        results = await asyncio.gather(*[self.run_processor(task) for task in tasks])
 
         for t in tasks:
             current_app.logger.info(
@@ -54,61 +83,42 @@ class TaskPlanner(object):
             )
         return results
 
-    async def execute_and_store_tasks(self, tasks):
-        """ this function ensures parallelization task execution"""
-
-        await asyncio.gather(*[self.execute_and_store(task) for task in tasks])
+    async def execute_and_store_tasks(self, tasks, on_finished=None):
+        """
+        Executes tasks and their prerequisites in parallel.
+        Shared prerequisites are executed once, also when needed by batches executed
+        at the same time, results are stored as soon as they are ready.
+        on_finished(task) is called for every executed task, right after its result is stored.
+        """
+        await self.scheduler.execute(tasks, on_finished)
 
     def result_exists(self, task):
         # ToDo: Add timeouts for the results: timestamps are already stored, simply rerun the query if the timestamp
         ##  is too old.
-        if task.dataset_id:
-            related_tasks = Task.query.filter(
-                Task.processor_id == task.processor_id,
-                Task.parameters == task.parameters,
-                Task.dataset_id == task.dataset_id,
-                Task.task_status == "finished",
-                Task.task_results is not None,
-            ).all()
-            for alias in task.dataset.aliases:
-                related_tasks.extend(
-                    Task.query.filter(
-                        Task.processor_id == task.processor_id,
-                        Task.parameters == task.parameters,
-                        Task.dataset_id == alias.id,
-                        Task.task_status == "finished",
-                        Task.task_results is not None,
-                    ).all()
-                )
-        else:
-            related_tasks = Task.query.filter(
-                Task.processor_id == task.processor_id,
-                Task.parameters == task.parameters,
-                Task.solr_query_id == task.solr_query_id,
-                Task.task_status == "finished",
-                Task.task_results is not None,
-            ).all()
-        #current_app.logger.debug("RELATED_TASKS: %s" %related_tasks)
-        related_tasks = [
-            rt
-            for rt in sorted(related_tasks, key=lambda t: t.task_finished)
-            if rt.task_result is not None
-            and rt.task_result.result
-            and not rt.processor.deprecated
-            and rt.parents == task.parents
-        ]
-        if not related_tasks:
+        # tasks with the same processor, parameters, input data (or its aliases) and parents
+        # share a fingerprint, a single lookup finds the latest result
+        result = find_fingerprint_result(task)
+        if result is None or not result.result:
             return
-        result = related_tasks[-1].task_result
-        task.task_results.append(result)
+        if result not in task.task_results:
+            task.task_results.append(result)
         return True
 
     async def execute_and_store(self, task):
         """this function executes one task and its prerequisites"""
+        await self.execute_and_store_tasks([task])
+        return task
 
-        # TODO: delay estimates: based on old runtime history for similar tasks?
+    def prepare_task(self, task):
+        """
+        Marks the task as started and tries to reuse an existing result.
+        Returns True if the task does not need to be executed.
+        """
 
         task.task_started = datetime.utcnow()
+        self.started_tasks.append(task)
+        # cancelling this task cancels the user task or run executing it
+        cancel_controller.add_task(task.uuid)
         # to update data obtained in previous searches
 
         # current_app.logger.debug("FORCE_REFRESH %s" % task.force_refresh)
@@ -130,24 +140,16 @@ class TaskPlanner(object):
 
         db.session.commit()
 
-        if task.task_status == "finished":
-            return task
-
-        required_tasks = await self.get_prerequisite_tasks(task)
-
-        current_app.logger.debug("REQUIRED_TASKS: %s" % required_tasks)
-
-        if required_tasks:
-            tasks_to_execute = [t for t in required_tasks if not t.task_result]
-            await self.execute_and_store_tasks(tasks_to_execute)
-            db.session.commit()
+        return task.task_status == "finished"
 
-        # waiting for tasks to be done
-        # calls main processing function
-        analysis_results = await self.async_analysis([task])
-        # store in the database
-        store_results([task], analysis_results)
-        return task
+    def stop_tasks(self, reason):
+        """marks tasks that were started but not finished as stopped"""
+        for task in self.started_tasks:
+            if task.task_status in ["created", "running"]:
+                task.task_status = "stopped"
+                task.status_message = reason[:255]
+                task.task_finished = datetime.utcnow()
+        db.session.commit()
 
     @staticmethod
     def get_source_utility(utility):
@@ -170,7 +172,12 @@ class TaskPlanner(object):
                 source_utility = source_utilities[0]
         return source_utility
 
-    async def get_prerequisite_tasks(self, task):
+    async def get_prerequisite_tasks(self, task, generated=None):
+        """
+        Returns parent tasks, generating a source task if the task has no parents.
+        generated: dictionary of already generated source tasks, these are reused
+        for tasks with the same input, so the source task is executed only once
+        """
         current_app.logger.debug(
             "task.processor.input_type: %s" % task.processor.input_type
         )
@@ -196,19 +203,30 @@ class TaskPlanner(object):
                 input_tasks.append(input_task)
 
         else:
-            task_parameters = {
-                "processor": self.get_source_processor(task),
-                "parameters": {},
-                "search_query": task.solr_query.search_query
-                if task.solr_query
-                else None,
-                "dataset": task.dataset,
-                "force_refresh": task.force_refresh,
-            }
-
-            input_task = generate_task(
-                query=task_parameters, user=task.user, return_task=True,
+            key = (
+                task.processor.input_type,
+                task.dataset_id,
+                task.solr_query_id,
+                task.force_refresh,
             )
+            if generated is not None and key in generated:
+                input_task = generated[key]
+            else:
+                task_parameters = {
+                    "processor": self.get_source_processor(task),
+                    "parameters": {},
+                    "search_query": task.solr_query.search_query
+                    if task.solr_query
+                    else None,
+                    "dataset": task.dataset,
+                    "force_refresh": task.force_refresh,
+                }
+
+                input_task = await async_generate_task(
+                    query=task_parameters, user=task.user, return_task=True,
+                )
+                if generated is not None:
+                    generated[key] = input_task
 
             task.parents.append(input_task)
             input_tasks.append(input_task)
@@ -0,0 +1,153 @@
+import asyncio
+from collections import defaultdict
+from flask import current_app
+from app.utils.db_utils import store_results
+from config import Config
+
+
+class TaskScheduler:
+    """
+    Executes sets of tasks together with their prerequisites.
+
+    Tasks and prerequisites form a DAG: a prerequisite shared by several tasks
+    is executed only once, a task is started as soon as all its prerequisites
+    are done, at most max_running tasks of each set are executed at the same time,
+    and each result is stored as soon as its task is finished.
+    One scheduler is used for a whole run (see TaskPlanner): sets executed concurrently
+    share executions, so a task needed by two sets is executed once.
+    """
+
+    def __init__(self, planner, max_running=Config.PLANNER_MAX_RUNNING_TASKS):
+        self.planner = planner
+        self.max_running = max_running
+        # source tasks generated for tasks without parents, shared between tasks
+        self.generated = {}
+        # task.id -> future of its execution (running or done) by any set
+        self.executions = {}
+
+    async def execute(self, tasks, on_finished=None):
+        """on_finished(task) is called after the result of each executed task is stored"""
+        graph = await self.expand(tasks)
+        order = self.topological_order(graph)
+        await self.run(graph, order, on_finished)
+
+    async def expand(self, tasks):
+        """
+        Walks from the given tasks to their prerequisites.
+        Tasks which have results already (or can reuse an existing result) are not added to the graph,
+        tasks executed by another set are added without their prerequisites.
+        Returns the graph: nodes (task.id -> task), parents and children (task.id -> set of ids).
+        """
+        nodes = {}
+        # task.id -> ids of prerequisites which should be executed before the task
+        parents = {}
+        children = defaultdict(set)
+        queue = list(tasks)
+        seen = set()
+        while queue:
+            task = queue.pop(0)
+            if task.id in seen:
+                continue
+            seen.add(task.id)
+
+            if task.id in self.executions:
+                nodes[task.id] = task
+                parents[task.id] = set()
+                continue
+
+            if self.planner.prepare_task(task):
+                continue
+
+            nodes[task.id] = task
+            parents[task.id] = set()
+
+            required_tasks = await self.planner.get_prerequisite_tasks(
+                task, generated=self.generated
+            )
+            current_app.logger.debug("REQUIRED_TASKS: %s" % required_tasks)
+
+            for parent in required_tasks or []:
+                if parent.task_result:
+                    continue
+                parents[task.id].add(parent.id)
+                children[parent.id].add(task.id)
+                queue.append(parent)
+
+        # parents which were found to be done while expanding
+        for task_id in parents:
+            parents[task_id] = {p for p in parents[task_id] if p in nodes}
+        return nodes, parents, children
+
+    @staticmethod
+    def topological_order(graph):
+        nodes, parents, children = graph
+        remaining = {task_id: len(p) for task_id, p in parents.items()}
+        order = [task_id for task_id in nodes if remaining[task_id] == 0]
+        i = 0
+        while i < len(order):
+            for child in children[order[i]]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    order.append(child)
+            i += 1
+        if len(order) < len(nodes):
+            raise ValueError(
+                "Cycle in task prerequisites: %s"
+                % [nodes[t].uuid for t in nodes if remaining[t] > 0]
+            )
+        return order
+
+    async def execute_task(self, task):
+        result = await self.planner.run_processor(task)
+        current_app.logger.info(
+            "%s:%s finished, returning results" % (task.processor, task.uuid)
+        )
+        store_results([task], [result], deadline=self.planner.task_deadline)
+
+    def start(self, task):
+        """
+        Starts the task, or joins its execution by another set.
+        Returns a future that can be cancelled without cancelling executions of other sets.
+        """
+        execution = self.executions.get(task.id)
+        if execution is None:
+            execution = self.executions[task.id] = asyncio.ensure_future(
+                self.execute_task(task)
+            )
+            return execution
+        return asyncio.shield(execution)
+
+    async def run(self, graph, order, on_finished=None):
+        nodes, parents, children = graph
+        position = {task_id: i for i, task_id in enumerate(order)}
+        remaining = {task_id: len(p) for task_id, p in parents.items()}
+        ready = [task_id for task_id in order if remaining[task_id] == 0]
+        running = {}
+        try:
+            while ready or running:
+                while ready and len(running) < self.max_running:
+                    task = nodes[ready.pop(0)]
+                    running[self.start(task)] = task
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    task = running.pop(future)
+                    # raises if storing failed
+                    future.result()
+                    if on_finished:
+                        on_finished(task)
+
+                    for child in sorted(children[task.id], key=position.get):
+                        if child not in remaining:
+                            continue
+                        remaining[child] -= 1
+                        if remaining[child] == 0:
+                            ready.append(child)
+        finally:
+            # cancelled or failed in debug mode: do not leave orphan tasks behind
+            for future in running:
+                future.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
@@ -18,6 +18,7 @@ class SolrController:
 
     @asynccontextmanager
     async def acquire_session(self):
+        session = None
         try:
             with self.lock:
                 self.global_counter += 1
@@ -41,7 +42,9 @@ class SolrController:
             raise e
         finally:
             current_app.logger.debug("FINALLY: %s" % self.session_no)
-            await self.release_session(session)
+            # session is None if we were cancelled while waiting for a free slot
+            if session is not None:
+                await self.release_session(session)
 
     async def release_session(self, session):
         await session.close()
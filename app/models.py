@@ -76,6 +76,8 @@ class Dataset(db.Model):
     )
     documents = db.relationship("DocumentDatasetRelation", back_populates="dataset")
     hash_value = db.Column(db.String(255), nullable=False)
+    # sha256 of sorted solr ids of the documents, datasets with the same content are aliases
+    content_hash = db.Column(db.String(64), index=True)
     created_on = db.Column(db.DateTime, default=datetime.utcnow)
     tasks = db.relationship("Task", back_populates="dataset")
   
@@ -256,6 +258,10 @@ class Task(db.Model):
     task_started = db.Column(db.DateTime, default=datetime.utcnow)
     task_finished = db.Column(db.DateTime)
 
+    # hash of processor, parameters, input data and parent fingerprints, see db_utils.task_fingerprint
+    # tasks with the same fingerprint produce the same result
+    fingerprint = db.Column(db.String(64), index=True)
+
     # if we need to run a task once again we make a copy of task
     # and add an additional relation to Result table
     # results contain data and can be heavy while tasks contain only parameters and should be light
@@ -421,6 +427,47 @@ class Task(db.Model):
         return parent_uuids
 
 
+class TaskTiming(db.Model):
+    """
+    Measured running time of an executed task, used by the investigator to learn processor costs
+    """
+
+    __tablename__ = "task_timing"
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey("task.id"))
+    processor_name = db.Column(db.String(255), nullable=False, index=True)
+    # collection features, None if unknown
+    collection_size = db.Column(db.Integer)
+    language = db.Column(db.String(255))
+    # seconds
+    duration = db.Column(db.Float, nullable=False)
+    recorded = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return "<TaskTiming processor: {} size: {} language: {} duration: {}>".format(
+            self.processor_name, self.collection_size, self.language, self.duration
+        )
+
+
+class ResultFingerprint(db.Model):
+    """
+    Latest non-empty result for each task fingerprint, used to reuse results across tasks and runs
+    """
+
+    __tablename__ = "result_fingerprint"
+    fingerprint = db.Column(db.String(64), primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey("task.id"), nullable=False)
+    task = db.relationship("Task", foreign_keys=[task_id])
+    result_id = db.Column(db.Integer, db.ForeignKey("result.id"), nullable=False)
+    result = db.relationship("Result", foreign_keys=[result_id])
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return "<ResultFingerprint {} task: {} result: {}>".format(
+            self.fingerprint, self.task_id, self.result_id
+        )
+
+
 class Result(db.Model):
     # ??? do we need uuids for results (separately from task uuids)
     __tablename__ = "result"
@@ -1,22 +1,20 @@
 from flask import current_app
-from app.models import Task, InvestigatorRun
+from app.models import Task, InvestigatorRun, Dataset, Document, DocumentDatasetRelation
 from app import db
+from app.utils.dataset_utils import get_content_hash
 
 def update_status(app):
     with app.app_context():
         current_app.logger.info("Updating status")
 
-        tasks = Task.query.filter_by(task_status="running").all()
-        for task in tasks:
-            task.task_status = "stopped"
+        # bulk updates: loading Task rows would select columns
+        # which are not there before "flask db upgrade"
+        for status in ["running", "created"]:
+            count = Task.query.filter_by(task_status=status).update(
+                {Task.task_status: "stopped"}, synchronize_session=False
+            )
             db.session.commit()
-        current_app.logger.info("%s running tasks updated to stopped" %len(tasks))
-            
-        tasks = Task.query.filter_by(task_status="created").all()
-        for task in tasks:
-            task.task_status = "stopped"
-            db.session.commit()
-        current_app.logger.info("%s created tasks updated to stopped" %len(tasks))
+            current_app.logger.info("%s %s tasks updated to stopped" % (count, status))
             
         runs = InvestigatorRun.query.filter_by(run_status="running").all()
         for run in runs:
@@ -35,4 +33,54 @@ def update_status(app):
             run.run_status = "stopped"
             db.session.commit()
         current_app.logger.info("%s initializing runs updated to stopped" %len(runs))
-        
+
+
+def index_datasets(app):
+    """
+    Content hashes for datasets stored before content hashes were introduced.
+    Fingerprints of their tasks are recomputed by index_results.
+    Run once after the upgrade: flask index-datasets
+    """
+    with app.app_context():
+        datasets = Dataset.query.filter(Dataset.content_hash.is_(None)).all()
+        for dataset in datasets:
+            solr_ids = [
+                solr_id
+                for (solr_id,) in db.session.query(Document.solr_id)
+                .join(DocumentDatasetRelation)
+                .filter(DocumentDatasetRelation.dataset_id == dataset.id)
+            ]
+            dataset.content_hash = get_content_hash(solr_ids)
+            Task.query.filter(Task.dataset_id == dataset.id).update(
+                {Task.fingerprint: None}, synchronize_session=False
+            )
+            db.session.commit()
+        current_app.logger.info("%s datasets hashed" % len(datasets))
+        return len(datasets)
+
+
+def index_results(app, batch_size=1000):
+    """
+    Fingerprints for tasks stored before fingerprints were introduced,
+    so their results could be reused. Run once after the upgrade: flask index-results
+    """
+    # db_utils imports the analysis package, which imports app.utils
+    from app.utils.db_utils import task_fingerprint, register_fingerprint
+
+    with app.app_context():
+        tasks = (
+            Task.query.filter(Task.fingerprint.is_(None), Task.task_status == "finished")
+            .order_by(Task.task_finished)
+            .all()
+        )
+        for i, task in enumerate(tasks):
+            task.fingerprint = task_fingerprint(task)
+            results = [r for r in task.task_results if r and r.result]
+            if results and not task.processor.deprecated:
+                # ordered by task_finished, the latest result wins
+                register_fingerprint(task, results[-1])
+            if i % batch_size == batch_size - 1:
+                db.session.commit()
+        db.session.commit()
+        current_app.logger.info("%s finished tasks fingerprinted" % len(tasks))
+        return len(tasks)
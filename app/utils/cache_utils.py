@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import time
+from config import Config
+
+
+class PersistentCache:
+    """
+    Key-value cache stored in an SQLite file in Config.CACHE_DIR,
+    shared between threads and worker processes and kept across restarts.
+    Keys and values are anything JSON-serializable.
+    Least recently used entries are evicted when there are more than max_entries.
+    """
+
+    def __init__(self, name, max_entries):
+        os.makedirs(Config.CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(Config.CACHE_DIR, name + ".sqlite")
+        self.max_entries = max_entries
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, used REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+
+    def connect(self):
+        # a connection per call: sqlite3 connections cannot be shared between threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(key):
+        return json.dumps(key, sort_keys=True)
+
+    def get_many(self, keys):
+        """returns key -> value for keys found in the cache"""
+        found = {}
+        if not keys:
+            return found
+        db_keys = {self.make_key(key): key for key in keys}
+        with self.connect() as connection:
+            db_key_list = list(db_keys)
+            # SQLite limits the number of variables in a query
+            for i in range(0, len(db_key_list), 500):
+                chunk = db_key_list[i : i + 500]
+                rows = connection.execute(
+                    "SELECT key, value FROM cache WHERE key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                ).fetchall()
+                for db_key, value in rows:
+                    found[db_keys[db_key]] = json.loads(value)
+                connection.executemany(
+                    "UPDATE cache SET used = ? WHERE key = ?",
+                    [(time.time(), db_key) for db_key, _ in rows],
+                )
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items):
+        """items: list of (key, value) pairs"""
+        if not items:
+            return
+        now = time.time()
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, used) VALUES (?, ?, ?)",
+                [(self.make_key(key), json.dumps(value), now) for key, value in items],
+            )
+            (count,) = connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
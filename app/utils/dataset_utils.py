@@ -1,14 +1,27 @@
 from werkzeug.exceptions import BadRequest
 from config import Config
 import requests
+import aiohttp
+import asyncio
 import os
 from werkzeug.exceptions import BadRequest, NotFound
 from app.models import Dataset, Document, DocumentDatasetRelation
 from app import db
+from sqlalchemy.dialects.postgresql import insert
 from flask import current_app
 import json
+import hashlib
+import jwt
+import time
+from threading import Lock
 
-def get_dataset(dataset):
+# Two clients for the dataset platform:
+# blocking functions (get_dataset etc.) for Flask request handlers
+# and async_* coroutines for processors and the investigator,
+# which should not block the event loop
+
+
+def find_dataset(dataset):
     #current_app.logger.debug("DATASET!!!!!!: %s type: %s" %(dataset, type(dataset)))
     if isinstance(dataset, Dataset):
         dataset_name, user = dataset.dataset_name, dataset.user
@@ -17,6 +30,11 @@ def get_dataset(dataset):
         dataset = Dataset.query.filter_by(
             dataset_name=dataset_name, user=user
         ).one_or_none()
+    return dataset_name, user, dataset
+
+
+def get_dataset(dataset):
+    dataset_name, user, dataset = find_dataset(dataset)
    
     if not dataset or (not user == "PRA" and not uptodate(dataset)):
         current_app.logger.info("REQUESTING NEW DATASET!!!")
@@ -26,18 +44,88 @@ def get_dataset(dataset):
     return Dataset.query.filter_by(dataset_name=dataset_name).first()
 
 
-def get_token():
-    # TODO get token once and require only in case of authentication error
-    url = os.path.join(Config.DATASET_URI, "authenticate")
-    payload = json.dumps(
-        {"email": Config.DATASET_EMAIL, "password": Config.DATASET_PASSWORD}
-    )
-    headers = {"content-type": "application/json"}
-    response = requests.request(
-        "POST", url, data=payload, headers=headers, verify=False
-    )
-    token = response.json()["auth_token"]
-    return "JWT " + token
+async def async_get_dataset(dataset):
+    dataset_name, user, dataset = find_dataset(dataset)
+    if user == "PRA":
+        # made by the investigator, nothing to request
+        if dataset:
+            return dataset
+        raise NotFound("Dataset {} is not found for {}".format(dataset_name, user))
+
+    timeout = aiohttp.ClientTimeout(total=Config.DATASET_REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        # also fills the cache used by make_dataset
+        hash_value = await async_get_hash_value(session, dataset_name, user)
+        if dataset and dataset.hash_value == hash_value:
+            return dataset
+        current_app.logger.info("REQUESTING NEW DATASET!!!")
+        status, document_list = await async_platform_request(
+            session,
+            "get_dataset_content",
+            {"email": user, "dataset_name": dataset_name},
+        )
+    if status == 404:
+        raise NotFound("Dataset {} is not found for {}".format(dataset_name, user))
+    make_dataset(dataset_name, user, document_list)
+    return Dataset.query.filter_by(dataset_name=dataset_name).first()
+
+
+# connections to the dataset platform are reused between requests
+platform_session = requests.Session()
+platform_session.verify = False
+
+token_lock = Lock()
+token_cache = {"token": None, "expires": 0}
+
+# user -> (time, list of [dataset_name, hash_value])
+dataset_lists = {}
+dataset_lists_lock = Lock()
+
+
+def get_token(refresh=False):
+    """
+    Authenticates once and reuses the token until it is about to expire
+    or the platform rejects it (refresh=True)
+    """
+    with token_lock:
+        if (
+            refresh
+            or not token_cache["token"]
+            or time.time() > token_cache["expires"] - Config.DATASET_TOKEN_MARGIN
+        ):
+            url = os.path.join(Config.DATASET_URI, "authenticate")
+            payload = json.dumps(
+                {"email": Config.DATASET_EMAIL, "password": Config.DATASET_PASSWORD}
+            )
+            headers = {"content-type": "application/json"}
+            response = platform_session.post(url, data=payload, headers=headers)
+            token = response.json()["auth_token"]
+            token_cache["token"] = "JWT " + token
+            token_cache["expires"] = token_expires(token)
+        return token_cache["token"]
+
+
+def token_expires(token):
+    try:
+        # the signature is checked by the platform, we only need the expiration time
+        return jwt.decode(token, verify=False)["exp"]
+    except (jwt.exceptions.DecodeError, KeyError):
+        return time.time() + Config.DATASET_TOKEN_TTL
+
+
+def platform_request(endpoint, payload):
+    """POST to the dataset platform, re-authenticates once if the token is rejected"""
+    url = os.path.join(Config.DATASET_URI, endpoint)
+    data = json.dumps(payload)
+    current_app.logger.debug("PAYLOAD: %s" %data)
+    headers = {"content-type": "application/json", "authorization": get_token()}
+    response = platform_session.post(url, data=data, headers=headers)
+    if response.status_code == 401:
+        headers["authorization"] = get_token(refresh=True)
+        response = platform_session.post(url, data=data, headers=headers)
+        if response.status_code == 401:
+            raise BadRequest("Dataset platform rejected the token")
+    return response
 
 
 def uptodate(dataset):
@@ -46,30 +134,123 @@ def uptodate(dataset):
     return dataset.hash_value == new_hash_value 
 
 
-def get_hash_value(dataset_name, user):
-    url = os.path.join(Config.DATASET_URI, "list_datasets")
-    payload = json.dumps({"email": user})
-    headers = {"content-type": "application/json", "authorization": get_token()}
-    response = requests.request(
-        "POST", url, data=payload, headers=headers, verify=False
+async def async_get_token(session, refresh=False):
+    with token_lock:
+        if (
+            not refresh
+            and token_cache["token"]
+            and time.time() < token_cache["expires"] - Config.DATASET_TOKEN_MARGIN
+        ):
+            return token_cache["token"]
+    url = os.path.join(Config.DATASET_URI, "authenticate")
+    payload = {"email": Config.DATASET_EMAIL, "password": Config.DATASET_PASSWORD}
+    async with session.post(url, json=payload, ssl=False) as response:
+        token = (await response.json(content_type=None))["auth_token"]
+    with token_lock:
+        token_cache["token"] = "JWT " + token
+        token_cache["expires"] = token_expires(token)
+        return token_cache["token"]
+
+
+async def async_platform_request(session, endpoint, payload):
+    """
+    POST to the dataset platform, returns status and parsed JSON.
+    Timeouts, connection errors and server errors are retried with a growing delay,
+    a rejected token is refreshed once.
+    """
+    url = os.path.join(Config.DATASET_URI, endpoint)
+    refresh = False
+    error = None
+    for attempt in range(Config.DATASET_REQUEST_RETRIES):
+        if attempt:
+            await asyncio.sleep(2 ** attempt)
+        try:
+            headers = {"authorization": await async_get_token(session, refresh)}
+            async with session.post(
+                url, json=payload, headers=headers, ssl=False
+            ) as response:
+                if response.status == 401:
+                    error = BadRequest("Dataset platform rejected the token")
+                    if refresh:
+                        # rejected also after the refresh
+                        raise error
+                    refresh = True
+                    continue
+                if response.status >= 500:
+                    error = aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                    )
+                    current_app.logger.warning("%s: %s" % (url, error))
+                    continue
+                if response.status == 404:
+                    return response.status, None
+                return response.status, await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+            current_app.logger.warning(
+                "%s attempt %d failed: %r" % (url, attempt + 1, e)
+            )
+    raise error
+
+
+async def async_list_datasets(session, user, refresh=False):
+    with dataset_lists_lock:
+        cached = dataset_lists.get(user)
+    if cached and not refresh and time.time() - cached[0] < Config.DATASET_LIST_TTL:
+        return cached[1]
+    status, datasets = await async_platform_request(
+        session, "list_datasets", {"email": user}
     )
-    current_app.logger.debug("PAYLOAD: %s" %payload)
-    current_app.logger.debug("RESPONSE: %s" %response)
-    for d in response.json():
-        if d[0] == dataset_name:
-            return str(d[1])
+    if status != 200:
+        # not cached, e.g. an error payload
+        current_app.logger.warning("list_datasets %s: %s %s" % (user, status, datasets))
+        return None
+    with dataset_lists_lock:
+        dataset_lists[user] = (time.time(), datasets)
+    return datasets
+
+
+async def async_get_hash_value(session, dataset_name, user):
+    for refresh in [False, True]:
+        for d in await async_list_datasets(session, user, refresh=refresh) or []:
+            if d[0] == dataset_name:
+                return str(d[1])
     raise BadRequest("Dataset {} does not exist for {}".format(dataset_name, user))
 
 
-def request_dataset(dataset_name, user):
-    url = os.path.join(Config.DATASET_URI, "get_dataset_content")
-    payload = json.dumps({"email": user, "dataset_name": dataset_name})
+def list_datasets(user, refresh=False):
+    with dataset_lists_lock:
+        cached = dataset_lists.get(user)
+    if cached and not refresh and time.time() - cached[0] < Config.DATASET_LIST_TTL:
+        return cached[1]
+    response = platform_request("list_datasets", {"email": user})
+    current_app.logger.debug("RESPONSE: %s" %response)
+    if response.status_code != 200:
+        # not cached, e.g. an error payload
+        current_app.logger.warning(
+            "list_datasets %s: %s %s" % (user, response.status_code, response.text)
+        )
+        return None
+    datasets = response.json()
+    with dataset_lists_lock:
+        dataset_lists[user] = (time.time(), datasets)
+    return datasets
+
+
+def get_hash_value(dataset_name, user):
+    for refresh in [False, True]:
+        for d in list_datasets(user, refresh=refresh) or []:
+            if d[0] == dataset_name:
+                return str(d[1])
+        # the dataset could have been created after the list was cached
+    raise BadRequest("Dataset {} does not exist for {}".format(dataset_name, user))
 
-    headers = {"content-type": "application/json", "authorization": get_token()}
-    current_app.logger.debug("PAYLOAD: %s" %payload)
 
-    response = requests.request(
-        "POST", url, data=payload, headers=headers, verify=False
+def request_dataset(dataset_name, user):
+    response = platform_request(
+        "get_dataset_content", {"email": user, "dataset_name": dataset_name}
     )
     current_app.logger.debug("REQUEST_DATASET RESPONSE: %s" %response)
     if response.status_code is 404:
@@ -93,44 +274,93 @@ def make_dataset(dataset_name, user, document_list):
         current_app.logger.debug("else: %s" % dataset)
         db.session.add(dataset)
     
-    db.session.commit()
+    # everything below is a single transaction, flush to get dataset.id
+    db.session.flush()
     current_app.logger.debug("made_dataset: %s" %dataset)
-    relations = []
+
+    # solr_id -> relevance
+    relevance = {}
     for d in document_list:
         if d["type"] != "article":
             # TODO: add all documents from these issues?
             # for now: skip
             continue
-        document = get_document(d["id"])
-        relations.append(
-            DocumentDatasetRelation(
-                dataset_id=dataset.id, document_id=document.id, relevance=d["relevancy"]
-            )
-        )
-    db.session.add_all(relations)
+        relevance[d["id"]] = d["relevancy"]
+
+    document_ids = get_documents(list(relevance))
+    relations = [
+        {
+            "dataset_id": dataset.id,
+            "document_id": document_ids[solr_id],
+            "relevance": r,
+        }
+        for solr_id, r in relevance.items()
+    ]
+    if relations:
+        db.session.execute(DocumentDatasetRelation.__table__.insert(), relations)
+    dataset.content_hash = get_content_hash(relevance.keys())
     db.session.commit()
+    current_app.logger.info(
+        "DATASET %s: %d documents stored" % (dataset_name, len(relations))
+    )
 
     make_aliases(dataset)
 
+
+def get_content_hash(solr_ids):
+    """canonical hash of a set of documents"""
+    return hashlib.sha256(
+        "\n".join(sorted(set(solr_ids))).encode("utf-8")
+    ).hexdigest()
+
     
 def make_aliases(dataset):
-    # TODO: copy aliases once one dataset is found
-    document_ids = set([d.document_id for d in dataset.documents])
-    all_datasets = Dataset.query.all()
+    # datasets with the same documents have the same content hash
+    alias_datasets = Dataset.query.filter(
+        Dataset.content_hash == dataset.content_hash, Dataset.id != dataset.id
+    ).all()
 
-    for alias_dataset in all_datasets:
-        if alias_dataset.id == dataset.id:
-            continue
-        alias_doc_ids = set([d.document_id for d in alias_dataset.documents])
-        if alias_doc_ids == document_ids:
-            dataset.aliases.append(alias_dataset)
-            if not dataset.id in alias_dataset.aliases:
-               alias_dataset.aliases.append(dataset)
-        
-    db.session.commit()               
+    # content may have changed since aliases were made
+    for alias_dataset in dataset.aliases:
+        if alias_dataset not in alias_datasets and dataset in alias_dataset.aliases:
+            alias_dataset.aliases.remove(dataset)
+    dataset.aliases = alias_datasets
+
+    for alias_dataset in alias_datasets:
+        if dataset not in alias_dataset.aliases:
+            alias_dataset.aliases.append(dataset)
+
+    db.session.commit()
     
 
 
+def get_documents(solr_ids):
+    """
+    Bulk version of get_document: inserts missing documents
+    and returns solr_id -> document.id, without committing
+    """
+    document_ids = {}
+    chunk_size = Config.DATASET_INSERT_CHUNK
+    for i in range(0, len(solr_ids), chunk_size):
+        chunk = solr_ids[i : i + chunk_size]
+        inserted = db.session.execute(
+            insert(Document.__table__)
+            .values([{"solr_id": solr_id} for solr_id in chunk])
+            .on_conflict_do_nothing(constraint="uniq_solr_id")
+            .returning(Document.__table__.c.solr_id, Document.__table__.c.id)
+        )
+        document_ids.update(inserted)
+        # documents which already existed are not returned by the insert
+        existing = [solr_id for solr_id in chunk if solr_id not in document_ids]
+        if existing:
+            document_ids.update(
+                db.session.query(Document.solr_id, Document.id).filter(
+                    Document.solr_id.in_(existing)
+                )
+            )
+    return document_ids
+
+
 def get_document(document_id):
     document = Document.query.filter_by(solr_id=document_id).one_or_none()
     if not document:
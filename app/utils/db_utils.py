@@ -1,4 +1,7 @@
 import uuid
+import asyncio
+import json
+import hashlib
 from flask import current_app
 from sqlalchemy.exc import IntegrityError
 from flask_login import current_user
@@ -11,10 +14,11 @@ from app.models import (
     SolrQuery,
     InvestigatorRun,
     InvestigatorResult,
+    ResultFingerprint,
 )
 from datetime import datetime
 from werkzeug.exceptions import BadRequest
-from app.utils.dataset_utils import get_hash_value, get_dataset
+from app.utils.dataset_utils import get_hash_value, get_dataset, async_get_dataset
 from config import Config
 
 def verify_data(args):
@@ -125,11 +129,15 @@ def check_uuid_and_commit(database_record, max_try=5):
         raise error
 
 
-def generate_task(query, user=current_user, parent_id=None, return_task=False):
+def generate_task(
+    query, user=current_user, parent_id=None, return_task=False, dataset=None
+):
     """
     turns queries into Task objects
     stores them in the database
     returns task objects or task ids
+    dataset: the Dataset of query["dataset"], if it is already up to date
+    (otherwise it is checked on the dataset platform, see async_generate_task)
     """
 
     if parent_id:
@@ -161,7 +169,7 @@ def generate_task(query, user=current_user, parent_id=None, return_task=False):
 
     if task_parameters.get("dataset"):
         input_data = "dataset"
-        task.dataset_id = get_dataset(task_parameters["dataset"]).id
+        task.dataset_id = (dataset or get_dataset(task_parameters["dataset"])).id
 
     elif task_parameters.get("search_query"):
         input_data = "solr_query"
@@ -189,6 +197,7 @@ def generate_task(query, user=current_user, parent_id=None, return_task=False):
     #    "****TASK_PARAMETERS: %s PROCESSOR: %s" % (task_parameters, processor)
     # )
     current_app.logger.debug("task.parents %s" % task.parents)
+    task.fingerprint = task_fingerprint(task, processor)
     check_uuid_and_commit(task)
     current_app.logger.debug("TASK: %s" % task)
 
@@ -198,6 +207,82 @@ def generate_task(query, user=current_user, parent_id=None, return_task=False):
         return task.uuid
 
 
+async def async_generate_task(query, user=current_user, return_task=False):
+    """generate_task for coroutines, the dataset platform is requested without blocking"""
+    dataset = None
+    if query.get("dataset"):
+        dataset = await async_get_dataset(query["dataset"])
+    return generate_task(query, user=user, return_task=return_task, dataset=dataset)
+
+
+def input_identity(task):
+    """
+    Identity of the task input: the same for aliased datasets (same documents)
+    and for equal search queries
+    """
+    if task.dataset_id or task.dataset:
+        dataset = task.dataset or Dataset.query.get(task.dataset_id)
+        if dataset.content_hash:
+            return "dataset:%s" % dataset.content_hash
+        return "dataset:%d" % min([dataset.id] + [alias.id for alias in dataset.aliases])
+    if task.solr_query_id or task.solr_query:
+        solr_query = task.solr_query or SolrQuery.query.get(task.solr_query_id)
+        return "search_query:%s" % json.dumps(solr_query.search_query, sort_keys=True)
+    return "none"
+
+
+def task_fingerprint(task, processor=None):
+    """
+    Hash of everything the result of the task depends on:
+    processor, parameters, input data and fingerprints of parent tasks.
+    Computed when the task is created, so source tasks generated by the planner later on
+    are not included: they are defined by the input data anyway.
+    """
+    processor = processor or task.processor
+    content = {
+        "processor": processor.id,
+        "parameters": task.parameters or {},
+        "input": input_identity(task),
+        # order matters, e.g. for comparisons
+        "parents": [parent.fingerprint or task_fingerprint(parent) for parent in task.parents],
+    }
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def register_fingerprint(task, result):
+    """
+    makes the result available for tasks with the same fingerprint,
+    tasks finished at the same time update the same row (the latest result is kept)
+    """
+    if not task.fingerprint:
+        task.fingerprint = task_fingerprint(task)
+    fingerprint = task.fingerprint
+    values = dict(task_id=task.id, result_id=result.id, last_updated=datetime.utcnow())
+    try:
+        db.session.merge(ResultFingerprint(fingerprint=fingerprint, **values))
+        db.session.commit()
+    except IntegrityError:
+        # inserted by another task between the lookup of merge and the insert
+        db.session.rollback()
+        task.fingerprint = fingerprint
+        entry = ResultFingerprint.query.get(fingerprint)
+        for key, value in values.items():
+            setattr(entry, key, value)
+        db.session.commit()
+
+
+def find_fingerprint_result(task):
+    """latest non-empty result of a task with the same fingerprint, or None"""
+    if not task.fingerprint:
+        task.fingerprint = task_fingerprint(task)
+    entry = ResultFingerprint.query.get(task.fingerprint)
+    if entry is None or entry.task.processor.deprecated:
+        return None
+    return entry.result
+
+
 def generate_investigator_run(args, user=current_user):
     """
     Makes a new run and stores it in the database
@@ -228,12 +313,13 @@ def generate_investigator_node(
     return investigator_result
 
 
-def store_results(tasks, task_results, set_to_finished=True, interestingness=0.0):
-    # Store the new results to the database after everything has been finished
-    # TODO: Should we offer the option to store results as soon as they are ready? Or do that by default?
-    # Speedier results vs. more sql calls. If different tasks in the same query take wildly different amounts of
-    # time, it would make sense to store the finished ones immediately instead of waiting for the last one, but I
-    # doubt this would be the case here.
+def store_results(
+    tasks, task_results, set_to_finished=True, interestingness=0.0, deadline=None
+):
+    # Store the new results to the database
+    # the planner calls this as soon as a single task is finished
+    # (TaskScheduler), so dependent tasks could start immediately
+    # deadline: seconds the task was given, for the error message
 
     for task, result in zip(tasks, task_results):
 
@@ -241,7 +327,13 @@ def store_results(tasks, task_results, set_to_finished=True, interestingness=0.0
         if set_to_finished:
             task.task_finished = datetime.utcnow()
 
-        if isinstance(result, ValueError):
+        if isinstance(result, asyncio.TimeoutError):
+            current_app.logger.error("Task: {} deadline exceeded".format(task.uuid))
+            task.task_status = "stopped"
+            task.status_message = "Deadline of {} seconds exceeded".format(
+                deadline or Config.TASK_DEADLINE
+            )
+        elif isinstance(result, ValueError):
             current_app.logger.error(
                 "Task: {} ValueError: {}".format(task.uuid, result)
             )
@@ -268,6 +360,9 @@ def store_results(tasks, task_results, set_to_finished=True, interestingness=0.0
             )
             db.session.add(res)
             db.session.commit()
+            # intermediate results are not reused
+            if set_to_finished and result["result"]:
+                register_fingerprint(task, res)
 
     current_app.logger.info(
         "Storing results into database %s" % [str(task.uuid) for task in tasks]
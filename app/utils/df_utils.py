@@ -0,0 +1,189 @@
+import asyncio
+import os
+import sqlite3
+import time
+from math import log
+from threading import Thread
+import numpy as np
+import requests
+from flask import current_app
+from config import Config
+
+
+class DocumentFrequencies:
+    """
+    Document frequencies of words in each language-specific text field of the index,
+    stored in an SQLite file in Config.CACHE_DIR.
+    df returned by SOLR term vectors are computed over all fields of the (multilingual)
+    collection; these are the df of the field a document's term vectors come from.
+    Built offline from the SOLR terms component (flask build-df), then refreshed
+    in the background when older than Config.DF_REFRESH_INTERVAL.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(Config.CACHE_DIR, "document_frequencies.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.connect() as connection:
+            # write-ahead log: lookups of tasks are not blocked while build writes a field
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS df "
+                "(field TEXT, word TEXT, df INTEGER, PRIMARY KEY (field, word)) WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fields "
+                "(field TEXT PRIMARY KEY, words INTEGER, updated REAL)"
+            )
+
+    def connect(self):
+        # a connection per call: sqlite3 connections cannot be shared between threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def fields(self):
+        """field -> time of the last update"""
+        with self.connect() as connection:
+            return dict(connection.execute("SELECT field, updated FROM fields"))
+
+    def lookup(self, field, words):
+        """df of words in field, 0 for unknown words"""
+        index = {word: i for i, word in enumerate(words)}
+        df = np.zeros(len(words), dtype=np.int64)
+        with self.connect() as connection:
+            # SQLite limits the number of variables in a query
+            for i in range(0, len(words), 500):
+                chunk = words[i : i + 500]
+                for word, value in connection.execute(
+                    "SELECT word, df FROM df WHERE field = ? AND word IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    [field] + list(chunk),
+                ):
+                    df[index[word]] = value
+        return df
+
+    def build(self, field):
+        """
+        Reads df of all terms of field from the SOLR terms component, page by page
+        in index order, and replaces the stored df of the field.
+        """
+        terms = []
+        lower = None
+        while True:
+            parameters = {
+                "terms.fl": field,
+                "terms.limit": Config.DF_TERMS_PAGE,
+                "terms.sort": "index",
+                "wt": "json",
+            }
+            if lower is not None:
+                parameters["terms.lower"] = lower
+                parameters["terms.lower.incl"] = False
+            response = requests.get(
+                Config.SOLR_URI + "terms", json={"params": parameters}, timeout=300
+            )
+            response.raise_for_status()
+            page = response.json()["terms"].get(field, [])
+            # [term, df, term, df, ...]
+            terms.extend(zip(page[::2], page[1::2]))
+            if len(page) < 2 * Config.DF_TERMS_PAGE:
+                break
+            lower = page[-2]
+
+        with self.connect() as connection:
+            connection.execute("DELETE FROM df WHERE field = ?", (field,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO df (field, word, df) VALUES (?, ?, ?)",
+                [(field, word, df) for word, df in terms],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO fields (field, words, updated) VALUES (?, ?, ?)",
+                (field, len(terms), time.time()),
+            )
+        return len(terms)
+
+    def refresh(self, max_age):
+        """rebuilds fields older than max_age seconds, fields never built are left to build-df"""
+        for field, updated in self.fields().items():
+            if time.time() - updated < max_age:
+                continue
+            try:
+                current_app.logger.info("DF: %s %d words" % (field, self.build(field)))
+            except (requests.RequestException, KeyError, ValueError) as e:
+                current_app.logger.warning("DF: %s failed: %r" % (field, e))
+
+
+class TfIdf:
+    """
+    tf / log(df) of words (by id) where tf of documents with a known field uses the df
+    of the field, if it is in the table, and the rest uses the df returned by SOLR.
+    Without field information or table the values are the same as tf / log(df).
+    """
+
+    def __init__(self, words, df, field_tf):
+        """
+        df: df from SOLR by word id
+        field_tf: field -> tf of documents with that field, by word id
+        """
+        self.df = df
+        self.field_tf = {}
+        self.field_df = {}
+        store = get_document_frequencies() if field_tf and Config.LANGUAGE_DF else None
+        known = store.fields() if store else {}
+        for field in sorted(field_tf):
+            if field in known:
+                field_df = store.lookup(field, words)
+                # the table may be older than the index
+                self.field_df[field] = np.where(field_df >= 2, field_df, df)
+                self.field_tf[field] = field_tf[field]
+
+    def values(self, tf):
+        """approximate values with numpy, to select candidates"""
+        rest = tf.astype(np.float64)
+        values = np.zeros(len(tf))
+        for field in self.field_tf:
+            values += self.field_tf[field] / np.log(self.field_df[field])
+            rest -= self.field_tf[field]
+        return values + rest / np.log(self.df)
+
+    def value(self, i, tf):
+        """exact value for word i (same errors as math.log and division)"""
+        rest = int(tf)
+        value = 0.0
+        for field in self.field_tf:
+            field_tf = int(self.field_tf[field][i])
+            if field_tf:
+                value += field_tf / log(int(self.field_df[field][i]))
+                rest -= field_tf
+        if rest or not self.field_tf:
+            value += rest / log(int(self.df[i]))
+        return value
+
+
+async def make_tfidf(words, df, field_tf):
+    """TfIdf with the (blocking) SQLite lookups in a thread"""
+    return await asyncio.get_event_loop().run_in_executor(
+        None, TfIdf, words, df, field_tf
+    )
+
+
+# created on first use, so the cache directory is not created on import
+document_frequencies = None
+
+
+def get_document_frequencies():
+    global document_frequencies
+    if document_frequencies is None:
+        document_frequencies = DocumentFrequencies()
+    return document_frequencies
+
+
+def refresh_document_frequencies(app):
+    """rebuilds stale document frequencies in the background"""
+
+    def refresh():
+        with app.app_context():
+            while True:
+                get_document_frequencies().refresh(Config.DF_REFRESH_INTERVAL)
+                time.sleep(min(Config.DF_REFRESH_INTERVAL, 60 * 60))
+
+    if Config.LANGUAGE_DF and Config.DF_REFRESH_INTERVAL and Config.SOLR_URI:
+        Thread(target=refresh, daemon=True).start()
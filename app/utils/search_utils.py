@@ -39,6 +39,7 @@ class DatabaseSearch:
         query,
         retrieve="all",
         max_return_value=Config.SOLR_MAX_RETURN_VALUES,
+        on_page=None,
     ):
         #### TODO: store queries and outputs, check if output exists, and reuse
 
@@ -54,6 +55,9 @@ class DatabaseSearch:
 				  docids: retrieves all docids that match the query. If query doesn't specify the number of rows to be fetched, all matching rows are retrieved
 				  all: retrieves (almost) all metadata for the documents matching the search. Only useless fields, such as the various access control fields are ignored.
 					   By default this retrieves only the first 10 matches, but this can be changed by specifying a desired value using the 'rows' parameter
+		:param on_page: tokens and stems only: called with the term vectors of each page ({docid: {word: info}})
+				  and the field of each document ({docid: field}) as pages arrive,
+				  pages are not kept and the returned dictionary is empty
 		:return:
 		"""
 
@@ -129,24 +133,18 @@ class DatabaseSearch:
                 pages.append(parameters.copy())
                 page_count += 1
                 if page_count >= pages_in_parallel:
-                    for response in asyncio.as_completed(
-                        [self.get_response(session, solr_uri, page) for page in pages]
-                    ):
-                        response = await response
-                        result_dict = convert_vector_response_to_dictionary(
-                            response["termVectors"], result_dict
+                    async for response in self.get_pages(session, solr_uri, pages):
+                        result_dict = self.add_term_vectors(
+                            response["termVectors"], result_dict, on_page
                         )
                         # current_app.logger.debug("RESULT_DICT %d" %len(result_dict))
                     pages = []
                     page_count = 0
 
             # Last batch:
-            for response in asyncio.as_completed(
-                [self.get_response(session, solr_uri, page) for page in pages]
-            ):
-                response = await response
-                result_dict = convert_vector_response_to_dictionary(
-                    response["termVectors"], result_dict
+            async for response in self.get_pages(session, solr_uri, pages):
+                result_dict = self.add_term_vectors(
+                    response["termVectors"], result_dict, on_page
                 )
                 current_app.logger.debug("RESULT_DICT %d" % len(result_dict))
 
@@ -191,19 +189,13 @@ class DatabaseSearch:
                 pages.append(parameters.copy())
                 page_count += 1
                 if page_count >= pages_in_parallel:
-                    for response in asyncio.as_completed(
-                        [self.get_response(session, solr_uri, page) for page in pages]
-                    ):
-                        response = await response
+                    async for response in self.get_pages(session, solr_uri, pages):
                         result.extend(response["response"]["docs"])
                     pages = []
                     page_count = 0
 
             # Last batch:
-            for response in asyncio.as_completed(
-                [self.get_response(session, solr_uri, page) for page in pages]
-            ):
-                response = await response
+            async for response in self.get_pages(session, solr_uri, pages):
                 result.extend(response["response"]["docs"])
 
             return result
@@ -235,6 +227,34 @@ class DatabaseSearch:
         }
         return result
 
+    @staticmethod
+    def add_term_vectors(term_vectors, result_dict, on_page=None):
+        if on_page is None:
+            return convert_vector_response_to_dictionary(term_vectors, result_dict)
+        # streaming: the page is dropped once on_page has used it
+        fields = {}
+        page = convert_vector_response_to_dictionary(term_vectors, {}, fields)
+        on_page(page, fields)
+        return result_dict
+
+    async def get_pages(self, session, solr_uri, pages):
+        """
+        Requests pages in parallel and yields responses as they arrive.
+        If the caller is cancelled, requests still in flight are cancelled too,
+        otherwise they would keep using the session after it is released.
+        """
+        requests = [
+            asyncio.ensure_future(self.get_response(session, solr_uri, page))
+            for page in pages
+        ]
+        try:
+            for response in asyncio.as_completed(requests):
+                yield await response
+        finally:
+            for request in requests:
+                if not request.done():
+                    request.cancel()
+
     async def get_response(self, session, solr_uri, parameters, max_retry=10):
         try:
             async with session.get(solr_uri, json={"params": parameters}) as response:
@@ -263,8 +283,9 @@ class DatabaseSearch:
                         self.solr_controller.release_session(session)
 
 
-def convert_vector_response_to_dictionary(term_vectors, result_dict):
+def convert_vector_response_to_dictionary(term_vectors, result_dict, fields=None):
     # bunch of hacks
+    # fields: if given, docid -> field the term vectors come from (e.g. all_text_tfr_siv)
     # current_app.logger.debug("TERM_VECTORS: %s" %term_vectors)
     for article in term_vectors:
         if article[0] == "uniqueKey":
@@ -275,6 +296,8 @@ def convert_vector_response_to_dictionary(term_vectors, result_dict):
             except Exception as e:
                 # current_app.logger.debug("WRONG WORD_LIST: %s" % article)
                 continue
+            if fields is not None:
+                fields[article_id] = article[2]
 
             article_dict = {}
             for i in range(0, len(word_list), 2):
@@ -0,0 +1,436 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+from flask import current_app
+from config import Config
+
+
+class TermVectors:
+    """
+    Term vectors of a collection in compact arrays (CSR-like):
+    entries doc_ptr[d]:doc_ptr[d + 1] are the words of document d (word ids and tf),
+    positions pos_ptr[e]:pos_ptr[e + 1] are the positions of entry e.
+    Words are in the order they were seen, df is the document frequency from SOLR.
+    fields: field of the term vectors of each document (e.g. all_text_tfr_siv), None if unknown.
+    path: directory of the term vectors in the TermVectorStore, None if they are only in memory.
+    """
+
+    arrays = ["df", "doc_ptr", "entry_word", "entry_tf", "pos_ptr", "positions"]
+
+    def __init__(
+        self,
+        doc_ids,
+        words,
+        df,
+        doc_ptr,
+        entry_word,
+        entry_tf,
+        pos_ptr,
+        positions,
+        fields=None,
+        path=None,
+    ):
+        self.doc_ids = doc_ids
+        self.fields = fields or [None] * len(doc_ids)
+        self.words = words
+        self.df = df
+        self.doc_ptr = doc_ptr
+        self.entry_word = entry_word
+        self.entry_tf = entry_tf
+        self.pos_ptr = pos_ptr
+        self.positions = positions
+        self.path = path
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.arrays)
+
+    def entry_fields(self):
+        """field -> mask of entries of documents with that field"""
+        names = sorted(set(f for f in self.fields if f))
+        if not names:
+            return {}
+        index = {name: i for i, name in enumerate(names)}
+        doc_field = np.array([index.get(f, -1) for f in self.fields], dtype=np.int64)
+        entry_field = np.repeat(doc_field, np.diff(self.doc_ptr))
+        return {name: entry_field == i for name, i in index.items()}
+
+    @classmethod
+    def load(cls, path):
+        """term vectors saved by TermVectorStore in path, arrays are memory-mapped"""
+        with open(os.path.join(path, "keys.json")) as f:
+            keys = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+            for name in cls.arrays
+        }
+        return cls(
+            keys["doc_ids"], keys["words"], fields=keys.get("fields"), path=path, **arrays
+        )
+
+    @classmethod
+    def from_dicts(cls, doc_dicts):
+        """doc_dicts: {docid: {word: {"tf": ..., "df": ..., "positions": [...]}}}"""
+        builder = TermVectorBuilder()
+        builder.add_page(doc_dicts)
+        return builder.build()
+
+    def documents(self, start, end):
+        """term vectors of documents start:end, with the same word ids"""
+        end = min(end, len(self.doc_ids))
+        first, last = self.doc_ptr[start], self.doc_ptr[end]
+        return TermVectors(
+            self.doc_ids[start:end],
+            self.words,
+            self.df,
+            self.doc_ptr[start : end + 1] - first,
+            self.entry_word[first:last],
+            self.entry_tf[first:last],
+            self.pos_ptr[first : last + 1] - self.pos_ptr[first],
+            self.positions[self.pos_ptr[first] : self.pos_ptr[last]],
+            self.fields[start:end],
+        )
+
+    def sequences(self):
+        """
+        Word ids of all documents in position order, and the document of each of them.
+        If two words have the same position, the last one is kept.
+        """
+        if not len(self.positions):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        entry_doc = np.repeat(
+            np.arange(len(self.doc_ids), dtype=np.int64), np.diff(self.doc_ptr)
+        )
+        counts = np.diff(self.pos_ptr)
+        token_doc = np.repeat(entry_doc, counts)
+        token_word = np.repeat(self.entry_word.astype(np.int64), counts)
+        keys = (token_doc << 32) | self.positions.astype(np.int64)
+        # sorted by document and position, last occurrence of each position
+        keys, last = np.unique(keys[::-1], return_index=True)
+        return token_word[::-1][last], keys >> 32
+
+
+class TermVectorBuilder:
+    """
+    Builds TermVectors page by page (see DatabaseSearch.query_solr on_page).
+    max_size: pages are dropped once the arrays would take more than max_size bytes,
+    build then returns None
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.dropped = False
+        self.clear()
+
+    def clear(self):
+        self.nbytes = 0
+        self.doc_ids = []
+        self.fields = []
+        # the same document may be returned in two pages
+        self.seen = set()
+        self.ids = {}
+        self.words = []
+        self.df = []
+        self.doc_lengths = []
+        self.entry_word = []
+        self.entry_tf = []
+        self.pos_lengths = []
+        self.positions = []
+
+    def add_page(self, page, fields=None):
+        """fields: docid -> field of its term vectors"""
+        if self.dropped:
+            return
+        documents, words = len(self.doc_ids), len(self.words)
+        entry_word = []
+        entry_tf = []
+        pos_lengths = []
+        positions = []
+        for article_id, word_dict in page.items():
+            if article_id in self.seen:
+                continue
+            self.seen.add(article_id)
+            self.doc_ids.append(article_id)
+            self.fields.append((fields or {}).get(article_id))
+            self.doc_lengths.append(len(word_dict))
+            for word, info in word_dict.items():
+                term_id = self.ids.get(word)
+                if term_id is None:
+                    term_id = self.ids[word] = len(self.words)
+                    self.words.append(word)
+                    self.df.append(info["df"])
+                else:
+                    self.df[term_id] = info["df"]
+                entry_word.append(term_id)
+                entry_tf.append(info["tf"])
+                word_positions = info.get("positions", [])
+                pos_lengths.append(len(word_positions))
+                positions.extend(word_positions)
+        # pages are kept only as arrays
+        self.entry_word.append(np.array(entry_word, dtype=np.int32))
+        self.entry_tf.append(np.array(entry_tf, dtype=np.int32))
+        self.pos_lengths.append(np.array(pos_lengths, dtype=np.int64))
+        self.positions.append(np.array(positions, dtype=np.int32))
+        # as TermVectors.nbytes: df by word and document pointers are int64
+        self.nbytes += 8 * (len(self.doc_ids) - documents + len(self.words) - words)
+        for arrays in [self.entry_word, self.entry_tf, self.pos_lengths, self.positions]:
+            self.nbytes += arrays[-1].nbytes
+        if self.max_size is not None and self.nbytes > self.max_size:
+            # too large for the store, keeping them would only take memory
+            self.dropped = True
+            self.clear()
+
+    def build(self):
+        if self.dropped:
+            return None
+
+        def concatenate(arrays, dtype):
+            return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+        def pointers(lengths):
+            return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+
+        return TermVectors(
+            self.doc_ids,
+            self.words,
+            np.array(self.df, dtype=np.int64),
+            pointers(np.array(self.doc_lengths, dtype=np.int64)),
+            concatenate(self.entry_word, np.int32),
+            concatenate(self.entry_tf, np.int32),
+            pointers(concatenate(self.pos_lengths, np.int64)),
+            concatenate(self.positions, np.int32),
+            self.fields,
+        )
+
+
+class TermVectorStore:
+    """
+    Term vectors of collections, keyed by search query and unit (tokens or stems),
+    stored in Config.CACHE_DIR and shared between processors, threads and worker processes.
+    Each collection is a directory of .npy arrays (memory-mapped when read) and a JSON file
+    with document ids and words; the SQLite index keeps sizes.
+    Least recently used collections are evicted when they take more than max_size bytes,
+    collections retrieved more than max_age seconds ago are not used (the index changes).
+    """
+
+    def __init__(self, max_size, max_age=None, name="term_vectors"):
+        self.directory = os.path.join(Config.CACHE_DIR, name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, "index.sqlite")
+        self.max_size = max_size
+        self.max_age = max_age
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS term_vectors "
+                "(key TEXT PRIMARY KEY, directory TEXT, size INTEGER, used REAL, created REAL)"
+            )
+            columns = [c[1] for c in connection.execute("PRAGMA table_info(term_vectors)")]
+            # stores written before max_age: their entries count as expired
+            if "created" not in columns:
+                connection.execute("ALTER TABLE term_vectors ADD COLUMN created REAL")
+
+    def connect(self):
+        # a connection per call: sqlite3 connections cannot be shared between threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(query, unit):
+        return json.dumps([query, unit], sort_keys=True)
+
+    def get(self, key):
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT directory, created FROM term_vectors WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.max_age and (row[1] is None or time.time() - row[1] > self.max_age):
+                return None
+            connection.execute(
+                "UPDATE term_vectors SET used = ? WHERE key = ?", (time.time(), key)
+            )
+        try:
+            return TermVectors.load(os.path.join(self.directory, row[0]))
+        except (OSError, ValueError):
+            # evicted by another process in the meantime
+            return None
+
+    def set(self, key, term_vectors):
+        if term_vectors.nbytes > self.max_size:
+            # would evict everything else and still not fit
+            return
+        name = uuid.uuid4().hex
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        for array in TermVectors.arrays:
+            np.save(os.path.join(path, array + ".npy"), getattr(term_vectors, array))
+        with open(os.path.join(path, "keys.json"), "w") as f:
+            json.dump(
+                {
+                    "doc_ids": term_vectors.doc_ids,
+                    "words": term_vectors.words,
+                    "fields": term_vectors.fields,
+                },
+                f,
+            )
+        size = term_vectors.nbytes + os.path.getsize(os.path.join(path, "keys.json"))
+        term_vectors.path = path
+
+        with self.connect() as connection:
+            removed = [
+                d
+                for (d,) in connection.execute(
+                    "SELECT directory FROM term_vectors WHERE key = ?", (key,)
+                ).fetchall()
+            ]
+            connection.execute(
+                "INSERT OR REPLACE INTO term_vectors (key, directory, size, used, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, name, size, time.time(), time.time()),
+            )
+            (total,) = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM term_vectors"
+            ).fetchone()
+            # least recently used first, the new entry is kept
+            for old_key, directory, old_size in connection.execute(
+                "SELECT key, directory, size FROM term_vectors WHERE key != ? ORDER BY used",
+                (key,),
+            ).fetchall():
+                if total <= self.max_size:
+                    break
+                connection.execute(
+                    "DELETE FROM term_vectors WHERE key = ?", (old_key,)
+                )
+                removed.append(directory)
+                total -= old_size
+        for directory in removed:
+            shutil.rmtree(os.path.join(self.directory, directory), ignore_errors=True)
+
+
+# created on first use, so the cache directory is not created on import
+term_vector_store = None
+# key -> concurrent.futures.Future of term vectors being retrieved in this process,
+# other tasks (in any thread) wait for them instead of querying SOLR again
+pending = {}
+pending_lock = threading.Lock()
+
+
+def get_term_vector_store():
+    global term_vector_store
+    if term_vector_store is None:
+        term_vector_store = TermVectorStore(
+            Config.TERM_VECTOR_CACHE_SIZE, Config.TERM_VECTOR_CACHE_MAX_AGE
+        )
+    return term_vector_store
+
+
+async def retrieve_term_vectors(search_database, query, unit):
+    builder = TermVectorBuilder()
+    result = await search_database(query, retrieve=unit, on_page=builder.add_page)
+    # search errors are returned, not raised, outside debug mode
+    if isinstance(result, Exception):
+        raise result
+    return builder.build()
+
+
+async def stream_term_vectors(search_database, query, unit, on_page, force_refresh=False):
+    """
+    Term vectors of the documents matching query, passed to on_page page by page
+    as they are retrieved (see DatabaseSearch.query_solr), without keeping the
+    collection in memory unless it fits in the store: then it is stored for other processors.
+    Returns the cached term vectors instead, if there are any (on_page is not called),
+    otherwise None.
+    """
+    store = get_term_vector_store()
+    key = store.make_key(query, unit)
+    if not force_refresh:
+        term_vectors = store.get(key)
+        if term_vectors is not None:
+            current_app.logger.debug(
+                "TERM VECTORS FOUND: %d documents" % len(term_vectors)
+            )
+            return term_vectors
+
+    builder = TermVectorBuilder(store.max_size)
+
+    def add_page(page, fields=None):
+        on_page(page, fields)
+        builder.add_page(page, fields)
+
+    result = await search_database(query, retrieve=unit, on_page=add_page)
+    # search errors are returned, not raised, outside debug mode
+    if isinstance(result, Exception):
+        raise result
+    term_vectors = builder.build()
+    if term_vectors is not None:
+        store.set(key, term_vectors)
+    return None
+
+
+async def get_term_vectors(search_database, query, unit, force_refresh=False):
+    """
+    Term vectors of the documents matching query, retrieved from SOLR once
+    and shared by processors using the same query and unit.
+    search_database: AnalysisUtility.search_database of the calling processor
+    force_refresh: neither cached nor pending term vectors are used, the new ones replace the cached
+    """
+    store = get_term_vector_store()
+    key = store.make_key(query, unit)
+    if force_refresh:
+        term_vectors = await retrieve_term_vectors(search_database, query, unit)
+        store.set(key, term_vectors)
+        return term_vectors
+
+    while True:
+        term_vectors = store.get(key)
+        if term_vectors is not None:
+            current_app.logger.debug(
+                "TERM VECTORS FOUND: %d documents" % len(term_vectors)
+            )
+            return term_vectors
+
+        with pending_lock:
+            future = pending.get(key)
+            owner = future is None
+            if owner:
+                future = pending[key] = concurrent.futures.Future()
+        if owner:
+            break
+        current_app.logger.debug("WAITING FOR TERM VECTORS")
+        # shielded: cancelling this task must not cancel the future of the other waiters
+        term_vectors = await asyncio.shield(asyncio.wrap_future(future))
+        if term_vectors is not None:
+            return term_vectors
+        # None: the retrieving task was cancelled, retrieve them here
+
+    try:
+        term_vectors = await retrieve_term_vectors(search_database, query, unit)
+        store.set(key, term_vectors)
+    except BaseException as e:
+        # removed first: waiters that retry start a new retrieval
+        with pending_lock:
+            del pending[key]
+        if isinstance(e, Exception) and not isinstance(
+            e, (asyncio.CancelledError, asyncio.TimeoutError)
+        ):
+            future.set_exception(e)
+        else:
+            # cancelled or timed out (deadline of this task), not an error of the retrieval:
+            # waiting tasks retry instead of failing with it
+            future.set_result(None)
+        raise
+    with pending_lock:
+        del pending[key]
+    future.set_result(term_vectors)
+    return term_vectors
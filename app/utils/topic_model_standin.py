@@ -0,0 +1,72 @@
+"""
+Local stand-in for the topic model API, for development and testing without access to WP4 servers.
+Implements the endpoints used by the investigator with random but well-formed answers:
+
+    python -m app.utils.topic_model_standin --port 8081
+    TOPIC_MODEL_URI=http://localhost:8081 python investigator.py
+
+Tasks are answered with 202 for the first --polls requests, then with the result.
+"""
+import argparse
+import random
+import uuid
+from aiohttp import web
+
+
+def make_app(polls=2):
+    app = web.Application()
+    # task_uuid -> [polls left, result]
+    tasks = {}
+
+    async def doc_linking(request):
+        payload = await request.json()
+        num_docs = int(payload.get("num_docs") or 3)
+        task_uuid = str(uuid.uuid4())
+        distances = sorted(random.random() for _ in range(num_docs))
+        tasks[task_uuid] = [
+            polls,
+            {
+                "similar_docs": [
+                    "standin_{}_{}".format(payload.get("lang"), i)
+                    for i in range(num_docs)
+                ],
+                "distance": distances,
+            },
+        ]
+        return web.json_response({"task_uuid": task_uuid})
+
+    async def doc_linking_results(request):
+        payload = await request.json()
+        task = tasks.get(payload.get("task_uuid"))
+        if task is None:
+            return web.json_response({"error": "unknown task_uuid"}, status=404)
+        if task[0] > 0:
+            task[0] -= 1
+            return web.json_response({"status": "pending"}, status=202)
+        return web.json_response(task[1])
+
+    async def word_embeddings(request):
+        payload = await request.json()
+        word = payload.get("word", "")
+        num_words = int(payload.get("num_words") or 10)
+        return web.json_response(
+            {"similar_words": ["{}{}".format(word, i) for i in range(num_words)]}
+        )
+
+    app.router.add_post("/doc-linking-by-distribution", doc_linking)
+    app.router.add_post("/doc-linking-results", doc_linking_results)
+    app.router.add_post("/word-embeddings/query", word_embeddings)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--polls", type=int, default=2)
+    args = parser.parse_args()
+    web.run_app(make_app(polls=args.polls), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
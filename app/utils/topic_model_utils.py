@@ -0,0 +1,289 @@
+import asyncio
+import json
+import random
+import aiohttp
+from contextlib import asynccontextmanager
+from flask import current_app
+from werkzeug.exceptions import RequestTimeout
+from app.utils.cache_utils import PersistentCache
+from config import Config
+
+
+class TopicModelClient:
+    """
+    Async client for the topic model API (Config.TOPIC_MODEL_URI).
+
+    Long-running requests return a task_uuid, the result is polled until it is ready:
+    the API answers 202 while the task is running and 200 with the result.
+    Connections are pooled for the lifetime of the client:
+
+        async with TopicModelClient() as client:
+            result = await client.request("doc-linking-by-distribution", "doc-linking-results", payload)
+
+    Processors use the client shared by all tasks of the event loop (a user task or an investigator run):
+
+        async with TopicModelClient.shared() as client:
+            ...
+
+    Tasks waited for at about the same time are polled together with poll_many.
+    """
+
+    # (client class, event loop) -> [shared client, number of users]
+    shared_clients = {}
+
+    def __init__(self, uri=None):
+        self.uri = (uri or Config.TOPIC_MODEL_URI).rstrip("/")
+        self.session = None
+        # (endpoint, parameters, max_wait) -> futures of tasks waiting to be polled
+        # (task_uuid -> future) and the task polling them
+        self.batches = {}
+
+    @classmethod
+    @asynccontextmanager
+    async def shared(cls):
+        """the client of the running event loop, opened by the first user and closed by the last"""
+        key = (cls, asyncio.get_event_loop())
+        entry = cls.shared_clients.get(key)
+        if entry is None:
+            entry = cls.shared_clients[key] = [cls(), 0]
+            await entry[0].__aenter__()
+        entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del cls.shared_clients[key]
+                await entry[0].__aexit__()
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=Config.TOPIC_MODEL_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=Config.TOPIC_MODEL_REQUEST_TIMEOUT),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    async def post(self, endpoint, payload):
+        """returns status and parsed JSON (None if the response is not JSON)"""
+        url = "{}/{}".format(self.uri, endpoint.lstrip("/"))
+        async with self.session.post(url, json=payload) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, data
+
+    async def submit(self, endpoint, payload):
+        status, data = await self.post(endpoint, payload)
+        task_uuid = data.get("task_uuid") if isinstance(data, dict) else None
+        if not task_uuid:
+            raise ValueError(
+                "Invalid response from the Topic Model API: {} {}".format(status, data)
+            )
+        return task_uuid
+
+    async def poll(self, endpoint, task_uuid, parameters=None, max_wait=None):
+        """
+        Waits for the result of task_uuid.
+        Delays grow exponentially up to TOPIC_MODEL_MAX_POLL_DELAY with random jitter,
+        so many pending tasks do not poll in lockstep.
+        Raises RequestTimeout if the result is not ready in max_wait seconds.
+        """
+        max_wait = max_wait or Config.TOPIC_MODEL_MAX_WAIT
+        payload = dict(parameters or {}, task_uuid=task_uuid)
+        waited = 0
+        attempt = 0
+        while True:
+            delay = min(
+                Config.TOPIC_MODEL_MAX_POLL_DELAY,
+                Config.TOPIC_MODEL_POLL_DELAY * 2 ** attempt,
+            ) * random.uniform(0.5, 1)
+            if waited + delay > max_wait:
+                raise RequestTimeout(
+                    "Task {} cannot finish in {} seconds".format(task_uuid, max_wait)
+                )
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
+
+            try:
+                status, data = await self.post(endpoint, payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # the task keeps running on the server, try again later
+                current_app.logger.warning("TM_TASK: %s poll failed: %r" % (task_uuid, e))
+                continue
+
+            if status == 200:
+                return data
+            elif status != 202:
+                raise ValueError(
+                    "Topic Model API failed for task {}: {} {}".format(
+                        task_uuid, status, data
+                    )
+                )
+            current_app.logger.debug(
+                "TM_TASK: %s WAITED: %.1f STATUS: %s" % (task_uuid, waited, status)
+            )
+
+    async def poll_many(self, endpoint, task_uuids, parameters=None, max_wait=None):
+        """
+        Polls several tasks concurrently.
+        Returns task_uuid -> result, or the exception if the task failed.
+        """
+        results = await asyncio.gather(
+            *[
+                self.poll(endpoint, task_uuid, parameters, max_wait)
+                for task_uuid in task_uuids
+            ],
+            return_exceptions=True
+        )
+        return dict(zip(task_uuids, results))
+
+    async def wait(self, endpoint, task_uuid, parameters=None, max_wait=None):
+        """
+        Waits for the result of task_uuid: tasks which start waiting within
+        TOPIC_MODEL_POLL_BATCH_WINDOW seconds are polled together by one poll_many call.
+        """
+        key = (endpoint, json.dumps(parameters, sort_keys=True), max_wait)
+        if key not in self.batches:
+            futures = {}
+            poller = asyncio.ensure_future(self.poll_batch(key, futures, parameters))
+            self.batches[key] = futures, poller
+        futures, poller = self.batches[key]
+        future = futures[task_uuid] = asyncio.get_event_loop().create_future()
+        try:
+            return await future
+        finally:
+            # nobody waits for the batch any more: stop polling
+            if all(f.done() for f in futures.values()):
+                poller.cancel()
+
+    async def poll_batch(self, key, futures, parameters):
+        try:
+            await asyncio.sleep(Config.TOPIC_MODEL_POLL_BATCH_WINDOW)
+        finally:
+            # tasks waiting from now on are polled by the next batch
+            del self.batches[key]
+        waiting = [task_uuid for task_uuid, f in futures.items() if not f.done()]
+        current_app.logger.debug("TM_POLL: %d tasks" % len(waiting))
+        results = await self.poll_many(key[0], waiting, parameters, key[2])
+        for task_uuid, result in results.items():
+            future = futures[task_uuid]
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def request(
+        self, request_endpoint, result_endpoint, payload, parameters=None, max_wait=None
+    ):
+        """submits a task and waits for its result"""
+        task_uuid = await self.submit(request_endpoint, payload)
+        return await self.wait(result_endpoint, task_uuid, parameters, max_wait)
+
+
+class EmbeddingsClient(TopicModelClient):
+    """
+    Similar word queries to the word embeddings API of the topic model server.
+    Answers are cached on disk by (lang, word, num_words).
+    If the server accepts several words per request (Config.EMBEDDINGS_BATCH_SIZE > 1),
+    words are sent in batches, otherwise requests for single words are sent concurrently.
+    """
+
+    endpoint = "word-embeddings/query"
+    # shared by all clients in the process, created on first use
+    cache = None
+
+    def __init__(self, uri=None):
+        super().__init__(uri)
+        if EmbeddingsClient.cache is None:
+            EmbeddingsClient.cache = PersistentCache(
+                "word_embeddings", Config.EMBEDDINGS_CACHE_SIZE
+            )
+
+    async def similar_words(self, queries):
+        """
+        queries: list of {"lang": ..., "word": ..., "num_words": ...}
+        returns a list of similar words for each query, empty if the query failed
+        """
+        keys = [(q["lang"], q["word"], q["num_words"]) for q in queries]
+        found = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        current_app.logger.debug(
+            "EMBEDDINGS: %d queries, %d cached" % (len(keys), len(keys) - len(missing))
+        )
+
+        if Config.EMBEDDINGS_BATCH_SIZE > 1:
+            new = await self.query_batches(missing)
+        else:
+            results = await asyncio.gather(*[self.query_word(*k) for k in missing])
+            new = {k: r for k, r in zip(missing, results) if r is not None}
+
+        self.cache.set_many(list(new.items()))
+        found.update(new)
+        return [found.get(k, []) for k in keys]
+
+    async def query_word(self, lang, word, num_words):
+        try:
+            status, data = await self.post(
+                self.endpoint, {"lang": lang, "word": word, "num_words": num_words}
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            current_app.logger.warning("EMBEDDINGS %s %s failed: %r" % (lang, word, e))
+            return None
+        similar = data.get("similar_words") if isinstance(data, dict) else None
+        if status != 200 or not isinstance(similar, list):
+            current_app.logger.warning(
+                "EMBEDDINGS %s %s failed: %s %s" % (lang, word, status, data)
+            )
+            return None
+        return similar
+
+    async def query_batches(self, keys):
+        """
+        Expects the server to answer {"similar_words": {word: [...]}}
+        to {"lang": ..., "words": [...], "num_words": ...}
+        """
+        groups = {}
+        for lang, word, num_words in keys:
+            groups.setdefault((lang, num_words), []).append(word)
+
+        requests = []
+        for (lang, num_words), words in groups.items():
+            for i in range(0, len(words), Config.EMBEDDINGS_BATCH_SIZE):
+                requests.append(
+                    (lang, num_words, words[i : i + Config.EMBEDDINGS_BATCH_SIZE])
+                )
+
+        async def query_batch(lang, num_words, words):
+            try:
+                status, data = await self.post(
+                    self.endpoint,
+                    {"lang": lang, "words": words, "num_words": num_words},
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                current_app.logger.warning("EMBEDDINGS %s batch failed: %r" % (lang, e))
+                return {}
+            similar = data.get("similar_words") if isinstance(data, dict) else None
+            if status != 200 or not isinstance(similar, dict):
+                current_app.logger.warning(
+                    "EMBEDDINGS %s batch failed: %s %s" % (lang, status, data)
+                )
+                return {}
+            # words without an answer are not cached, they are asked again next time
+            return {
+                (lang, w, num_words): similar[w]
+                for w in words
+                if isinstance(similar.get(w), list)
+            }
+
+        new = {}
+        for result in await asyncio.gather(*[query_batch(*r) for r in requests]):
+            new.update(result)
+        return new
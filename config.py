@@ -28,7 +28,8 @@ class Config(object):
     EXPLAINER_URI = "http://newseye-wp5.cs.helsinki.fi:4219/api"
 
     # This should contain the URI for the topic modelling tools
-    TOPIC_MODEL_URI = "https://newseye-wp4.cs.helsinki.fi"
+    # could be pointed to a local stand-in, see app/utils/topic_model_standin.py
+    TOPIC_MODEL_URI = os.environ.get("TOPIC_MODEL_URI") or "https://newseye-wp4.cs.helsinki.fi"
     TOPIC_MODEL_TYPES = ["lda", "dtm"]
     TOPIC_MODEL_COMPARISON_TYPE = {
         "distinct_topics": True,
@@ -38,6 +39,65 @@ class Config(object):
         "cross_jsd": False,
     }
 
+    # topic model client: parallel connections, seconds per request,
+    # first and maximal delay between polls of a pending task, maximal total wait for a task
+    TOPIC_MODEL_CONNECTIONS = 20
+    TOPIC_MODEL_REQUEST_TIMEOUT = 60
+    TOPIC_MODEL_POLL_DELAY = 2
+    TOPIC_MODEL_MAX_POLL_DELAY = 30
+    TOPIC_MODEL_MAX_WAIT = 30 * 60
+    # seconds during which tasks start waiting to be polled together (TopicModelClient.wait)
+    TOPIC_MODEL_POLL_BATCH_WINDOW = 0.5
+
+    # word embeddings (query expansion): words per request, 1 if the server accepts only single words,
+    # and number of cached (language, word, num_words) answers
+    EMBEDDINGS_BATCH_SIZE = 1
+    EMBEDDINGS_CACHE_SIZE = 200000
+
+    # local files: caches, exported models, etc.
+    CACHE_DIR = os.environ.get("CACHE_DIR") or os.path.join(basedir, "cache")
+
+    # Summarization models (spaCy, fastText) are kept in memory between tasks,
+    # least recently used are dropped above this size in bytes
+    SUMMARIZATION_MODEL_MEMORY = int(
+        os.environ.get("SUMMARIZATION_MODEL_MEMORY") or 16 * 1024 ** 3
+    )
+    # TextRank graph keeps only this many most similar sentences per sentence, None for the complete graph
+    SUMMARIZATION_TEXTRANK_TOP_K = None
+    # texts per spaCy batch
+    SUMMARIZATION_SPACY_BATCH_SIZE = 64
+    # bytes of sentence embeddings kept on disk (by article), least recently used are dropped
+    SUMMARIZATION_EMBEDDING_CACHE_SIZE = int(
+        os.environ.get("SUMMARIZATION_EMBEDDING_CACHE_SIZE") or 2 * 1024 ** 3
+    )
+    # languages loaded in the background when the server gets its first request, e.g. "fi,fr,de"
+    SUMMARIZATION_WARM_UP = [
+        l for l in (os.environ.get("SUMMARIZATION_WARM_UP") or "").split(",") if l
+    ]
+
+    # deadlines in seconds, could be overridden by the user with a "deadline" parameter
+    # single task, including its prerequisites
+    TASK_DEADLINE = 60 * 60
+    # whole investigator run
+    RUN_DEADLINE = 6 * 60 * 60
+
+    # maximal number of tasks executed in parallel by one planner
+    PLANNER_MAX_RUNNING_TASKS = 10
+
+    # investigator in the pipelined mode: follow-up tasks are added while other tasks still run
+    # default mode, could be overridden by the user with a "pipeline" parameter
+    INVESTIGATOR_PIPELINE = False
+    # maximal number of selected tasks running at the same time in the pipelined mode
+    INVESTIGATOR_MAX_RUNNING_TASKS = 10
+
+    # investigator cost model: task durations are learned from previous runs
+    # per processor, measurements needed before PROCESSOR_PRIORITY is replaced by the estimate
+    COST_MODEL_MIN_OBSERVATIONS = 5
+    # per processor, only the latest measurements are used
+    COST_MODEL_MAX_OBSERVATIONS = 500
+    # language offsets based on less observations than this are shrunk towards zero
+    COST_MODEL_SHRINKAGE = 5
+
     PROCESSOR_EXCEPTION_LIST = [
         "TopicModelDocsetComparison",
         "Comparison",
@@ -48,6 +108,17 @@ class Config(object):
     DATASET_URI = "https://platform.newseye.eu"
     DATASET_EMAIL = "pra@newseye.eu"
     DATASET_PASSWORD = os.environ.get("DATASET_PASSWORD")
+    # seconds: tokens are refreshed this long before they expire,
+    # tokens without expiration time are kept for DATASET_TOKEN_TTL
+    DATASET_TOKEN_MARGIN = 60
+    DATASET_TOKEN_TTL = 10 * 60
+    # async dataset platform client: seconds per request and number of attempts
+    DATASET_REQUEST_TIMEOUT = 5 * 60
+    DATASET_REQUEST_RETRIES = 3
+    # seconds: dataset lists (with hash values) are cached per user
+    DATASET_LIST_TTL = 30
+    # documents inserted into the database in a single statement
+    DATASET_INSERT_CHUNK = 5000
 
     HEADERS = {}
     COOKIES = {}
@@ -55,6 +126,41 @@ class Config(object):
     SOLR_URI = os.environ.get("SOLR_URI")
     SOLR_MAX_RETURN_VALUES = 100000
     SOLR_MAX_SESSIONS = 30  # maximum number of sessions to open in the same time
+    # ExtractWords counts words page by page while term vectors are retrieved,
+    # instead of keeping term vectors of all documents; with TERM_VECTOR_CACHE_SIZE
+    # they are also kept (about 12 bytes per token) until they are too large to be cached
+    EXTRACT_WORDS_STREAMING = True
+    # bytes of term vectors kept on disk (by search query and unit), shared by ExtractWords
+    # and ExtractBigrams so that they are retrieved once; 0 to retrieve them for each processor
+    TERM_VECTOR_CACHE_SIZE = int(
+        os.environ.get("TERM_VECTOR_CACHE_SIZE") or 4 * 1024 ** 3
+    )
+    # seconds after which cached term vectors are retrieved again, as the index changes
+    TERM_VECTOR_CACHE_MAX_AGE = 24 * 60 * 60
+    # document frequencies of words by language-specific text field, used for tf-idf in
+    # ExtractWords and ExtractBigrams instead of df of the whole collection when available;
+    # built with "flask build-df" and rebuilt in the background when older than DF_REFRESH_INTERVAL seconds
+    LANGUAGE_DF = True
+    DF_FIELDS = [
+        pattern.format(language)
+        for pattern in ["all_text_t{}_siv", "all_text_unstemmed_t{}_siv"]
+        for language in ["en", "fr", "fi", "se", "de"]
+    ]
+    DF_TERMS_PAGE = 100000
+    DF_REFRESH_INTERVAL = 7 * 24 * 60 * 60
+    # ExtractBigrams: bigrams sampled to find a count threshold for pruning rare bigrams,
+    # and worker processes (started with the server) for collections of at least
+    # BIGRAM_PROCESS_MIN_DOCUMENTS documents in the term vector store
+    BIGRAM_PRUNE_SAMPLE = 100000
+    BIGRAM_PROCESSES = int(os.environ.get("BIGRAM_PROCESSES") or 1)
+    BIGRAM_PROCESS_MIN_DOCUMENTS = 20000
+    # TopicModelDocsetComparison: bytes of temporary arrays for a block of document pairs
+    # in internal and cross JSD; above TOPIC_JSD_MAX_PAIRS pairs the mean JSD is estimated
+    # from random pairs, within TOPIC_JSD_SAMPLE_ERROR with probability TOPIC_JSD_SAMPLE_CONFIDENCE
+    TOPIC_JSD_BLOCK_BYTES = 64 * 1024 * 1024
+    TOPIC_JSD_MAX_PAIRS = 10 ** 7
+    TOPIC_JSD_SAMPLE_ERROR = 0.001
+    TOPIC_JSD_SAMPLE_CONFIDENCE = 0.95
 
     # SOLR_URI = "http://localhost:9983/solr/hydra-development/select"
     # test DB:
@@ -1,3 +1,5 @@
+import click
+from config import Config
 from app import create_app, db
 from app.models import User, Result, Task, Report, InvestigatorRun
 
@@ -5,11 +7,27 @@ from app.models import User, Result, Task, Report, InvestigatorRun
 app = create_app()
 
 from app.analysis import initialize_processors
-initialize_processors(app)
+from app.utils import update_status, index_datasets, index_results
 
-from app.utils import update_status
-update_status(app)
+# worker processes (ExtractBigrams) import this module again as __mp_main__,
+# they must not change the database
+if __name__ != "__mp_main__":
+    initialize_processors(app)
+    update_status(app)
 
+from app.analysis.summarization.model_registry import warm_up_models, export_embeddings
+from app.analysis.word_processors import start_bigram_workers
+
+from app.utils.df_utils import get_document_frequencies, refresh_document_frequencies
+
+
+@app.before_first_request
+def start_background_tasks():
+    # started by the serving process (uwsgi worker, flask run or main) with its first request,
+    # not at import: every flask command (db upgrade, build-df, ...) imports this module too
+    warm_up_models(app)
+    start_bigram_workers()
+    refresh_document_frequencies(app)
 
 
 @app.shell_context_processor
@@ -17,6 +35,34 @@ def make_shell_context():
     return {"db": db, "User": User, "Result": Result, "Task": Task, "Report": Report}
 
 
+@app.cli.command("export-embeddings")
+@click.argument("language")
+def export_embeddings_command(language):
+    """Export fastText vectors for memory-mapped loading in Summarization"""
+    click.echo("%d words exported" % export_embeddings(language))
+
+
+@app.cli.command("index-datasets")
+def index_datasets_command():
+    """Hash datasets stored before content hashes, run before index-results"""
+    click.echo("%d datasets hashed" % index_datasets(app))
+
+
+@app.cli.command("index-results")
+def index_results_command():
+    """Fingerprint finished tasks stored before fingerprints, so their results are reused"""
+    click.echo("%d tasks fingerprinted" % index_results(app))
+
+
+@app.cli.command("build-df")
+@click.argument("fields", nargs=-1)
+def build_df_command(fields):
+    """Build language-specific document frequencies (all Config.DF_FIELDS by default)"""
+    document_frequencies = get_document_frequencies()
+    for field in fields or Config.DF_FIELDS:
+        click.echo("%s: %d words" % (field, document_frequencies.build(field)))
+
+
 def main():
     app.run(host="0.0.0.0")
 
@@ -0,0 +1,36 @@
+"""task fingerprints for reusing results
+
+Revision ID: 3b7e9d2a4c15
+Revises: 8c2d4e6f1a37
+Create Date: 2026-10-19 14:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e9d2a4c15'
+down_revision = '8c2d4e6f1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('task', sa.Column('fingerprint', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_task_fingerprint'), 'task', ['fingerprint'], unique=False)
+    op.create_table('result_fingerprint',
+    sa.Column('fingerprint', sa.String(length=64), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('result_id', sa.Integer(), nullable=False),
+    sa.Column('last_updated', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['result_id'], ['result.id'], ),
+    sa.ForeignKeyConstraint(['task_id'], ['task.id'], ),
+    sa.PrimaryKeyConstraint('fingerprint')
+    )
+
+
+def downgrade():
+    op.drop_table('result_fingerprint')
+    op.drop_index(op.f('ix_task_fingerprint'), table_name='task')
+    op.drop_column('task', 'fingerprint')
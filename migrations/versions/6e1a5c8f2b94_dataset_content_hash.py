@@ -0,0 +1,26 @@
+"""content hashes of datasets
+
+Revision ID: 6e1a5c8f2b94
+Revises: 3b7e9d2a4c15
+Create Date: 2026-10-19 14:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1a5c8f2b94'
+down_revision = '3b7e9d2a4c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('dataset', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_dataset_content_hash'), 'dataset', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_dataset_content_hash'), table_name='dataset')
+    op.drop_column('dataset', 'content_hash')
@@ -0,0 +1,36 @@
+"""task timings for the investigator cost model
+
+Revision ID: 8c2d4e6f1a37
+Revises: 5a1f0c3e9b21
+Create Date: 2026-10-19 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2d4e6f1a37'
+down_revision = '5a1f0c3e9b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('task_timing',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('processor_name', sa.String(length=255), nullable=False),
+    sa.Column('collection_size', sa.Integer(), nullable=True),
+    sa.Column('language', sa.String(length=255), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=False),
+    sa.Column('recorded', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['task_id'], ['task.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_task_timing_processor_name'), 'task_timing', ['processor_name'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_task_timing_processor_name'), table_name='task_timing')
+    op.drop_table('task_timing')
@@ -0,0 +1,15 @@
+import pytest
+from app import create_app
+from config import Config
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+
+
+@pytest.fixture
+def flask_app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        yield app
@@ -0,0 +1,243 @@
+import math
+import numpy as np
+import pytest
+from app.analysis import assessment
+from app.analysis.assessment import (
+    Distribution,
+    max_interestingness,
+    recoursive_distribution,
+)
+from app.analysis.data_transformation import Comparison
+
+# see batch_distributions
+TOLERANCE = 1e-12
+
+
+def baseline_distribution(data):
+    """recoursive_distribution before batch_distributions"""
+    if not data:
+        return 0.0
+    if isinstance(data, str):
+        return 0.0
+    if type(data) in [float, int]:
+        return 0 if data == 0 else 1
+    if isinstance(data, dict):
+        if all([type(i) in [float, int] for i in data.values()]):
+            return {
+                k: v
+                for (k, v) in zip(data.keys(), baseline_distribution(list(data.values())))
+            }
+        return {k: baseline_distribution(v) for k, v in data.items()}
+    if type(data) in [list, tuple, set]:
+        if all([type(i) in [float, int] for i in data]):
+            return Distribution(data).dist
+        return [baseline_distribution(i) for i in data]
+
+
+def baseline_max(data):
+    if not data:
+        return 0.0
+    if isinstance(data, str):
+        return 0.0
+    elif isinstance(data, float):
+        return data
+    elif type(data) in [list, tuple, set]:
+        return max([baseline_max(i) for i in data])
+    elif isinstance(data, dict):
+        return baseline_max([baseline_max(i) for i in data.values()])
+    else:
+        return data
+
+
+def assert_same(result, expected):
+    if isinstance(expected, dict):
+        assert isinstance(result, dict)
+        assert list(result) == list(expected)
+        for k in expected:
+            assert_same(result[k], expected[k])
+    elif isinstance(expected, list):
+        assert isinstance(result, list)
+        assert len(result) == len(expected)
+        for r, e in zip(result, expected):
+            assert_same(r, e)
+    elif isinstance(expected, np.ndarray):
+        np.testing.assert_allclose(result, expected, rtol=TOLERANCE, atol=0)
+    elif isinstance(expected, np.floating):
+        # values of numerical dicts
+        assert isinstance(result, np.floating)
+        assert result == pytest.approx(expected, rel=TOLERANCE)
+    else:
+        assert type(result) == type(expected) and result == expected
+
+
+def stored(data):
+    """interestingness as stored in the database (JSON)"""
+    if isinstance(data, dict):
+        return {k: stored(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [stored(v) for v in data]
+    if isinstance(data, (np.ndarray, np.floating)):
+        return data.tolist()
+    return data
+
+
+def random_numbers(rng, length):
+    kind = rng.randint(4)
+    if kind == 0:
+        return [int(i) for i in rng.randint(0, 1000, length)]
+    if kind == 1:
+        return [float(f) for f in rng.normal(0, 10, length)]
+    if kind == 2:
+        # mixed, with zeros
+        return [int(i) if i % 3 else float(i) / 7 for i in rng.randint(-50, 50, length)]
+    return [float(f) for f in rng.exponential(1e-3, length)]
+
+
+def random_result(rng, depth=3):
+    kind = rng.randint(6 if depth else 3)
+    if kind == 0:
+        return random_numbers(rng, rng.randint(1, 40))
+    if kind == 1:
+        numbers = random_numbers(rng, rng.randint(1, 40))
+        return {"w%d" % i: n for i, n in enumerate(numbers)}
+    if kind == 2:
+        return rng.choice([0, 1, 2.5, 0.0, "text", "", None])
+    if kind == 3:
+        return [random_result(rng, depth - 1) for _ in range(rng.randint(1, 5))]
+    return {"k%d" % i: random_result(rng, depth - 1) for i in range(rng.randint(1, 5))}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_distributions_match_baseline(seed):
+    rng = np.random.RandomState(seed)
+    result = {"a": random_result(rng), "b": [random_result(rng), random_result(rng)]}
+    expected = baseline_distribution(result)
+    interestingness = recoursive_distribution(result)
+    assert_same(interestingness, expected)
+    assert max_interestingness(stored(interestingness)) == pytest.approx(
+        baseline_max(stored(expected)), rel=TOLERANCE
+    )
+
+
+def test_vocabulary_distribution_matches_baseline():
+    rng = np.random.RandomState(0)
+    vocabulary = {
+        "word%d" % i: [int(rng.randint(1, 500)), float(rng.exponential())]
+        for i in range(10000)
+    }
+    result = {"vocabulary": vocabulary, "counts": [float(f) for f in rng.normal(size=10000)]}
+    assert_same(recoursive_distribution(result), baseline_distribution(result))
+
+
+def baseline_align_dicts(dict1, dict2, default_value=0.0):
+    for from_dict, to_dict in [(dict1, dict2), (dict2, dict1)]:
+        for k in from_dict.keys():
+            if k not in to_dict.keys():
+                to_dict[k] = default_value
+
+
+def baseline_comparable_dist(dict1, dict2):
+    return [dict1[k] for k in dict1], [dict2[k] for k in dict1]
+
+
+def baseline_frequency_ratio(dict1, dict2):
+    return {k: float(dict1[k]) / dict2[k] for k in dict1.keys()}
+
+
+def baseline_weighted_frequency_ratio(dict1, dict2, weights=None, weight_func=np.log10):
+    if not weights:
+        weights = dict2
+    fr = baseline_frequency_ratio(dict1, dict2)
+    return {k: ((fr[k] - 1) * weight_func(weights[k]) + 1) for k in dict1.keys()}
+
+
+def baseline_compare_dicts(dicts):
+    dict1, dict2 = dict(dicts[0]), dict(dicts[1])
+    baseline_align_dicts(dict1, dict2, default_value=assessment.EPSILON)
+    return {
+        "jensen_shannon_divergence": assessment.js_divergence(
+            *baseline_comparable_dist(dict1, dict2)
+        ),
+        "abs_diff": {k: abs(dict1[k] - dict2[k]) for k in dict1.keys()},
+    }
+
+
+def random_dicts(seed, n_words=200):
+    """counts of words, partly the same words"""
+    rng = np.random.RandomState(seed)
+    words = ["w%d" % i for i in range(n_words)]
+    dicts = []
+    for _ in range(2):
+        selected = rng.choice(words, rng.randint(1, n_words), replace=False)
+        numbers = random_numbers(rng, len(selected))
+        dicts.append({w: abs(n) + 1 for w, n in zip(selected, numbers)})
+    return dicts
+
+
+def assert_same_dict(result, expected):
+    assert list(result) == list(expected)
+    for k in expected:
+        assert result[k] == pytest.approx(expected[k], rel=TOLERANCE)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_aligned_vectors_match_align_dicts(seed):
+    dict1, dict2 = random_dicts(seed)
+    expected1, expected2 = dict(dict1), dict(dict2)
+    baseline_align_dicts(expected1, expected2, -1)
+    aligned = assessment.AlignedVectors([dict1, dict2], default_value=-1)
+    assert aligned.keys == list(expected1)
+    assert aligned.to_dict(aligned.vectors[0]) == expected1
+    assert aligned.to_dict(aligned.vectors[1]) == expected2
+    # the dicts are not aligned in place
+    assert (dict1, dict2) == tuple(random_dicts(seed))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_dict_metrics_match_baseline(seed):
+    dict1, dict2 = random_dicts(seed)
+    baseline_align_dicts(dict1, dict2, 1)
+
+    assert assessment.abs_diff(dict1, dict2) == {
+        k: abs(dict1[k] - dict2[k]) for k in dict1.keys()
+    }
+    assert_same_dict(
+        assessment.frequency_ratio(dict1, dict2), baseline_frequency_ratio(dict1, dict2)
+    )
+    for weight_func in [np.log10, math.log10, lambda x: x ** 0.5]:
+        assert_same_dict(
+            assessment.weighted_frequency_ratio(dict1, dict2, weight_func=weight_func),
+            baseline_weighted_frequency_ratio(dict1, dict2, weight_func=weight_func),
+        )
+    assert_same_dict(
+        assessment.weighted_frequency_ratio(dict1, dict2, weights=dict1),
+        baseline_weighted_frequency_ratio(dict1, dict2, weights=dict1),
+    )
+    p, q = baseline_comparable_dist(dict1, dict2)
+    assert assessment.dict_js_divergence(dict1, dict2) == pytest.approx(
+        assessment.js_divergence(p, q), rel=TOLERANCE
+    )
+    assert assessment.dict_kl_distance(dict1, dict2) == pytest.approx(
+        assessment.kl_distance(p, q), rel=TOLERANCE
+    )
+
+
+def test_dict_metrics_errors():
+    with pytest.raises(KeyError):
+        assessment.abs_diff({"a": 1, "b": 2}, {"a": 1})
+    with pytest.raises(ZeroDivisionError):
+        assessment.frequency_ratio({"a": 1, "b": 2}, {"a": 1, "b": 0})
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_compare_dicts_matches_baseline(flask_app, seed):
+    dicts = random_dicts(seed)
+    copies = [dict(d) for d in dicts]
+    expected = baseline_compare_dicts(dicts)
+    result = Comparison.compare_dicts(dicts)
+    assert result["jensen_shannon_divergence"] == pytest.approx(
+        expected["jensen_shannon_divergence"], rel=TOLERANCE
+    )
+    assert_same_dict(result["abs_diff"], expected["abs_diff"])
+    # inputs are left as they are
+    assert dicts == copies
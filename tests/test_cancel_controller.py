@@ -0,0 +1,34 @@
+import asyncio
+from app.main.cancel_controller import CancelController
+
+
+def test_shared_prerequisite_is_not_cancelled(flask_app):
+    controller = CancelController()
+
+    async def owner(uuid, started, release):
+        async with controller.cancellable(uuid) as handle:
+            controller.add_task("prerequisite")
+            started.set()
+            await release.wait()
+        return handle.reason
+
+    async def run():
+        started = [asyncio.Event(), asyncio.Event()]
+        release = [asyncio.Event(), asyncio.Event()]
+        owners = [
+            asyncio.ensure_future(owner(uuid, s, r))
+            for uuid, s, r in zip(["run", "task"], started, release)
+        ]
+        await asyncio.gather(*[s.wait() for s in started])
+        assert controller.is_shared("prerequisite")
+        # both wait on it: nothing is cancelled
+        assert not controller.cancel("prerequisite")
+        release[0].set()
+        assert await owners[0] is None
+        # only the task still waits on it: cancelling it cancels the task
+        assert not controller.is_shared("prerequisite")
+        assert controller.cancel("prerequisite")
+        assert await owners[1] == "cancelled by user"
+        assert not controller.is_running("prerequisite")
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+import asyncio
+import aiohttp
+import pytest
+from aiohttp import web
+from werkzeug.exceptions import BadRequest
+from app.utils import dataset_utils
+from config import Config
+from tests.test_topic_model_utils import with_standin
+
+
+@pytest.fixture
+def platform(monkeypatch):
+    monkeypatch.setattr(dataset_utils, "token_cache", {"token": None, "expires": 0})
+    monkeypatch.setattr(dataset_utils, "dataset_lists", {})
+    monkeypatch.setattr(Config, "DATASET_REQUEST_RETRIES", 3)
+
+
+def platform_app(status, payload):
+    """dataset platform answering list_datasets with status and payload"""
+    app = web.Application()
+    app.tokens = 0
+
+    async def authenticate(request):
+        app.tokens += 1
+        return web.json_response({"auth_token": "token%d" % app.tokens})
+
+    async def list_datasets(request):
+        return web.json_response(payload, status=status)
+
+    app.router.add_post("/authenticate", authenticate)
+    app.router.add_post("/list_datasets", list_datasets)
+    return app
+
+
+def list_datasets(app, monkeypatch):
+    async def run(uri):
+        monkeypatch.setattr(Config, "DATASET_URI", uri)
+        async with aiohttp.ClientSession() as session:
+            return await dataset_utils.async_list_datasets(session, "user@newseye")
+
+    return asyncio.run(with_standin(run, app=app))
+
+
+def test_datasets_are_cached(flask_app, platform, monkeypatch):
+    datasets = [["dataset", "hash"]]
+    assert list_datasets(platform_app(200, datasets), monkeypatch) == datasets
+    assert dataset_utils.dataset_lists["user@newseye"][1] == datasets
+
+
+def test_rejected_token_after_refresh(flask_app, platform, monkeypatch):
+    app = platform_app(401, {"message": "Signature expired"})
+    with pytest.raises(BadRequest):
+        list_datasets(app, monkeypatch)
+    # refreshed once
+    assert app.tokens == 2
+    assert not dataset_utils.dataset_lists
+
+
+def test_errors_are_not_cached(flask_app, platform, monkeypatch):
+    app = platform_app(400, {"message": "Unknown user"})
+    assert list_datasets(app, monkeypatch) is None
+    assert not dataset_utils.dataset_lists
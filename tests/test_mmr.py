@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+from app.analysis.summarization.mmr import maximal_marginal_relevance
+
+
+def baseline_mmr_score(sentences_emb, summary_indices, document_indices, lambd):
+    weights = 0.0
+    for d in document_indices:
+        for s in summary_indices:
+            if not np.array_equal(sentences_emb[d], sentences_emb[s]):
+                weights += cosine_similarity(
+                    sentences_emb[d].reshape(1, -1), sentences_emb[s].reshape(1, -1)
+                )[0, 0]
+    penalty = 0.0
+    for s1 in summary_indices:
+        for s2 in summary_indices:
+            if not np.array_equal(sentences_emb[s1], sentences_emb[s2]):
+                penalty += cosine_similarity(
+                    sentences_emb[s1].reshape(1, -1), sentences_emb[s2].reshape(1, -1)
+                )[0, 0]
+    return lambd * weights - (1 - lambd) * penalty
+
+
+def baseline_mmr(sentences, sentences_emb, lambd=2, r=0.6, budget=400):
+    """greedy MMR before the precomputed similarity matrix"""
+    document = list(range(len(sentences)))
+    G = []
+    U = document[:]
+    while U:
+        sentence, value, valuer = "", -1000000.0, -1000000.0
+        for l in U:
+            v = baseline_mmr_score(
+                sentences_emb, G + [l], document, lambd
+            ) - baseline_mmr_score(sentences_emb, G, document, lambd)
+            vr = v / (len(sentences[l].split()) ** r)
+            if vr > valuer:
+                value, valuer, sentence = v, vr, l
+        if (
+            sum(len(sentences[i].split()) for i in G) + len(sentences[sentence].split())
+            <= budget
+            and value > 0
+        ):
+            G = G + [sentence]
+        U.remove(sentence)
+    singleton, values = 0, -9999999999
+    for s in document:
+        if len(sentences[s].split()) <= budget:
+            v = baseline_mmr_score(sentences_emb, [s], document, lambd)
+            if v > values:
+                values, singleton = v, s
+    if baseline_mmr_score(sentences_emb, G, document, lambd) > values:
+        return [(1.0 / (pos + 1), i) for pos, i in enumerate(G)] + [
+            (1.0 / (10 * len(G)), i) for i in document if i not in G
+        ]
+    return [(1.0, singleton)] + [
+        (1.0 / (10 * len(G)), i) for i in document if i != singleton
+    ]
+
+
+def random_document(seed, n, dim=16):
+    rng = np.random.RandomState(seed)
+    sentences = [" ".join(["w"] * rng.randint(3, 40)) for _ in range(n)]
+    embeddings = [rng.rand(dim) - 0.3 for _ in range(n)]
+    if n > 2:
+        embeddings[2] = embeddings[0].copy()
+    return sentences, embeddings
+
+
+@pytest.mark.parametrize(
+    "seed, n, lambd, budget",
+    [(0, 1, 2, 400), (1, 6, 2, 400), (2, 12, 2, 100), (3, 12, 0.5, 60), (4, 10, 3, 5)],
+)
+def test_mmr_matches_baseline(flask_app, seed, n, lambd, budget):
+    sentences, embeddings = random_document(seed, n)
+    expected = baseline_mmr(sentences, embeddings, lambd=lambd, budget=budget)
+    result = maximal_marginal_relevance(
+        sentences, embeddings, lambd=lambd, budget=budget
+    )
+    assert [i for s, i in result] == [i for s, i in expected]
+    assert np.allclose([s for s, i in result], [s for s, i in expected])
+
+
+def test_sentences_without_embedding(flask_app):
+    sentences, embeddings = random_document(5, 8)
+    embeddings[4] = None
+    result = maximal_marginal_relevance(sentences, embeddings)
+    assert sorted(i for s, i in result) == list(range(8))
@@ -0,0 +1,17 @@
+import spacy
+from app.analysis.summarization import data_util, model_registry
+from app.analysis.summarization.model_registry import ModelRegistry
+
+
+def test_sentencizer_is_added_when_loaded(flask_app, monkeypatch):
+    monkeypatch.setattr(model_registry.spacy, "load", lambda name: spacy.blank("xx"))
+    registry = ModelRegistry(10 ** 9)
+    nlp = registry.spacy("xx_ent_wiki_sm")
+    assert nlp.pipe_names == ["sentencizer"]
+    sentences = data_util.process_document(
+        ["Eka lause. Toinen lause."], nlp, "xx_ent_wiki_sm"
+    )
+    assert sentences == [["Eka lause.", "Toinen lause."]]
+    # the shared pipeline is not changed by the processing
+    assert registry.spacy("xx_ent_wiki_sm") is nlp
+    assert nlp.pipe_names == ["sentencizer"]
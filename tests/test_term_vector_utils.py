@@ -0,0 +1,201 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from app.analysis.word_processors import ExtractWords, WordCounts
+from app.utils import term_vector_utils
+from app.utils.term_vector_utils import TermVectors, TermVectorStore, get_term_vectors
+from config import Config
+from tests.test_word_processors import random_documents
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(term_vector_utils, "term_vector_store", None)
+    return term_vector_utils.get_term_vector_store()
+
+
+class Search:
+    """search_database of a processor, returns documents page by page"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.calls = 0
+        self.streamed = 0
+
+    async def __call__(self, query, retrieve=None, on_page=None):
+        self.calls += 1
+        self.streamed += on_page is not None
+        await asyncio.sleep(0.01)
+        ids = list(self.documents)
+        for i in range(0, len(ids), 10):
+            on_page({d: self.documents[d] for d in ids[i : i + 10]})
+        return []
+
+
+def test_stored_term_vectors(store):
+    documents = random_documents(0)
+    store.set("key", TermVectors.from_dicts(documents))
+    term_vectors = store.get("key")
+    assert term_vectors.doc_ids == list(documents)
+    expected = WordCounts()
+    expected.add(*documents.values())
+    assert WordCounts.from_term_vectors(term_vectors).vocabulary() == expected.vocabulary()
+
+
+def test_expired_term_vectors_are_not_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_DIR", str(tmp_path))
+    store = TermVectorStore(10 ** 9, max_age=60)
+    store.set("key", TermVectors.from_dicts(random_documents(1)))
+    assert store.get("key") is not None
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert store.get("key") is None
+
+
+def test_too_large_term_vectors_are_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_DIR", str(tmp_path))
+    store = TermVectorStore(100)
+    store.set("key", TermVectors.from_dicts(random_documents(2)))
+    assert store.get("key") is None
+
+
+def test_retrieved_once(flask_app, store):
+    search = Search(random_documents(3))
+
+    async def run():
+        return await asyncio.gather(
+            *[get_term_vectors(search, {"q": "*:*"}, "tokens") for _ in range(3)]
+        )
+
+    results = asyncio.run(run())
+    assert search.calls == 1
+    assert all(r.doc_ids == results[0].doc_ids for r in results)
+    asyncio.run(get_term_vectors(search, {"q": "*:*"}, "tokens"))
+    assert search.calls == 1
+
+
+def test_force_refresh(flask_app, store):
+    documents = random_documents(4)
+    search = Search(documents)
+    asyncio.run(get_term_vectors(search, {"q": "x"}, "stems"))
+    documents.pop(next(iter(documents)))
+
+    refreshed = asyncio.run(
+        get_term_vectors(search, {"q": "x"}, "stems", force_refresh=True)
+    )
+    assert search.calls == 2
+    assert len(refreshed) == len(documents)
+    # the refreshed term vectors replace the cached ones
+    assert len(asyncio.run(get_term_vectors(search, {"q": "x"}, "stems"))) == len(
+        documents
+    )
+    assert search.calls == 2
+
+    async def run():
+        # the forced task does not wait for the one retrieving
+        return await asyncio.gather(
+            get_term_vectors(search, {"q": "z"}, "stems"),
+            get_term_vectors(search, {"q": "z"}, "stems", force_refresh=True),
+        )
+
+    asyncio.run(run())
+    assert search.calls == 4
+
+
+def test_cancelled_waiter(flask_app, store):
+    search = Search(random_documents(5))
+
+    async def run():
+        owner = asyncio.ensure_future(get_term_vectors(search, {"q": "w"}, "tokens"))
+        waiters = [
+            asyncio.ensure_future(get_term_vectors(search, {"q": "w"}, "tokens"))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        # e.g. the deadline of its task
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(waiters[0], 0.001)
+        return await asyncio.gather(owner, waiters[1])
+
+    results = asyncio.run(run())
+    assert search.calls == 1
+    assert len(results[0]) == len(results[1]) == 40
+
+
+def test_cancelled_owner(flask_app, store):
+    search = Search(random_documents(6))
+
+    async def run():
+        owner = asyncio.ensure_future(get_term_vectors(search, {"q": "o"}, "tokens"))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.ensure_future(get_term_vectors(search, {"q": "o"}, "tokens"))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        owner.cancel()
+        # the waiters retrieve the term vectors themselves, once
+        return await asyncio.gather(owner, *waiters, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert [len(r) for r in results[1:]] == [40, 40]
+    assert search.calls == 2
+    assert not term_vector_utils.pending
+
+
+def test_retrieval_errors_are_shared(flask_app, store):
+    class FailingSearch(Search):
+        async def __call__(self, query, retrieve=None, on_page=None):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return ValueError("search failed")
+
+    search = FailingSearch({})
+
+    async def run():
+        return await asyncio.gather(
+            *[get_term_vectors(search, {"q": "e"}, "tokens") for _ in range(3)],
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert search.calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def extract_words(search):
+    processor = ExtractWords.__new__(ExtractWords)
+    processor.task = SimpleNamespace(
+        search_query={"q": "words"},
+        parameters={"unit": "tokens", "max_number": 30},
+        force_refresh=False,
+    )
+    processor.search_database = search
+    processor.input_data = asyncio.run(processor.get_input_data())
+    return processor.input_data, asyncio.run(processor.make_result())
+
+
+def test_extract_words_streams_by_default(flask_app, store):
+    search = Search(random_documents(7))
+    input_data, result = extract_words(search)
+    # counted page by page, and cached for the next processors
+    assert isinstance(input_data, WordCounts)
+    assert search.streamed == 1
+    input_data, cached_result = extract_words(search)
+    assert isinstance(input_data, TermVectors)
+    assert search.calls == 1
+    assert cached_result == result
+
+
+def test_extract_words_too_large_to_cache(flask_app, store, monkeypatch):
+    monkeypatch.setattr(Config, "TERM_VECTOR_CACHE_SIZE", 1000)
+    monkeypatch.setattr(term_vector_utils, "term_vector_store", None)
+    search = Search(random_documents(8))
+    input_data, result = extract_words(search)
+    assert isinstance(input_data, WordCounts)
+    input_data, _ = extract_words(search)
+    assert isinstance(input_data, WordCounts)
+    assert search.streamed == 2
@@ -0,0 +1,70 @@
+import numpy as np
+import networkx as nx
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+from app.analysis.summarization.textrank import textrank, similarity_matrix, pagerank
+
+
+def baseline_textrank(sentences):
+    """TextRank before vectorization: pairwise cosine_similarity and networkx.pagerank"""
+    sim_mat = np.zeros([len(sentences), len(sentences)])
+    for i in range(len(sentences)):
+        for j in range(len(sentences)):
+            if i != j:
+                try:
+                    sim_mat[i][j] = cosine_similarity(
+                        sentences[i].reshape(1, len(sentences[i])),
+                        sentences[j].reshape(1, len(sentences[j])),
+                    )[0, 0]
+                except AttributeError:
+                    sim_mat[i][j] = 0.0
+    scores = nx.pagerank(nx.from_numpy_array(sim_mat))
+    ranked_sentences = sorted(
+        ((scores[i], i) for i, s in enumerate(sentences)), reverse=True
+    )
+    top = max(s for (s, i) in ranked_sentences)
+    return [(s / top, i) for (s, i) in ranked_sentences]
+
+
+def random_sentences(seed, n, dim=20):
+    rng = np.random.RandomState(seed)
+    sentences = [rng.rand(dim) for _ in range(n)]
+    if n > 3:
+        # duplicate sentence, a sentence without embedding and a zero vector
+        sentences[1] = sentences[0].copy()
+        sentences[2] = None
+        sentences[3] = np.zeros(dim)
+    return sentences
+
+
+@pytest.mark.parametrize("seed, n", [(0, 1), (1, 2), (2, 5), (3, 17), (4, 60)])
+def test_textrank_matches_networkx(flask_app, seed, n):
+    sentences = random_sentences(seed, n)
+    expected = dict((i, s) for s, i in baseline_textrank(sentences))
+    result = dict((i, s) for s, i in textrank(sentences))
+    assert result.keys() == expected.keys()
+    for i in expected:
+        assert result[i] == pytest.approx(expected[i], abs=1e-7)
+
+
+def test_similarity_matrix(flask_app):
+    sentences = random_sentences(5, 8)
+    sim_mat = similarity_matrix(sentences)
+    assert np.allclose(np.diag(sim_mat), 0)
+    assert np.allclose(sim_mat[2], 0) and np.allclose(sim_mat[:, 3], 0)
+    assert sim_mat[0, 1] == pytest.approx(1.0)
+    assert sim_mat[4, 5] == pytest.approx(cosine_similarity([sentences[4]], [sentences[5]])[0, 0])
+
+
+def test_full_top_k_is_exact(flask_app):
+    sentences = random_sentences(6, 12)
+    assert np.allclose(
+        [s for s, i in textrank(sentences, top_k=11)],
+        [s for s, i in textrank(sentences)],
+    )
+
+
+def test_pagerank_raises_without_convergence():
+    weights = np.array([[0.0, 1.0], [1.0, 0.0]])
+    with pytest.raises(ValueError):
+        pagerank(weights, alpha=1.0, max_iter=1, tol=0)
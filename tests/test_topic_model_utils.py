@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+from aiohttp import web
+from werkzeug.exceptions import RequestTimeout
+from app.utils.topic_model_standin import make_app
+from app.utils.topic_model_utils import TopicModelClient, EmbeddingsClient
+from config import Config
+
+
+@pytest.fixture
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(Config, "TOPIC_MODEL_POLL_DELAY", 0.01)
+    monkeypatch.setattr(Config, "TOPIC_MODEL_MAX_POLL_DELAY", 0.05)
+    monkeypatch.setattr(Config, "TOPIC_MODEL_POLL_BATCH_WINDOW", 0.05)
+
+
+async def with_standin(coroutine_function, polls=2, app=None):
+    if app is None:
+        app = make_app(polls=polls)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await coroutine_function("http://127.0.0.1:%d" % port)
+    finally:
+        await runner.cleanup()
+
+
+def test_request_polls_until_ready(flask_app, fast_polls):
+    async def run(uri):
+        async with TopicModelClient(uri) as client:
+            return await client.request(
+                "doc-linking-by-distribution",
+                "doc-linking-results",
+                {"lang": "fi", "num_docs": 4, "topics_distrib": [0.5, 0.5]},
+            )
+
+    result = asyncio.run(with_standin(run))
+    assert result["similar_docs"] == ["standin_fi_%d" % i for i in range(4)]
+    assert result["distance"] == sorted(result["distance"])
+
+
+def test_concurrent_requests_are_polled_together(flask_app, fast_polls, monkeypatch):
+    batches = []
+    poll_many = TopicModelClient.poll_many
+
+    async def counting_poll_many(self, endpoint, task_uuids, *args):
+        batches.append(len(task_uuids))
+        return await poll_many(self, endpoint, task_uuids, *args)
+
+    monkeypatch.setattr(TopicModelClient, "poll_many", counting_poll_many)
+
+    async def run(uri):
+        async def request(num_docs):
+            async with TopicModelClient.shared() as client:
+                client.uri = uri
+                return await client.request(
+                    "doc-linking-by-distribution",
+                    "doc-linking-results",
+                    {"lang": "de", "num_docs": num_docs, "topics_distrib": [1.0]},
+                )
+
+        return await asyncio.gather(*[request(n) for n in range(1, 6)])
+
+    results = asyncio.run(with_standin(run))
+    assert [len(r["similar_docs"]) for r in results] == [1, 2, 3, 4, 5]
+    assert batches == [5]
+    assert not TopicModelClient.shared_clients
+
+
+def test_shared_client_is_reused_within_the_loop(flask_app):
+    async def run():
+        async with TopicModelClient.shared() as first:
+            async with TopicModelClient.shared() as second:
+                assert first is second
+            assert not first.session.closed
+        assert first.session is None
+
+    asyncio.run(run())
+
+
+def test_poll_gives_up_after_max_wait(flask_app, fast_polls):
+    async def run(uri):
+        async with TopicModelClient(uri) as client:
+            task_uuid = await client.submit(
+                "doc-linking-by-distribution", {"lang": "fr", "topics_distrib": [1.0]}
+            )
+            await client.poll("doc-linking-results", task_uuid, max_wait=0.1)
+
+    with pytest.raises(RequestTimeout):
+        asyncio.run(with_standin(run, polls=1000))
+
+
+def test_unknown_task_fails(flask_app, fast_polls):
+    async def run(uri):
+        async with TopicModelClient(uri) as client:
+            return await client.poll_many("doc-linking-results", ["nope"])
+
+    results = asyncio.run(with_standin(run))
+    assert isinstance(results["nope"], ValueError)
+
+
+@pytest.fixture
+def embeddings_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(EmbeddingsClient, "cache", None)
+
+
+def embeddings_app(answers):
+    """answers: word -> similar words, words missing from answers are left out of the response"""
+    app = web.Application()
+
+    async def query(request):
+        payload = await request.json()
+        if "error" in payload["words"]:
+            return web.json_response({"similar_words": "model not loaded"})
+        return web.json_response(
+            {"similar_words": {w: answers[w] for w in payload["words"] if w in answers}}
+        )
+
+    app.router.add_post("/word-embeddings/query", query)
+    return app
+
+
+def test_missing_words_are_not_cached(flask_app, embeddings_cache, monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDINGS_BATCH_SIZE", 10)
+    answers = {"sauna": ["löyly", "vihta"]}
+
+    async def run(uri):
+        queries = [
+            {"lang": "fi", "word": w, "num_words": 2} for w in ["sauna", "missing"]
+        ]
+        async with EmbeddingsClient(uri) as client:
+            return await client.similar_words(queries)
+
+    assert asyncio.run(with_standin(run, app=embeddings_app(answers))) == [
+        ["löyly", "vihta"],
+        [],
+    ]
+    assert EmbeddingsClient.cache.get(("fi", "missing", 2)) is None
+
+    answers["missing"] = ["found"]
+    assert asyncio.run(with_standin(run, app=embeddings_app(answers))) == [
+        ["löyly", "vihta"],
+        ["found"],
+    ]
+
+
+def test_error_payload_fails_only_the_batch(flask_app, embeddings_cache, monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDINGS_BATCH_SIZE", 1)
+
+    async def run(uri):
+        queries = [
+            {"lang": "de", "word": w, "num_words": 1} for w in ["error", "haus"]
+        ]
+        async with EmbeddingsClient(uri) as client:
+            return await client.query_batches(
+                [(q["lang"], q["word"], q["num_words"]) for q in queries]
+            )
+
+    result = asyncio.run(with_standin(run, app=embeddings_app({"haus": ["heim"]})))
+    assert result == {("de", "haus", 1): ["heim"]}
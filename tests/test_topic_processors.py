@@ -0,0 +1,79 @@
+import itertools
+import numpy as np
+import pytest
+from scipy.stats import entropy
+from app.analysis.topic_processors import (
+    DocumentTopics,
+    mean_pairwise_jsd,
+)
+from config import Config
+
+
+def baseline_jsd(list1, list2):
+    """TopicModelDocsetComparison.compute_jsd"""
+    p = np.array(list1)
+    q = np.array(list2)
+    m = (p + q) / 2
+    return (entropy(p, m) + entropy(q, m)) / 2
+
+
+def baseline_internal_jsd(vecs):
+    """TopicModelDocsetComparison.compute_internal_jsd before DocumentTopics"""
+    vecs = np.array(vecs)
+    divs = [
+        baseline_jsd(vecs[topic_pair[0]], vecs[topic_pair[1]])
+        for topic_pair in itertools.combinations(range(vecs.shape[0]), 2)
+    ]
+    return np.mean(divs)
+
+
+def baseline_cross_jsd(vecs1, vecs2):
+    divs = [baseline_jsd(v1, v2) for v1 in vecs1 for v2 in vecs2]
+    return np.mean(divs)
+
+
+def random_doc_weights(seed, n_docs, n_topics=20):
+    rng = np.random.RandomState(seed)
+    weights = rng.dirichlet(np.full(n_topics, 0.3), n_docs)
+    # sparse topics, as returned by the topic model
+    weights[rng.rand(n_docs, n_topics) < 0.3] = 0.0
+    weights[:, 0] += 1e-3
+    return weights.tolist()
+
+
+@pytest.mark.parametrize("block_bytes", [1, 3000, 64 * 1024 * 1024])
+@pytest.mark.parametrize("sizes", [(1, 1), (2, 3), (37, 23)])
+def test_mean_pairwise_jsd_matches_baseline(monkeypatch, block_bytes, sizes):
+    monkeypatch.setattr(Config, "TOPIC_JSD_BLOCK_BYTES", block_bytes)
+    vecs1 = random_doc_weights(1, sizes[0])
+    vecs2 = random_doc_weights(2, sizes[1])
+    docs1, docs2 = DocumentTopics(vecs1), DocumentTopics(vecs2)
+
+    cross, error = mean_pairwise_jsd(docs1, docs2)
+    assert error == 0.0
+    assert cross == pytest.approx(baseline_cross_jsd(vecs1, vecs2), rel=1e-12)
+    for docs, vecs in [(docs1, vecs1), (docs2, vecs2)]:
+        internal, error = mean_pairwise_jsd(docs)
+        assert error == 0.0
+        if len(vecs) < 2:
+            assert np.isnan(internal)
+        else:
+            assert internal == pytest.approx(baseline_internal_jsd(vecs), rel=1e-12)
+
+
+def test_sampled_mean_pairwise_jsd(monkeypatch):
+    monkeypatch.setattr(Config, "TOPIC_JSD_MAX_PAIRS", 100)
+    monkeypatch.setattr(Config, "TOPIC_JSD_SAMPLE_ERROR", 0.01)
+    vecs1 = random_doc_weights(3, 300)
+    vecs2 = random_doc_weights(4, 200)
+    docs1, docs2 = DocumentTopics(vecs1), DocumentTopics(vecs2)
+
+    for result, expected in [
+        (mean_pairwise_jsd(docs1), baseline_internal_jsd(vecs1)),
+        (mean_pairwise_jsd(docs1, docs2), baseline_cross_jsd(vecs1, vecs2)),
+    ]:
+        estimate, error = result
+        assert 0.0 < error <= Config.TOPIC_JSD_SAMPLE_ERROR
+        assert abs(estimate - expected) <= error
+    # fixed seed
+    assert mean_pairwise_jsd(docs1, docs2) == mean_pairwise_jsd(docs1, docs2)
@@ -0,0 +1,260 @@
+import asyncio
+from collections import defaultdict
+from math import log
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from app.analysis import word_processors
+from app.analysis.word_processors import WordCounts, ExtractBigrams
+from app.utils import df_utils
+from app.utils.term_vector_utils import TermVectors, TermVectorStore
+from config import Config
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(df_utils, "document_frequencies", None)
+
+
+def random_documents(seed, n_docs=40, n_words=300, length=60):
+    """SOLR-like term vectors: docid -> word -> tf, df and positions"""
+    rng = np.random.RandomState(seed)
+    vocabulary = ["w%d" % i for i in range(n_words)]
+    df = {word: int(rng.randint(2, 1000)) for word in vocabulary}
+    documents = {}
+    for d in range(n_docs):
+        tokens = rng.zipf(1.3, size=length) % n_words
+        word_dict = {}
+        for position, token in enumerate(tokens):
+            word = vocabulary[token]
+            info = word_dict.setdefault(word, {"tf": 0, "df": df[word], "positions": []})
+            info["tf"] += 1
+            info["positions"].append(position)
+        documents["doc%d" % d] = word_dict
+    return documents
+
+
+def baseline_vocabulary(documents, max_number):
+    """ExtractWords.make_result before WordCounts"""
+    df = {}
+    tf = defaultdict(int)
+    total = 0.0
+    for word_dict in documents.values():
+        for word, info in word_dict.items():
+            df[word] = info["df"]
+            tf[word] += info["tf"]
+            total += info["tf"]
+    result = {
+        word: (tf[word], tf[word] / total, tf[word] / log(df[word])) for word in tf
+    }
+    count = 0
+    vocabulary = {}
+    for k in sorted(result, key=lambda x: (result[x][2], result[x][0], x), reverse=True):
+        vocabulary[k] = result[k]
+        count += 1
+        if max_number and count == max_number:
+            break
+    return int(total), vocabulary
+
+
+@pytest.mark.parametrize("max_number", [None, 0, 1, 30, 10000])
+def test_word_counts_match_baseline(cache_dir, max_number):
+    documents = random_documents(0)
+    counts = WordCounts()
+    counts.add(*documents.values())
+    total, vocabulary = baseline_vocabulary(documents, max_number)
+    assert int(counts.total) == total
+    result = counts.vocabulary(max_number)
+    # same words, order and values
+    assert list(result.items()) == list(vocabulary.items())
+    tfidf = asyncio.run(counts.tfidf())
+    assert list(counts.vocabulary(max_number, tfidf).items()) == list(vocabulary.items())
+
+
+def test_language_specific_df(cache_dir):
+    store = df_utils.get_document_frequencies()
+    with store.connect() as connection:
+        connection.executemany(
+            "INSERT INTO df (field, word, df) VALUES (?, ?, ?)",
+            [("text_fi", "kissa", 20), ("text_fi", "rare", 1)],
+        )
+        connection.execute(
+            "INSERT INTO fields (field, words, updated) VALUES ('text_fi', 2, 0)"
+        )
+    counts = WordCounts()
+    counts.add_page(
+        {
+            "fi": {"kissa": {"tf": 3, "df": 400}, "rare": {"tf": 2, "df": 50}},
+            "fr": {"kissa": {"tf": 1, "df": 400}},
+        },
+        fields={"fi": "text_fi", "fr": "text_fr"},
+    )
+    vocabulary = counts.vocabulary(None, asyncio.run(counts.tfidf()))
+    assert vocabulary["kissa"][2] == pytest.approx(3 / log(20) + 1 / log(400))
+    # df below 2 in the table: df from SOLR
+    assert vocabulary["rare"][2] == pytest.approx(2 / log(50))
+
+
+def test_pages_with_repeated_documents(cache_dir):
+    documents = random_documents(1)
+    ids = list(documents)
+    counts = WordCounts()
+    for start in range(0, len(ids), 7):
+        # pages overlap by one document
+        page_ids = ids[max(0, start - 1) : start + 7]
+        counts.add_page({i: documents[i] for i in page_ids})
+    assert len(counts) == len(documents)
+    assert list(counts.vocabulary(50).items()) == list(
+        baseline_vocabulary(documents, 50)[1].items()
+    )
+
+
+def test_ties_are_ordered_by_word(cache_dir):
+    documents = {
+        "a": {w: {"tf": 2, "df": 10, "positions": [0, 1]} for w in ["x", "y", "z"]},
+    }
+    counts = WordCounts()
+    counts.add(*documents.values())
+    assert list(counts.vocabulary(2)) == ["z", "y"]
+
+
+def test_same_errors_as_math_log(cache_dir):
+    counts = WordCounts()
+    counts.add({"rare": {"tf": 1, "df": 1}})
+    with pytest.raises(ZeroDivisionError):
+        counts.vocabulary()
+    counts = WordCounts()
+    counts.add({"none": {"tf": 1, "df": 0}})
+    with pytest.raises(ValueError):
+        counts.vocabulary()
+
+
+def baseline_bigrams(documents, max_number):
+    """ExtractBigrams.make_result before numpy arrays"""
+    word_count = defaultdict(int)
+    bigram_count = defaultdict(int)
+    df = {}
+    total = 0.0
+    for doc_dict in documents.values():
+        position_to_word = {}
+        for word, info in doc_dict.items():
+            for pos in info["positions"]:
+                position_to_word[pos] = word
+            df[word] = info["df"]
+        word_list = [position_to_word[p] for p in sorted(position_to_word)]
+        for i in range(len(word_list) - 1):
+            bigram_count[(word_list[i], word_list[i + 1])] += 1
+        for word in word_list:
+            word_count[word] += 1
+            total += 1
+    dice_score = {
+        b: 2.0 * bigram_count[b] / (word_count[b[0]] + word_count[b[1]])
+        for b in bigram_count
+    }
+    tfidf = {w: word_count[w] / log(df[w]) for w in word_count}
+    res = {}
+    for b in sorted(
+        dice_score,
+        key=lambda b: (bigram_count[b], dice_score[b], tfidf[b[0]] + tfidf[b[1]]),
+        reverse=True,
+    ):
+        res[" ".join(b)] = (
+            bigram_count[b],
+            bigram_count[b] / total,
+            dice_score[b],
+            tfidf[b[0]] + tfidf[b[1]],
+        )
+        if len(res) == max_number:
+            break
+    return res
+
+
+def extract_bigrams(input_data, max_number):
+    processor = ExtractBigrams.__new__(ExtractBigrams)
+    processor.task = SimpleNamespace(parameters={"max_number": max_number})
+    processor.input_data = input_data
+    return asyncio.run(processor.make_result())
+
+
+def assert_same_bigrams(result, expected):
+    # bigrams with equal sort keys may come in another order
+    assert list(result.values()) == list(expected.values())
+    assert {k: v for k, v in result.items() if k in expected} == {
+        k: v for k, v in expected.items() if k in result
+    }
+
+
+@pytest.mark.parametrize("max_number", [None, 1, 30, 100000])
+def test_bigrams_match_baseline(flask_app, cache_dir, max_number):
+    documents = random_documents(2)
+    # a word repeated on a position of another one
+    first = next(iter(documents.values()))
+    first["w0"] = {"tf": 1, "df": 50, "positions": [3]}
+    expected = baseline_bigrams(documents, max_number)
+    assert_same_bigrams(extract_bigrams(documents, max_number), expected)
+    assert_same_bigrams(
+        extract_bigrams(TermVectors.from_dicts(documents), max_number), expected
+    )
+
+
+def test_bigram_pruning(flask_app, cache_dir, monkeypatch):
+    monkeypatch.setattr(Config, "BIGRAM_PRUNE_SAMPLE", 200)
+    documents = random_documents(3, n_docs=80)
+    assert_same_bigrams(
+        extract_bigrams(documents, 20), baseline_bigrams(documents, 20)
+    )
+
+
+def test_bigram_workers_read_the_store(flask_app, cache_dir, monkeypatch):
+    monkeypatch.setattr(Config, "BIGRAM_PROCESSES", 2)
+    monkeypatch.setattr(Config, "BIGRAM_PROCESS_MIN_DOCUMENTS", 10)
+    documents = random_documents(4, n_docs=30)
+    store = TermVectorStore(10 ** 9)
+    store.set("key", TermVectors.from_dicts(documents))
+    term_vectors = store.get("key")
+    assert term_vectors.path
+
+    calls = []
+    count = word_processors.count_bigrams
+    monkeypatch.setattr(
+        word_processors,
+        "count_bigrams",
+        lambda *args: calls.append(args) or count(*args),
+    )
+    try:
+        result = extract_bigrams(term_vectors, None)
+    finally:
+        word_processors.bigram_workers.shutdown()
+        monkeypatch.setattr(word_processors, "bigram_workers", None)
+    # counted in the worker processes, not here
+    assert not calls
+    assert_same_bigrams(result, baseline_bigrams(documents, None))
+
+
+def test_df_lookups_during_build(cache_dir):
+    store = df_utils.get_document_frequencies()
+    with store.connect() as connection:
+        connection.execute(
+            "INSERT INTO df (field, word, df) VALUES ('text_fi', 'kissa', 20)"
+        )
+    writer = store.connect()
+    try:
+        # as build: a long write transaction replacing the field,
+        # larger than the page cache of the connection
+        writer.execute("PRAGMA cache_size = 1")
+        writer.execute("DELETE FROM df WHERE field = 'text_fi'")
+        writer.executemany(
+            "INSERT INTO df (field, word, df) VALUES ('text_fi', ?, 30)",
+            [("kissa",)] + [("word%d" % i,) for i in range(20000)],
+        )
+        lookup = store.connect()
+        lookup.execute("PRAGMA busy_timeout = 0")
+        (df,) = lookup.execute("SELECT df FROM df WHERE word = 'kissa'").fetchone()
+        assert df == 20
+        assert list(store.lookup("text_fi", ["kissa", "koira"])) == [20, 0]
+        lookup.close()
+    finally:
+        writer.commit()
+        writer.close()
+    assert list(store.lookup("text_fi", ["kissa"])) == [30]